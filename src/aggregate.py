@@ -0,0 +1,99 @@
+"""
+Aggregates the run-results store across seeds.
+
+    python -m src.aggregate --store outputs/results --metrics f1 f1_PER f1_ORG --baseline baseline
+
+For each (model, profile): number of seeds, mean and sample std of every selected test metric,
+and the difference of the means to the baseline (clean) profile of the same model.
+Writes CSV with --out; prints a table otherwise.
+"""
+import argparse
+import os
+from typing import List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
+
+from .results_store import load_runs
+
+
+def aggregate_runs(table: pa.Table, metrics: List[str], baseline: str) -> pa.Table:
+    """
+    Mean/std/n per (model, profile) and delta of each mean vs the baseline profile.
+    Repeated runs of the same (model, profile, seed) count once, with their latest result.
+    """
+    # pick the latest row first, so a metric missing there is not filled in from an older run
+    table = table.append_column("_row", pa.array(range(len(table)), pa.int64()))
+    latest = table.sort_by("timestamp").group_by(["model", "profile", "seed"], use_threads=False)
+    table = table.take(latest.aggregate([("_row", "last")])["_row_last"]).drop_columns(["_row"])
+
+    aggs = [("seed", "count_distinct")]
+    for m in metrics:
+        aggs += [(m, "mean"), (m, "stddev", pc.VarianceOptions(ddof=1))]
+    grouped = table.group_by(["model", "profile"]).aggregate(aggs)
+    grouped = grouped.rename_columns([
+        {"seed_count_distinct": "n_seeds"}.get(c, c.replace("_stddev", "_std")) for c in grouped.column_names
+    ])
+
+    clean = grouped.filter(pc.equal(grouped["profile"], baseline))
+    clean = clean.select(["model"] + [f"{m}_mean" for m in metrics])
+    clean = clean.rename_columns(["model"] + [f"{m}_clean" for m in metrics])
+    joined = grouped.join(clean, keys="model", join_type="left outer")
+    for m in metrics:
+        delta = pc.subtract(joined[f"{m}_mean"], joined[f"{m}_clean"])
+        joined = joined.append_column(f"{m}_delta", delta).drop_columns([f"{m}_clean"])
+    return joined.sort_by([("model", "ascending"), ("profile", "ascending")])
+
+
+def print_table(table: pa.Table):
+    columns = table.column_names
+    rows = [[_fmt(v) for v in row.values()] for row in table.to_pylist()]
+    widths = [max(len(c), *(len(r[i]) for r in rows)) if rows else len(c) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def _fmt(v) -> str:
+    if v is None:
+        return "-"
+    if isinstance(v, float):
+        return f"{v:.4f}"
+    return str(v)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", default="./outputs/results", help="Directory written by src.train --results_store")
+    ap.add_argument("--metrics", nargs="+", default=["f1", "precision", "recall"],
+                    help="Test metrics without the 'test_' prefix, e.g. f1 f1_PER precision_LOC")
+    ap.add_argument("--baseline", default="baseline", help="Profile name the deltas are computed against")
+    ap.add_argument("--models", nargs="+", default=None, help="Restrict to these models")
+    ap.add_argument("--profiles", nargs="+", default=None, help="Restrict to these profiles (baseline is kept)")
+    ap.add_argument("--out", default=None, help="Write the aggregate as CSV instead of printing it")
+    args = ap.parse_args()
+
+    filter = None
+    if args.models:
+        filter = pads.field("model").isin([m.replace("/", "_") for m in args.models])
+    if args.profiles:
+        profiles = pads.field("profile").isin(list(set(args.profiles) | {args.baseline}))
+        filter = profiles if filter is None else filter & profiles
+
+    metric_columns = [f"test_{m}" for m in args.metrics]
+    table = load_runs(args.store, columns=["model", "profile", "seed", "timestamp"] + metric_columns, filter=filter)
+    print(f"[aggregate] {table.num_rows} runs from {args.store}")
+    result = aggregate_runs(table, metric_columns, args.baseline)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        pacsv.write_csv(result, args.out)
+        print(f"[aggregate] Wrote {result.num_rows} rows to {args.out}")
+    else:
+        print_table(result)
+
+
+if __name__ == "__main__":
+    main()
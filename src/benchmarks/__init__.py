@@ -0,0 +1 @@
+__all__ = ["noise_throughput", "inference_latency"]
@@ -0,0 +1,170 @@
+"""
+Inference cost of each model under each noise profile.
+
+For every (model, profile) pair the test split is noised with the profile's token noise and
+a fixed sample of sentences is run through the model on CPU. Reports the encoded sequence
+length distribution (subwords, or characters for CANINE), p50/p95 batch latency per batch
+size, throughput, and the test F1 of the matching training run if one exists in --runs_dir.
+
+Usage:
+    python -m src.benchmarks.inference_latency --runs_dir outputs --seed 42 \
+        --profiles src/profiles/baseline.yaml src/profiles/syntactic/syntactic_p0.1_test.yaml
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from datasets import DatasetDict
+from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+from ..data_preprocessing import load_conll2003, build_label_maps
+from ..predict import PREFIX_SPACE_MODELS, encode_batch, is_char_model, load_ner_model, predict_batch
+from ..train import apply_profile, load_profile, seed_all
+
+MODEL_ZOO = [
+    "bert-base-cased",
+    "roberta-base",
+    "microsoft/deberta-base",
+    "distilbert-base-uncased",
+    "google/canine-c",
+    "xlnet-base-cased",
+]
+DEFAULT_PROFILES = [
+    "src/profiles/baseline.yaml",
+    "src/profiles/orthographic/orthographic_p0.1_test_all.yaml",
+    "src/profiles/semantic/semantic_p0.1_test_all.yaml",
+    "src/profiles/syntactic/syntactic_p0.1_test.yaml",
+]
+
+
+def run_dir_for(runs_dir: str, model_name: str, profile_path: str, seed: int) -> str:
+    """Output directory src.train uses for this (model, profile, seed)."""
+    profile_name = os.path.basename(profile_path).replace(".yaml", "")
+    return os.path.join(runs_dir, f"{model_name}-{profile_name}-seed{seed}".replace("/", "_"))
+
+
+def load_for_latency(model_name: str, run_dir: str, id2label: Dict[int, str]):
+    """Trained weights from the run directory if saved, otherwise the base checkpoint (same cost)."""
+    if os.path.exists(os.path.join(run_dir, "config.json")):
+        return load_ner_model(run_dir)
+    model = AutoModelForTokenClassification.from_pretrained(
+        model_name, num_labels=len(id2label), id2label=id2label, label2id={v: k for k, v in id2label.items()}
+    ).eval()
+    if any(x in model_name.lower() for x in PREFIX_SPACE_MODELS):
+        tokenizer = AutoTokenizer.from_pretrained(model_name, add_prefix_space=True)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return model, tokenizer
+
+
+def read_f1(run_dir: str) -> Optional[float]:
+    path = os.path.join(run_dir, "test_metrics.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("eval_f1")
+
+
+def noised_test_sentences(clean_ds, profile: dict, id2label, label2id, id2pos, n: int, seed: int) -> List[List[str]]:
+    """Applies the profile's token noise to the test split (whatever its scope) and samples n sentences."""
+    profile = dict(profile, scope={"token_noise": ["test"], "label_noise": []}, label_noise=None)
+    seed_all(seed)
+    ds = apply_profile(DatasetDict(clean_ds), profile, id2label, label2id, id2pos)
+    idxs = sorted(random.Random(seed).sample(range(len(ds["test"])), min(n, len(ds["test"]))))
+    return [tokens for tokens in ds["test"].select(idxs)["tokens"] if tokens]
+
+
+def sequence_lengths(sentences: List[List[str]], model, tokenizer, max_length: int) -> np.ndarray:
+    enc, _ = encode_batch(sentences, tokenizer, max_length, is_char_model(model))
+    return enc["attention_mask"].sum(dim=1).numpy()
+
+
+def measure_latency(model, tokenizer, sentences: List[List[str]], batch_size: int, max_length: int,
+                    warmup: int = 2) -> Dict[str, float]:
+    batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+    for batch in batches[:warmup]:
+        predict_batch(model, tokenizer, batch, max_length)
+    latencies = []
+    for batch in batches:
+        start = time.perf_counter()
+        predict_batch(model, tokenizer, batch, max_length)
+        latencies.append(time.perf_counter() - start)
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p95_ms": float(np.percentile(lat_ms, 95)),
+        "sentences_per_sec": len(sentences) / float(np.sum(latencies)),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--models", nargs="+", default=MODEL_ZOO)
+    ap.add_argument("--profiles", nargs="+", default=DEFAULT_PROFILES)
+    ap.add_argument("--runs_dir", default="./outputs", help="--out root of the training runs (for weights and F1)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 8, 32])
+    ap.add_argument("--n_sentences", type=int, default=512)
+    ap.add_argument("--max_length", type=int, default=256)
+    ap.add_argument("--char_max_length", type=int, default=1024)
+    ap.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    ap.add_argument("--out", default="./outputs/benchmarks/inference_latency.json")
+    args = ap.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    clean_ds = load_conll2003()
+    id2label, label2id = build_label_maps(clean_ds["train"].features, "ner_tags")
+    id2pos, _ = build_label_maps(clean_ds["train"].features, "pos_tags")
+
+    inputs = {
+        path: noised_test_sentences(clean_ds, load_profile(path), id2label, label2id, id2pos,
+                                    args.n_sentences, args.seed)
+        for path in args.profiles
+    }
+
+    rows = []
+    for model_name in args.models:
+        for path, sentences in inputs.items():
+            run_dir = run_dir_for(args.runs_dir, model_name, path, args.seed)
+            model, tokenizer = load_for_latency(model_name, run_dir, id2label)
+            max_length = args.char_max_length if is_char_model(model) else args.max_length
+            lengths = sequence_lengths(sentences, model, tokenizer, max_length)
+            row = {
+                "model": model_name,
+                "profile": os.path.basename(path).replace(".yaml", ""),
+                "f1": read_f1(run_dir),
+                "seq_len": {
+                    "mean": float(lengths.mean()),
+                    "p50": float(np.percentile(lengths, 50)),
+                    "p95": float(np.percentile(lengths, 95)),
+                    "max": int(lengths.max()),
+                    "truncated": float(np.mean(lengths >= max_length)),
+                },
+                "latency": {
+                    str(bs): measure_latency(model, tokenizer, sentences, bs, max_length)
+                    for bs in args.batch_sizes
+                },
+            }
+            rows.append(row)
+            lat = "  ".join(f"bs{bs}: p50={v['p50_ms']:.1f}ms p95={v['p95_ms']:.1f}ms {v['sentences_per_sec']:.1f}/s"
+                            for bs, v in row["latency"].items())
+            f1 = f"{row['f1']:.4f}" if row["f1"] is not None else "  -   "
+            print(f"[latency] {model_name:<24} {row['profile']:<40} f1={f1} "
+                  f"len p50={row['seq_len']['p50']:.0f} p95={row['seq_len']['p95']:.0f}  {lat}")
+            del model
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "results": rows}, f, indent=2)
+    print(f"[latency] Wrote {len(rows)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
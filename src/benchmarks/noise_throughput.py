@@ -0,0 +1,416 @@
+"""
+Throughput benchmark for the noise engine and the tokenization/metrics stages.
+
+Measures tokens/sec for every entry in TOKEN_NOISE and LABEL_NOISE across noise rates,
+sentence lengths and entity strategies, plus tokenize_and_align, tokenize_and_align_chars
+and compute_metrics_builder. Runs fully offline: GloVe and the fill-mask model are replaced
+by small in-memory stand-ins and the subword tokenizer is built from the synthetic vocabulary.
+
+Usage:
+    python -m src.benchmarks.noise_throughput --out outputs/benchmarks/noise.json \
+        --baseline benchmarks/noise_baseline.json --fail_on_regression
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from ..data_preprocessing import tokenize_and_align, tokenize_and_align_chars
+from ..metrics import compute_metrics_builder
+from ..noise import TOKEN_NOISE, LABEL_NOISE
+from ..noise.utils import LOADED_MODELS
+from ..noise.sampling import segment_offsets, weighted_topk_segments
+from ..noise.semantic import semantic_candidates, semantic_k
+from ..train import build_mappers
+
+NER_LABELS = ["O", "B-PER", "I-PER", "B-ORG", "I-ORG", "B-LOC", "I-LOC", "B-MISC", "I-MISC"]
+POS_TAGS = ["NNP", "NN", "NNS", "VBD", "VBZ", "JJ", "RB", "IN", "DT", "CC", "PRP", "CD", ".", ","]
+
+# Small word pools covering the token shapes the noise ops branch on
+# (title case, upper case, diacritics, digits, short words, punctuation).
+ENTITY_WORDS = {
+    "PER": ["Müller", "Johnson", "Peter", "Blackburn", "Nadim", "Ladki"],
+    "ORG": ["Commission", "Reuters", "Bundesbank", "UEFA", "Barcelona", "Interfax"],
+    "LOC": ["Germany", "Brussels", "São", "Paulo", "Britain", "Zürich"],
+    "MISC": ["German", "British", "Olympic", "Euro", "Iraqi", "Rugby"],
+}
+CONTENT_WORDS = [
+    ("rejects", "VBZ"), ("call", "NN"), ("boycott", "NN"), ("lamb", "NN"), ("said", "VBD"),
+    ("market", "NN"), ("shares", "NNS"), ("strong", "JJ"), ("quickly", "RB"), ("results", "NNS"),
+    ("government", "NN"), ("announced", "VBD"), ("early", "JJ"), ("percent", "NN"), ("1996-08-22", "CD"),
+    ("million", "CD"), ("nearly", "RB"), ("agreed", "VBD"), ("report", "NN"), ("fiancée", "NN"),
+]
+FUNCTION_WORDS = [("the", "DT"), ("of", "IN"), ("and", "CC"), ("in", "IN"), ("he", "PRP"), ("a", "DT"), ("with", "IN")]
+PUNCT_WORDS = [(",", ","), (".", ".")]
+
+SEMANTIC_OPS = ["synonym", "word_embs", "antonym", "contextual"]
+STEP_NOISE = {"typo_tokens", "semantic_noise", "punct_insert", "punct_delete", "whitespace_merge", "syntactic_noise"}
+WORD_NOISE = {"random_case_flip": "prob", "strip_diacritics": None}
+ENTITY_STRATEGY_NOISE = {"typo_tokens", "semantic_noise"}
+
+
+def all_words() -> List[str]:
+    words = [w for pool in ENTITY_WORDS.values() for w in pool]
+    words += [w for w, _ in CONTENT_WORDS + FUNCTION_WORDS + PUNCT_WORDS]
+    return words
+
+
+class StaticEmbeddingStandIn:
+    """Mimics gensim KeyedVectors.most_similar on a fixed vocabulary (no download)."""
+
+    def __init__(self, words: List[str], seed: int = 0):
+        rng = random.Random(seed)
+        vocab = sorted({w.lower() for w in words})
+        self._neighbours = {}
+        for w in vocab:
+            others = [o for o in vocab if o != w]
+            rng.shuffle(others)
+            self._neighbours[w] = [(o, 1.0 - r / 100.0) for r, o in enumerate(others * 2)][:30]
+
+    def most_similar(self, word: str, topn: int = 10):
+        if word not in self._neighbours:
+            raise KeyError(word)
+        return self._neighbours[word][:topn]
+
+
+class FillMaskStandIn:
+    """Mimics a transformers fill-mask pipeline with top_k=30 (constant predictions)."""
+
+    def __init__(self, words: List[str]):
+        self.tokenizer = SimpleNamespace(mask_token="[MASK]")
+        pool = sorted({w.lower() for w in words})
+        self._predictions = [{"token_str": w, "score": 1.0 / (r + 1)} for r, w in enumerate((pool * 2)[:30])]
+
+    def __call__(self, inputs, batch_size: int = 16):
+        texts = inputs["text"] if not isinstance(inputs, str) else [inputs]
+        return [list(self._predictions) for _ in texts]
+
+
+def install_stand_ins(words: List[str],
+                      static_key: str = "glove-wiki-gigaword-100",
+                      contextual_key: str = "albert-base-v2"):
+    """Pre-populate the model cache so semantic noise never downloads anything."""
+    LOADED_MODELS[static_key] = StaticEmbeddingStandIn(words)
+    LOADED_MODELS[contextual_key] = FillMaskStandIn(words)
+
+
+def make_corpus(n_sentences: int, length: int, seed: int, label2id: Dict[str, int],
+                pos2id: Dict[str, int]) -> List[Dict[str, List]]:
+    """Generate CoNLL-like sentences of exactly `length` words (~15% entity tokens)."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n_sentences):
+        tokens, ner_tags, pos_tags = [], [], []
+        while len(tokens) < length:
+            r = rng.random()
+            if r < 0.10:
+                etype = rng.choice(list(ENTITY_WORDS))
+                span = rng.randint(1, 3)
+                for j in range(span):
+                    tokens.append(rng.choice(ENTITY_WORDS[etype]))
+                    ner_tags.append(label2id[("B-" if j == 0 else "I-") + etype])
+                    pos_tags.append(pos2id["NNP"])
+            else:
+                pool = CONTENT_WORDS if r < 0.60 else FUNCTION_WORDS if r < 0.88 else PUNCT_WORDS
+                word, pos = rng.choice(pool)
+                tokens.append(word)
+                ner_tags.append(label2id["O"])
+                pos_tags.append(pos2id[pos])
+        corpus.append({"tokens": tokens[:length], "ner_tags": ner_tags[:length], "pos_tags": pos_tags[:length]})
+    return corpus
+
+
+def build_offline_tokenizer(words: List[str]):
+    """WordPiece tokenizer over the synthetic vocabulary + single characters."""
+    from transformers import BertTokenizerFast
+
+    chars = sorted({c for w in words for c in w} | set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"))
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(words)) + chars + [f"##{c}" for c in chars]
+    with tempfile.TemporaryDirectory() as tmp:
+        vocab_file = os.path.join(tmp, "vocab.txt")
+        with open(vocab_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(dict.fromkeys(vocab)))
+        return BertTokenizerFast(vocab_file=vocab_file, do_lower_case=False)
+
+
+def build_offline_char_tokenizer():
+    from transformers import CanineTokenizer
+    return CanineTokenizer(model_max_length=2048)
+
+
+def time_calls(fn: Callable[[], None], repeat: int, seed: int) -> float:
+    """Best-of-`repeat` wall time for fn(), reseeding before every run."""
+    best = float("inf")
+    for _ in range(repeat):
+        random.seed(seed)
+        np.random.seed(seed)
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def record(results: Dict[str, Dict], key: str, seconds: float, n_tokens: int):
+    results[key] = {
+        "tokens_per_sec": n_tokens / seconds if seconds > 0 else float("inf"),
+        "seconds": seconds,
+        "tokens": n_tokens,
+    }
+    print(f"[benchmark] {key:<60} {results[key]['tokens_per_sec']:>14,.0f} tok/s")
+
+
+def noise_cases(rates: List[float], strategies: List[str]):
+    """Yields (key, registry, name, params) for every benchmarked noise configuration."""
+    for name in TOKEN_NOISE:
+        if name not in STEP_NOISE and name not in WORD_NOISE:
+            print(f"[benchmark] Skipping {name}: no benchmark adapter")
+            continue
+        if name == "strip_diacritics":
+            yield f"{name}", "token", name, {}
+            continue
+        for rate in rates:
+            if name in WORD_NOISE:
+                yield f"{name}/p={rate}", "token", name, {WORD_NOISE[name]: rate}
+            elif name == "semantic_noise":
+                for strategy in strategies:
+                    for op in SEMANTIC_OPS:
+                        params = {"p": rate, "entity_strategy": strategy, "ops": [op]}
+                        yield f"{name}[{op}]/p={rate}/{strategy}", "token", name, params
+            elif name in ENTITY_STRATEGY_NOISE:
+                for strategy in strategies:
+                    yield f"{name}/p={rate}/{strategy}", "token", name, {"p": rate, "entity_strategy": strategy}
+            else:
+                yield f"{name}/p={rate}", "token", name, {"p": rate}
+    for name in LABEL_NOISE:
+        for rate in rates:
+            yield f"{name}/p={rate}", "label", name, {"p": rate}
+
+
+def bench_noise(args, corpora, id2label, label2id, id2pos) -> Dict[str, Dict]:
+    results = {}
+    for base_key, kind, name, params in noise_cases(args.rates, args.strategies):
+        for length, corpus in corpora.items():
+            key = f"{base_key}/len={length}"
+            if args.only and args.only not in key:
+                continue
+            n_tokens = sum(len(ex["tokens"]) for ex in corpus)
+
+            if kind == "label":
+                profile = {"label_noise": [{"name": name, "params": params}]}
+                _, mapper = build_mappers(profile, id2label, label2id, id2pos)
+            elif name in WORD_NOISE:
+                fn = TOKEN_NOISE[name]
+                mapper = lambda ex, fn=fn: [fn(tok, **params) for tok in ex["tokens"]]
+            else:
+                profile = {"token_noise": [{"name": name, "params": params}]}
+                mapper, _ = build_mappers(profile, id2label, label2id, id2pos)
+
+            def run(mapper=mapper, corpus=corpus):
+                for ex in corpus:
+                    mapper(ex)
+
+            try:
+                seconds = time_calls(run, args.repeat, args.seed)
+            except LookupError as e:  # e.g. WordNet corpus not available offline
+                print(f"[benchmark] Skipping {key}: {type(e).__name__}")
+                continue
+            record(results, key, seconds, n_tokens)
+    return results
+
+
+def bench_tokenization(args, corpora, id2label, label2id) -> Dict[str, Dict]:
+    from transformers import AutoTokenizer
+
+    words = all_words()
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer) if args.tokenizer else build_offline_tokenizer(words)
+    char_tokenizer = AutoTokenizer.from_pretrained(args.char_tokenizer) if args.char_tokenizer else build_offline_char_tokenizer()
+    results = {}
+
+    for length, corpus in corpora.items():
+        batches = [
+            {"tokens": [ex["tokens"] for ex in corpus[i:i + 1000]],
+             "ner_tags": [ex["ner_tags"] for ex in corpus[i:i + 1000]]}
+            for i in range(0, len(corpus), 1000)
+        ]
+        n_tokens = sum(len(ex["tokens"]) for ex in corpus)
+
+        for dense in (False, True):
+            key = f"tokenize_and_align/len={length}/dense={dense}"
+            if not args.only or args.only in key:
+                seconds = time_calls(
+                    lambda: [tokenize_and_align(b, tokenizer, label_all_tokens=dense, max_length=args.max_length)
+                             for b in batches],
+                    args.repeat, args.seed)
+                record(results, key, seconds, n_tokens)
+
+        for eval_mode in (False, True):
+            key = f"tokenize_and_align_chars/len={length}/eval_mode={eval_mode}"
+            if not args.only or args.only in key:
+                seconds = time_calls(
+                    lambda: [tokenize_and_align_chars(b, char_tokenizer, id2label, label2id,
+                                                      max_length=args.char_max_length, eval_mode=eval_mode)
+                             for b in batches],
+                    args.repeat, args.seed)
+                record(results, key, seconds, n_tokens)
+
+        key = f"compute_metrics_builder/len={length}"
+        if not args.only or args.only in key:
+            labels = np.concatenate([
+                np.array(tokenize_and_align(b, tokenizer, max_length=args.max_length)["labels"]) for b in batches
+            ])
+            logits = np.random.default_rng(args.seed).standard_normal(
+                (labels.shape[0], labels.shape[1], len(id2label))).astype(np.float32)
+            compute_metrics = compute_metrics_builder(id2label)
+            n_scored = int((labels != -100).sum())
+            seconds = time_calls(lambda: compute_metrics((logits, labels)), args.repeat, args.seed)
+            record(results, key, seconds, n_scored)
+    return results
+
+
+def sampling_check(weights: np.ndarray, k: int, trials: int, seed: int) -> Dict[str, float]:
+    """
+    Inclusion frequencies of each item under np.random.choice(replace=False, p) vs batched
+    exponential-key top-k (all trials as segments of one call); max absolute difference.
+    """
+    np.random.seed(seed)
+    probs = weights / weights.sum()
+    ref = np.zeros(len(weights))
+    for _ in range(trials):
+        ref[np.random.choice(len(weights), size=k, replace=False, p=probs)] += 1
+    offsets = segment_offsets([len(weights)] * trials)
+    picked = weighted_topk_segments(np.tile(weights, trials), offsets, np.full(trials, k))
+    new = np.bincount(picked % len(weights), minlength=len(weights)).astype(float)
+    diff = float(np.abs(ref - new).max() / trials)
+    print(f"[benchmark] sampling check (n={len(weights)}, k={k}, trials={trials}): "
+          f"max inclusion-probability difference {diff:.4f}")
+    return {"n": len(weights), "k": k, "trials": trials, "max_abs_diff": diff}
+
+
+def bench_sampling(args, corpora, id2label, id2pos) -> Dict[str, Dict]:
+    """Position sampling of semantic_noise: per-sentence np.random.choice vs one batched top-k call."""
+    results = {}
+    for length, corpus in corpora.items():
+        cands = [semantic_candidates(ex["tokens"], [id2pos[t] for t in ex["pos_tags"]], ex["ner_tags"], id2label, "all")
+                 for ex in corpus]
+        cands = [(c, w) for c, w in cands if len(c)]
+        k = [semantic_k(length, len(c), args.rates[-1]) for c, _ in cands]
+        n_tokens = sum(len(c) for c, _ in cands)
+
+        key = f"sampling/np_random_choice/len={length}"
+        if not args.only or args.only in key:
+            seconds = time_calls(lambda: [np.random.choice(c, size=kk, replace=False, p=w / w.sum())
+                                          for (c, w), kk in zip(cands, k)], args.repeat, args.seed)
+            record(results, key, seconds, n_tokens)
+
+        key = f"sampling/weighted_topk_segments/len={length}"
+        if not args.only or args.only in key:
+            def run():
+                flat_w = np.concatenate([w for _, w in cands])
+                weighted_topk_segments(flat_w, segment_offsets([len(c) for c, _ in cands]), np.array(k))
+            seconds = time_calls(run, args.repeat, args.seed)
+            record(results, key, seconds, n_tokens)
+    return results
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict],
+                        tolerance: float) -> List[Tuple[str, float, float, float]]:
+    """Returns (key, baseline tok/s, current tok/s, ratio) for every entry slower than tolerance allows."""
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = cur["tokens_per_sec"] / base["tokens_per_sec"]
+        if ratio < 1.0 - tolerance:
+            regressions.append((key, base["tokens_per_sec"], cur["tokens_per_sec"], ratio))
+    return regressions
+
+
+def _csv(cast):
+    return lambda s: [cast(x) for x in s.split(",") if x]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="./outputs/benchmarks/noise_throughput.json")
+    ap.add_argument("--baseline", default=None, help="JSON from a previous run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging")
+    ap.add_argument("--update_baseline", action="store_true", help="Overwrite --baseline with this run")
+    ap.add_argument("--fail_on_regression", action="store_true")
+    ap.add_argument("--lengths", type=_csv(int), default=[14, 64, 128, 512])
+    ap.add_argument("--rates", type=_csv(float), default=[0.1, 0.2, 0.3])
+    ap.add_argument("--strategies", type=_csv(str), default=["protect", "entities_only", "all"])
+    ap.add_argument("--token_budget", type=int, default=20000, help="Approx. tokens per configuration")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--only", default=None, help="Only run configurations whose key contains this string")
+    ap.add_argument("--tokenizer", default=None, help="HF tokenizer (default: offline synthetic WordPiece)")
+    ap.add_argument("--char_tokenizer", default=None, help="HF char tokenizer (default: offline CANINE)")
+    ap.add_argument("--max_length", type=int, default=256)
+    ap.add_argument("--char_max_length", type=int, default=1024)
+    ap.add_argument("--skip_tokenization", action="store_true")
+    args = ap.parse_args()
+
+    id2label = dict(enumerate(NER_LABELS))
+    label2id = {v: k for k, v in id2label.items()}
+    id2pos = dict(enumerate(POS_TAGS))
+    pos2id = {v: k for k, v in id2pos.items()}
+
+    install_stand_ins(all_words())
+    corpora = {
+        length: make_corpus(max(1, args.token_budget // length), length, args.seed + length, label2id, pos2id)
+        for length in args.lengths
+    }
+
+    results = bench_noise(args, corpora, id2label, label2id, id2pos)
+    results.update(bench_sampling(args, corpora, id2label, id2pos))
+    checks = {"sampling": sampling_check(np.array([3.0, 3.0, 1.5, 1.0, 3.0, 1.5, 1.0, 1.0]), 3, 20000, args.seed)}
+    if not args.skip_tokenization:
+        results.update(bench_tokenization(args, corpora, id2label, label2id))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "args": vars(args),
+        },
+        "results": results,
+        "checks": checks,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[benchmark] Wrote {len(results)} results to {args.out}")
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        print(f"===== REGRESSIONS vs {args.baseline} (tolerance {args.tolerance:.0%}) =====")
+        for key, base, cur, ratio in sorted(regressions, key=lambda r: r[3]):
+            print(f"{key}: {base:,.0f} -> {cur:,.0f} tok/s ({ratio - 1.0:+.1%})")
+        if not regressions:
+            print("none")
+    elif args.baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[benchmark] Stored baseline at {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import time
+from typing import Optional
+
+from transformers import EarlyStoppingCallback, IntervalStrategy, TrainerCallback
+
+
+class TimeBudgetCallback(TrainerCallback):
+    """
+    Stops training once `max_minutes` of wall-clock time have passed.
+    Forces a final evaluation + save so the partially trained epoch can still become the best checkpoint,
+    unless the Trainer does them anyway: with epoch strategies, the epoch-end flow runs after the
+    loop breaks, whether the budget ran out mid-epoch or on the last step of the epoch.
+    """
+
+    def __init__(self, max_minutes: float):
+        self.max_seconds = max_minutes * 60.0
+        self.start = None
+        self.triggered = False
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.monotonic()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if not self.triggered and time.monotonic() - self.start >= self.max_seconds:
+            self.triggered = True
+            control.should_training_stop = True
+            # on_epoch_end of the Trainer's default flow still follows and evaluates/saves per epoch strategy
+            if not (args.eval_strategy == IntervalStrategy.EPOCH and args.eval_delay <= (state.epoch or 0)):
+                control.should_evaluate = True
+            if args.save_strategy != IntervalStrategy.EPOCH:
+                control.should_save = True
+        return control
+
+
+def stop_reason(state, max_steps: int = -1,
+                early_stopping: Optional[EarlyStoppingCallback] = None,
+                time_budget: Optional[TimeBudgetCallback] = None) -> str:
+    """Why training ended: 'early_stopping', 'time_budget', 'step_budget' or 'completed'."""
+    if early_stopping is not None and early_stopping.early_stopping_patience_counter >= early_stopping.early_stopping_patience:
+        return "early_stopping"
+    if time_budget is not None and time_budget.triggered:
+        return "time_budget"
+    if max_steps > 0 and state.global_step >= max_steps:
+        return "step_budget"
+    return "completed"
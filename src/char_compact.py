@@ -0,0 +1,88 @@
+"""
+Compact char-level (CANINE) pipeline.
+
+tokenize_and_align_chars stores max_length int64 labels per sentence, almost all -100. Here the
+tokenized rows keep only the unpadded char ids plus the first-char offset and tag of each word
+(and the word lengths when training on dense labels); CharLabelCollator pads per batch and
+rebuilds the same label rows as tokenize_and_align_chars. At evaluation, gather_label_logits
+keeps only the logits at labeled positions, and the metrics compact the labels the same way
+(see metrics.compact_labels).
+"""
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from .data_preprocessing import _first_char_offsets
+
+MODEL_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def tokenize_chars_compact(batch, tokenizer, max_length: int = 1024, dense: bool = False) -> Dict[str, list]:
+    """
+    Unpadded CANINE inputs and per-word label info for " ".join(tokens): word_offsets (int16,
+    first char of each non-empty word within max_length) and word_labels (int8); with `dense`,
+    also word_lengths (int16) and the text length.
+    """
+    texts = [" ".join(tokens) for tokens in batch["tokens"]]
+    enc = tokenizer(texts, truncation=True, max_length=max_length)
+    out = {
+        "input_ids": [np.asarray(ids, dtype=np.int32) for ids in enc["input_ids"]],  # code points need > 16 bits
+        "attention_mask": [np.asarray(m, dtype=np.int8) for m in enc["attention_mask"]],
+        "word_offsets": [],
+        "word_labels": [],
+    }
+    if "token_type_ids" in enc:
+        out["token_type_ids"] = [np.asarray(t, dtype=np.int8) for t in enc["token_type_ids"]]
+    if dense:
+        out["word_lengths"], out["text_length"] = [], [len(text) for text in texts]
+    for words, tags in zip(batch["tokens"], batch["ner_tags"]):
+        kept = [(wi, offset) for wi, offset in enumerate(_first_char_offsets(words))
+                if offset is not None and offset < max_length]
+        out["word_offsets"].append(np.array([o for _, o in kept], dtype=np.int16))
+        out["word_labels"].append(np.array([tags[wi] for wi, _ in kept], dtype=np.int8))
+        if dense:
+            out["word_lengths"].append(np.array([len(words[wi]) for wi, _ in kept], dtype=np.int16))
+    return out
+
+
+class CharLabelCollator:
+    """
+    Pads compact rows per batch and builds labels: the word tag at each word's first char, or,
+    for rows with word_lengths, dense labels (B- on the first char, I- on the rest, O between words).
+    """
+
+    def __init__(self, tokenizer, id2label: Dict[int, str], label2id: Dict[str, int]):
+        self.tokenizer = tokenizer
+        self.outside = label2id["O"]
+        self.inside = np.arange(len(id2label), dtype=np.int64)  # tag -> tag of the following chars
+        for i, label in id2label.items():
+            if label.startswith("B-"):
+                self.inside[i] = label2id[f"I-{label[2:]}"]
+
+    def __call__(self, features: List[dict]) -> Dict[str, torch.Tensor]:
+        inputs = [{k: f[k] for k in MODEL_INPUTS if k in f} for f in features]
+        batch = self.tokenizer.pad(inputs, return_tensors="pt")
+        width = batch["input_ids"].shape[1]
+        labels = np.full((len(features), width), -100, dtype=np.int64)
+        for b, f in enumerate(features):
+            offsets = np.asarray(f["word_offsets"], dtype=np.int64)
+            tags = np.asarray(f["word_labels"], dtype=np.int64)
+            if "word_lengths" in f:
+                lengths = np.asarray(f["word_lengths"], dtype=np.int64)
+                labels[b, :min(f["text_length"], width)] = self.outside
+                for offset, length, tag in zip(offsets, lengths, tags):
+                    labels[b, offset + 1:offset + length] = self.inside[tag]
+            labels[b, offsets] = tags
+        batch["labels"] = torch.from_numpy(labels)
+        return batch
+
+
+def gather_label_logits(logits: torch.Tensor, labels: torch.Tensor) -> torch.Tensor:
+    """Trainer preprocess_logits_for_metrics: logits at the labeled positions, left-aligned per row."""
+    if isinstance(logits, tuple):
+        logits = logits[0]
+    mask = labels != -100
+    width = max(int(mask.sum(1).max()), 1) if len(mask) else 1
+    order = torch.argsort((~mask).to(torch.int8), dim=1, stable=True)[:, :width]
+    return logits.gather(1, order.unsqueeze(-1).expand(-1, -1, logits.size(-1)))
@@ -0,0 +1,67 @@
+import os
+from typing import Any, Dict, Optional
+
+import torch
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects cgroup/affinity limits on cluster nodes)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def cpu_supports_bf16() -> bool:
+    """True if oneDNN can run bf16 kernels natively (AVX512-BF16 / AMX)."""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def configure_cpu_perf(
+    concurrent_jobs: int = 1,
+    dataloader_workers: Optional[int] = None,
+    torch_compile: bool = False,
+) -> Dict[str, Any]:
+    """
+    Tunes torch threading for CPU training and returns the matching TrainingArguments kwargs.
+
+    - The node's cores are split evenly between `concurrent_jobs` runs.
+    - Part of each share goes to dataloader workers (tokenized batches are cheap to collate,
+      so at most 2 workers), the rest to intra-op threads; inter-op threads stay small.
+    - bf16 autocast is enabled only where the CPU supports it natively.
+    """
+    cores = available_cores()
+    per_job = max(1, cores // max(1, concurrent_jobs))
+    if dataloader_workers is None:
+        dataloader_workers = min(2, per_job // 8)
+    intra_op = max(1, per_job - dataloader_workers)
+    inter_op = max(1, min(4, intra_op // 8))
+
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_interop_threads(inter_op)
+    except RuntimeError:
+        # can only be set once per process, before any inter-op work
+        inter_op = torch.get_num_interop_threads()
+    if dataloader_workers > 0:
+        # workers are forked; avoid tokenizers' own thread pool fighting with them
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    bf16 = cpu_supports_bf16()
+    print(f"[cpu_perf] cores={cores} jobs={concurrent_jobs} intra_op={intra_op} inter_op={inter_op} "
+          f"dataloader_workers={dataloader_workers} bf16={bf16} torch_compile={torch_compile}")
+
+    kwargs = {
+        "use_cpu": True,
+        "bf16": bf16,
+        "dataloader_num_workers": dataloader_workers,
+        "dataloader_pin_memory": False,  # pinning only helps host->GPU copies
+        "torch_compile": torch_compile,
+    }
+    if dataloader_workers > 0:
+        kwargs["dataloader_prefetch_factor"] = 2
+        kwargs["dataloader_persistent_workers"] = True
+    return kwargs
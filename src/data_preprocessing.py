@@ -1,5 +1,8 @@
-from typing import Dict, Tuple
-from datasets import load_dataset, ClassLabel
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from datasets import load_dataset, ClassLabel, Dataset
 
 def load_conll2003():
     return load_dataset("conll2003", trust_remote_code=True)
@@ -14,7 +17,64 @@ def build_label_maps(features, feature_name: str) -> Tuple[Dict[int, str], Dict[
     label2id = {v: k for k, v in id2label.items()}
     return id2label, label2id
 
-def tokenize_and_align(batch, tokenizer, label_all_tokens=False, max_length=256):
+def stratified_subsample_indices(
+    ner_tags: Sequence[Sequence[int]],
+    id2label: Dict[int, str],
+    n: int,
+    seed: int,
+) -> List[int]:
+    """
+    Deterministic subsample of `n` sentence indices, stratified by entity type.
+
+    Each sentence is assigned to the stratum of its rarest entity type (sentences without
+    entities form the 'O' stratum), so rare types keep their share in the sample.
+    Strata get sizes proportional to their share (largest remainder), sampled with `seed`.
+    """
+    if n >= len(ner_tags):
+        return list(range(len(ner_tags)))
+
+    sent_types = [{id2label[t][2:] for t in tags if id2label[t].startswith("B-")} for tags in ner_tags]
+    type_counts = Counter(t for types in sent_types for t in types)
+    strata = np.array([min(types, key=lambda t: (type_counts[t], t)) if types else "O" for types in sent_types])
+
+    names, sizes = np.unique(strata, return_counts=True)
+    quota = sizes / sizes.sum() * n
+    alloc = np.floor(quota).astype(int)
+    for i in np.argsort(-(quota - alloc), kind="stable")[: n - alloc.sum()]:
+        alloc[i] += 1
+
+    rng = np.random.default_rng(seed)
+    chosen = []
+    for name, k in zip(names, alloc):
+        members = np.flatnonzero(strata == name)
+        chosen.extend(rng.permutation(members)[:k].tolist())
+    return sorted(chosen)
+
+def nested_subset_rows(n_rows: int, fraction: float, seed: int, example_ids=None) -> List[int]:
+    """
+    Rows of a seeded subset holding `fraction` of the sentences; subsets of one seed are nested
+    (each fraction contains every smaller one). With example_ids (windowed rows), all windows of a
+    sampled sentence are kept.
+    """
+    ids = np.asarray(example_ids) if example_ids is not None else np.arange(n_rows)
+    n_sentences = int(ids.max()) + 1 if len(ids) else 0
+    order = np.random.default_rng(seed).permutation(n_sentences)
+    keep = np.zeros(n_sentences, dtype=bool)
+    keep[order[:max(1, round(fraction * n_sentences))]] = True
+    return np.flatnonzero(keep[ids]).tolist()
+
+
+def window_starts(n: int, size: int, stride: int) -> List[int]:
+    """Start offsets of windows of `size` items, overlapping by `stride` items, that cover n items."""
+    if not 0 <= stride < size:
+        raise ValueError(f"stride must be in [0, {size}) for windows of {size} items, got {stride}")
+    step = size - stride
+    starts = [0]
+    while starts[-1] + size < n:
+        starts.append(starts[-1] + step)
+    return starts
+
+def tokenize_and_align(batch, tokenizer, label_all_tokens=False, max_length=256, stride=0, example_ids=None):
     """
     Tokenize word-level inputs and align labels for subword models (BERT, RoBERTa, etc.).
 
@@ -22,8 +82,14 @@ def tokenize_and_align(batch, tokenizer, label_all_tokens=False, max_length=256)
       - first subword gets the word label
       - others get -100 (ignored) unless label_all_tokens=True
 
+    With stride > 0, sequences longer than max_length are split into overlapping windows
+    instead of being truncated (see _tokenize_and_align_windows).
+
     Returns tokenized batch with subword-aligned "labels".
     """
+    if stride > 0:
+        return _tokenize_and_align_windows(batch, tokenizer, label_all_tokens, max_length, stride, example_ids)
+
     tokenized = tokenizer(
         batch["tokens"],
         is_split_into_words=True,
@@ -48,9 +114,104 @@ def tokenize_and_align(batch, tokenizer, label_all_tokens=False, max_length=256)
         new_labels.append(label_ids)
 
     tokenized["labels"] = new_labels
+    if "sentence_ids" in batch:
+        # packed rows: map first-subword positions back to (source sentence, word in sentence)
+        tokenized["example_id"], tokenized["word_ids"] = [], []
+        for i, label_ids in enumerate(new_labels):
+            example_ids, first_ids = [-100] * len(label_ids), [-100] * len(label_ids)
+            previous_word_idx = None
+            for j, word_idx in enumerate(tokenized.word_ids(batch_index=i)):
+                if word_idx is not None and word_idx != previous_word_idx:
+                    example_ids[j] = batch["sentence_ids"][i][word_idx]
+                    first_ids[j] = batch["word_positions"][i][word_idx]
+                previous_word_idx = word_idx
+            tokenized["example_id"].append(example_ids)
+            tokenized["word_ids"].append(first_ids)
     return tokenized
 
 
+def _tokenize_and_align_windows(batch, tokenizer, label_all_tokens, max_length, stride, example_ids=None):
+    """
+    Strided windowing for subword models.
+
+    Each sentence is tokenized once without special tokens, then cut into windows of
+    max_length minus special tokens, overlapping by `stride` subwords. One row per window:
+      - labels: as in tokenize_and_align; a word's first subword is labeled in every window containing it
+      - word_ids: word index at first-subword positions, -100 elsewhere
+      - example_id: index of the source sentence
+    Words are re-assembled from the windows by metrics.merge_word_predictions.
+    The number of output rows differs from the input, so map with remove_columns.
+    """
+    if example_ids is None:
+        example_ids = range(len(batch["tokens"]))
+    encoded = tokenizer(batch["tokens"], is_split_into_words=True, add_special_tokens=False)
+    n_special = tokenizer.num_special_tokens_to_add(pair=False)
+    budget = max_length - n_special
+    # position of the content inside [specials + content + specials] (e.g. 1 for [CLS] ..., 0 for XLNet)
+    prefix = tokenizer.build_inputs_with_special_tokens([-1]).index(-1)
+
+    out = {"labels": [], "word_ids": [], "example_id": []}
+    for i, labels in enumerate(batch["ner_tags"]):
+        ids = encoded["input_ids"][i]
+        word_ids = encoded.word_ids(batch_index=i)
+        for start in window_starts(len(ids), budget, stride):
+            end = min(start + budget, len(ids))
+            window = tokenizer.prepare_for_model(
+                ids[start:end],
+                add_special_tokens=True,
+                padding="max_length",
+                max_length=max_length,
+            )
+            offset = prefix
+            if tokenizer.padding_side == "left":
+                offset += max_length - (end - start + n_special)
+            label_ids = [-100] * max_length
+            first_ids = [-100] * max_length
+            for j, g in enumerate(range(start, end), start=offset):
+                w = word_ids[g]
+                if g == 0 or word_ids[g - 1] != w:
+                    label_ids[j] = labels[w]
+                    first_ids[j] = w
+                elif label_all_tokens:
+                    label_ids[j] = labels[w]
+            for key, value in window.items():
+                out.setdefault(key, []).append(value)
+            out["labels"].append(label_ids)
+            out["word_ids"].append(first_ids)
+            out["example_id"].append(example_ids[i])
+    return out
+
+
+def _char_labels(words, word_labels, id2label, label2id, eval_mode):
+    """Char-level labels for " ".join(words) (see tokenize_and_align_chars)."""
+    char_labels = []
+
+    for wi, (word, lab_id) in enumerate(zip(words, word_labels)):
+        lab_str = id2label[lab_id]
+
+        if eval_mode:
+            # EVAL/TEST: one label per word, at the first char only
+            if len(word) > 0:
+                char_labels.append(lab_id)                 # first char carries the word tag
+                char_labels.extend([-100] * (len(word)-1)) # rest ignored
+            # ignore space after word
+            if wi < len(words) - 1:
+                char_labels.append(-100)
+        else:
+            # TRAIN: dense char supervision
+            if lab_str.startswith("B-"):
+                etype = lab_str[2:]
+                char_labels.append(lab_id)  # first char = B-type
+                char_labels.extend([label2id[f"I-{etype}"]] * (len(word) - 1))
+            else:
+                # O or I-* repeated for all chars
+                char_labels.extend([lab_id] * len(word))
+            # space as O
+            if wi < len(words) - 1:
+                char_labels.append(label2id["O"])
+    return char_labels
+
+
 def tokenize_and_align_chars(
     batch,
     tokenizer,
@@ -58,6 +219,8 @@ def tokenize_and_align_chars(
     label2id: Dict[str, int],
     max_length: int = 1024,
     eval_mode: bool = False,
+    stride: int = 0,
+    example_ids=None,
 ):
     """
     CANINE char-level alignment for word-labeled NER.
@@ -76,7 +239,14 @@ def tokenize_and_align_chars(
       --> Ground truth + seqeval are word based → give exactly one tag per word
       --> Avoids tokenizer/length bias (longer words don’t get extra “votes”).
       --> Mirrors the standard “first-subtoken” eval used for BERT like models.
+
+    With stride > 0, texts longer than max_length are split into overlapping char windows
+    (same row layout as _tokenize_and_align_windows).
     """
+    if stride > 0:
+        return _tokenize_and_align_chars_windows(batch, tokenizer, id2label, label2id, max_length, eval_mode,
+                                                 stride, example_ids)
+
     texts = [" ".join(tokens) for tokens in batch["tokens"]]
     tokenized = tokenizer(
         texts,
@@ -87,31 +257,7 @@ def tokenize_and_align_chars(
 
     new_labels = []
     for words, word_labels in zip(batch["tokens"], batch["ner_tags"]):
-        char_labels = []
-
-        for wi, (word, lab_id) in enumerate(zip(words, word_labels)):
-            lab_str = id2label[lab_id]
-
-            if eval_mode:
-                # EVAL/TEST: one label per word, at the first char only
-                if len(word) > 0:
-                    char_labels.append(lab_id)                 # first char carries the word tag
-                    char_labels.extend([-100] * (len(word)-1)) # rest ignored
-                # ignore space after word
-                if wi < len(words) - 1:
-                    char_labels.append(-100)
-            else:
-                # TRAIN: dense char supervision
-                if lab_str.startswith("B-"):
-                    etype = lab_str[2:]
-                    char_labels.append(lab_id)  # first char = B-type
-                    char_labels.extend([label2id[f"I-{etype}"]] * (len(word) - 1))
-                else:
-                    # O or I-* repeated for all chars
-                    char_labels.extend([lab_id] * len(word))
-                # space as O
-                if wi < len(words) - 1:
-                    char_labels.append(label2id["O"])
+        char_labels = _char_labels(words, word_labels, id2label, label2id, eval_mode)
 
         # pad/truncate
         char_labels = char_labels[:max_length]
@@ -119,4 +265,155 @@ def tokenize_and_align_chars(
         new_labels.append(char_labels)
 
     tokenized["labels"] = new_labels
+    if "sentence_ids" in batch:
+        # packed rows: map first-char positions back to (source sentence, word in sentence)
+        tokenized["example_id"], tokenized["word_ids"] = [], []
+        for i, words in enumerate(batch["tokens"]):
+            example_ids, first_ids = [-100] * max_length, [-100] * max_length
+            for wi, offset in enumerate(_first_char_offsets(words)):
+                if offset is not None and offset < max_length:
+                    example_ids[offset] = batch["sentence_ids"][i][wi]
+                    first_ids[offset] = batch["word_positions"][i][wi]
+            tokenized["example_id"].append(example_ids)
+            tokenized["word_ids"].append(first_ids)
     return tokenized
+
+
+def _first_char_offsets(words) -> List:
+    """Offset of each word's first char in " ".join(words) (None for empty words)."""
+    offsets, offset = [], 0
+    for word in words:
+        offsets.append(offset if word else None)
+        offset += len(word) + 1
+    return offsets
+
+
+def _tokenize_and_align_chars_windows(batch, tokenizer, id2label, label2id, max_length, eval_mode, stride,
+                                      example_ids=None):
+    """Strided char windows for CANINE; labels keep the indexing of tokenize_and_align_chars."""
+    if example_ids is None:
+        example_ids = range(len(batch["tokens"]))
+    budget = max_length - tokenizer.num_special_tokens_to_add(pair=False)
+
+    out = {"labels": [], "word_ids": [], "example_id": []}
+    for i, (words, word_labels) in enumerate(zip(batch["tokens"], batch["ner_tags"])):
+        text = " ".join(words)
+        char_labels = _char_labels(words, word_labels, id2label, label2id, eval_mode)
+        char_words = [-100] * len(text)
+        for wi, offset in enumerate(_first_char_offsets(words)):
+            if offset is not None:
+                char_words[offset] = wi
+
+        for start in window_starts(len(text), budget, stride):
+            end = start + budget
+            window = tokenizer(text[start:end], truncation=True, padding="max_length", max_length=max_length)
+            labels, first_ids = char_labels[start:end], char_words[start:end]
+            for key, value in window.items():
+                out.setdefault(key, []).append(value)
+            out["labels"].append(labels + [-100] * (max_length - len(labels)))
+            out["word_ids"].append(first_ids + [-100] * (max_length - len(first_ids)))
+            out["example_id"].append(example_ids[i])
+    return out
+
+
+def sentence_lengths(dataset, tokenizer, char_level: bool = False) -> List[int]:
+    """Model-input length of each sentence without special tokens (subwords, or chars for CANINE)."""
+    if char_level:
+        return [len(" ".join(tokens)) for tokens in dataset["tokens"]]
+    encoded = tokenizer(dataset["tokens"], is_split_into_words=True, add_special_tokens=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def document_ids(dataset) -> Optional[List[int]]:
+    """
+    Document index per sentence: from a 'document_id' column if present, otherwise by counting
+    '-DOCSTART-' rows. None if the split carries no document boundaries (the HF conll2003
+    loader drops them; see conll_document_ids).
+    """
+    if "document_id" in dataset.column_names:
+        return list(dataset["document_id"])
+    doc, ids, seen = 0, [], False
+    for tokens in dataset["tokens"]:
+        if tokens and tokens[0] == "-DOCSTART-":
+            doc += 1
+            seen = True
+        ids.append(doc)
+    return ids if seen else None
+
+
+# raw CoNLL-2003 file names per split: the HF loader's copy, and the original distribution
+CONLL_FILES = {"train": ("train.txt", "eng.train"), "validation": ("valid.txt", "eng.testa"),
+               "test": ("test.txt", "eng.testb")}
+
+
+def read_conll_documents(path: str) -> Tuple[List[List[str]], List[int]]:
+    """Sentences (tokens) and their document index from a raw CoNLL file with -DOCSTART- lines."""
+    sentences, doc_ids, current, doc = [], [], [], -1
+    with open(path, "r", encoding="utf-8") as f:
+        for line in list(f) + [""]:
+            parts = line.split()
+            if parts and parts[0] == "-DOCSTART-":
+                doc += 1
+            elif parts:
+                current.append(parts[0])
+                continue
+            if current:
+                sentences.append(current)
+                doc_ids.append(max(doc, 0))
+                current = []
+    return sentences, doc_ids
+
+
+def conll_document_ids(ds, conll_dir: str) -> Dict[str, List[int]]:
+    """
+    Document index per sentence of each split, read from the raw CoNLL-2003 files in `conll_dir`
+    after checking that their sentences match the split's one by one. Noise keeps rows in order,
+    so the ids also hold for the noised splits.
+    """
+    out = {}
+    for split in ds:
+        paths = [os.path.join(conll_dir, name) for name in CONLL_FILES.get(split, ())]
+        path = next((p for p in paths if os.path.exists(p)), None)
+        if path is None:
+            raise FileNotFoundError(f"No raw CoNLL file for {split} in {conll_dir} (expected one of {paths})")
+        sentences, doc_ids = read_conll_documents(path)
+        if sentences != list(ds[split]["tokens"]):
+            raise ValueError(f"{path} does not match the {split} split sentence by sentence")
+        out[split] = doc_ids
+        print(f"[data] {split}: {max(doc_ids) + 1} documents from {path}")
+    return out
+
+
+def pack_sentences(dataset, lengths: Sequence[int], budget: int, sep_length: int = 0,
+                   doc_ids: Optional[Sequence[int]] = None) -> Dataset:
+    """
+    Greedily concatenates consecutive sentences into rows of at most `budget` subwords/chars
+    (plus `sep_length` per sentence boundary, e.g. 1 for the joining space in char models),
+    never crossing a document boundary. Sentences longer than the budget get a row of their own
+    and are truncated at tokenization as before.
+
+    Returns rows with tokens and ner_tags plus, per word, sentence_ids (row index of the source
+    sentence in `dataset`) and word_positions (index of the word in that sentence), which
+    tokenize_and_align(_chars) turn into example_id/word_ids for metrics.merge_word_predictions.
+    """
+    packed = {"tokens": [], "ner_tags": [], "sentence_ids": [], "word_positions": []}
+    row, row_len, row_doc = None, 0, None
+    for i, (tokens, tags) in enumerate(zip(dataset["tokens"], dataset["ner_tags"])):
+        doc = doc_ids[i] if doc_ids is not None else None
+        if row is not None and (doc != row_doc or row_len + sep_length + lengths[i] > budget):
+            for key in packed:
+                packed[key].append(row[key])
+            row = None
+        if row is None:
+            row = {key: [] for key in packed}
+            row_len, row_doc = lengths[i], doc
+        else:
+            row_len += sep_length + lengths[i]
+        row["tokens"].extend(tokens)
+        row["ner_tags"].extend(tags)
+        row["sentence_ids"].extend([i] * len(tokens))
+        row["word_positions"].extend(range(len(tokens)))
+    if row is not None:
+        for key in packed:
+            packed[key].append(row[key])
+    return Dataset.from_dict(packed)
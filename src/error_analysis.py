@@ -0,0 +1,208 @@
+"""
+Span-level error analysis of test predictions with noise attribution.
+
+Input: per-sentence records {"tokens", "gold", "pred", "noise_ops"} over the scored words
+(written by src.train --error_analysis to <out>/test_predictions.jsonl). noise_ops lists the
+noise functions that changed each word ("" = clean, see train.build_mappers).
+
+Every gold span is classified as
+    correct              same boundaries and type as a predicted span
+    type_error           same boundaries, other type
+    boundary_error       overlaps a predicted span of the same type, other boundaries
+    boundary_type_error  overlaps only predicted spans of other types and boundaries
+    missed               no overlapping predicted span
+and predicted spans without any overlapping gold span are spurious. Scores are reported for
+all spans, spans with no noised word (untouched), spans with at least one (touched) and per
+noise function.
+
+    python -m src.error_analysis --predictions outputs/<run_name>/test_predictions.jsonl
+"""
+import argparse
+import json
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from seqeval.metrics.sequence_labeling import get_entities
+
+from .data_preprocessing import _first_char_offsets
+
+CATEGORIES = ["correct", "type_error", "boundary_error", "boundary_type_error", "missed"]
+
+
+def scored_word_ids(sentences: Sequence[List[str]], tokenizer, max_length: int, char_level: bool) -> List[List[int]]:
+    """Words that carry a label after tokenize_and_align(_chars) without windows (first subword/char kept)."""
+    if char_level:
+        return [[wi for wi, offset in enumerate(_first_char_offsets(words)) if offset is not None and offset < max_length]
+                for words in sentences]
+    out = []
+    for i in range(0, len(sentences), 1000):
+        enc = tokenizer(list(sentences[i:i + 1000]), is_split_into_words=True, truncation=True, max_length=max_length)
+        for b in range(len(enc["input_ids"])):
+            out.append(sorted({w for w in enc.word_ids(batch_index=b) if w is not None}))
+    return out
+
+
+def indexed_word_ids(example_ids, word_ids) -> Dict[int, List[int]]:
+    """Scored words per sentence of a windowed/packed dataset (see train.word_index)."""
+    word_ids = np.asarray(word_ids)
+    example_ids = np.asarray(example_ids)
+    if example_ids.ndim == 1:
+        example_ids = np.broadcast_to(example_ids[:, None], word_ids.shape)
+    mask = word_ids != -100
+    pairs = np.unique(np.stack([example_ids[mask], word_ids[mask]], axis=1), axis=0)
+    bounds = np.flatnonzero(pairs[1:, 0] != pairs[:-1, 0]) + 1
+    return {int(g[0, 0]): g[:, 1].tolist() for g in np.split(pairs, bounds) if len(g)}
+
+
+def build_records(sentences, word_ids: Dict[int, List[int]], true_predictions, true_labels) -> List[dict]:
+    """
+    Joins word-level predictions (one list per scored sentence, in sentence order) with the
+    evaluated sentences ("tokens" and optional "noise_ops" columns).
+    """
+    records = []
+    scored = [i for i in range(len(sentences)) if word_ids.get(i)]
+    predicted = [(p, g) for p, g in zip(true_predictions, true_labels) if g]  # rows without scored words
+    if len(scored) != len(predicted):
+        raise ValueError(f"{len(predicted)} predicted sentences for {len(scored)} scored sentences")
+    has_ops = "noise_ops" in sentences.column_names
+    for i, (pred, gold) in zip(scored, predicted):
+        row = sentences[i]
+        words = word_ids[i][:len(pred)]
+        records.append({
+            "idx": i,
+            "tokens": [row["tokens"][w] for w in words],
+            "gold": gold,
+            "pred": pred,
+            "noise_ops": [row["noise_ops"][w] for w in words] if has_ops else [""] * len(words),
+        })
+    return records
+
+
+def _spans(seqs: Iterable[List[str]], type_ids: Dict[str, int]) -> np.ndarray:
+    """Rows (sentence, start, end, type) of all entity spans."""
+    rows = [(s, b, e, type_ids.setdefault(t, len(type_ids)))
+            for s, seq in enumerate(seqs) for t, b, e in get_entities(seq)]
+    return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+
+def _pairs(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All (i, j) with a[i] and b[j] in the same sentence (b sorted by sentence)."""
+    lo = np.searchsorted(b[:, 0], a[:, 0], side="left")
+    hi = np.searchsorted(b[:, 0], a[:, 0], side="right")
+    counts = hi - lo
+    ia = np.repeat(np.arange(len(a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ia, lo[ia] + offsets
+
+
+def _range_any(flag_csum: np.ndarray, sent_offsets: np.ndarray, spans: np.ndarray) -> np.ndarray:
+    """Whether any flagged word lies inside each span (prefix sums over the flat word axis)."""
+    start = sent_offsets[spans[:, 0]] + spans[:, 1]
+    end = sent_offsets[spans[:, 0]] + spans[:, 2] + 1
+    return flag_csum[end] - flag_csum[start] > 0
+
+
+def _prf(tp: int, n_pred: int, n_gold: int) -> Dict[str, float]:
+    p = tp / n_pred if n_pred else 0.0
+    r = tp / n_gold if n_gold else 0.0
+    return {"precision": p, "recall": r, "f1": 2 * p * r / (p + r) if p + r else 0.0,
+            "n_gold": int(n_gold), "n_pred": int(n_pred)}
+
+
+def analyze(records: List[dict]) -> dict:
+    type_ids: Dict[str, int] = {}
+    gold = _spans((r["gold"] for r in records), type_ids)
+    pred = _spans((r["pred"] for r in records), type_ids)
+    types = sorted(type_ids, key=type_ids.get)
+
+    # gold -> predicted span relations
+    gi, pj = _pairs(gold, pred)
+    overlap = (pred[pj, 1] <= gold[gi, 2]) & (gold[gi, 1] <= pred[pj, 2])
+    gi, pj = gi[overlap], pj[overlap]
+    exact = (gold[gi, 1] == pred[pj, 1]) & (gold[gi, 2] == pred[pj, 2])
+    same_type = gold[gi, 3] == pred[pj, 3]
+
+    category = np.full(len(gold), CATEGORIES.index("missed"))
+    np.minimum.at(category, gi, np.where(exact, np.where(same_type, 0, 1), np.where(same_type, 2, 3)))
+    spurious = np.ones(len(pred), dtype=bool)
+    spurious[pj] = False
+
+    # confusion: gold type x type of the best overlapping prediction (exact first), "O" = none
+    confusion = np.zeros((len(types) + 1, len(types) + 1), dtype=np.int64)
+    best = np.full(len(gold), len(types))
+    order = np.lexsort((~exact, gi))
+    first = order[np.unique(gi[order], return_index=True)[1]]
+    best[gi[first]] = pred[pj[first], 3]
+    np.add.at(confusion, (gold[:, 3], best), 1)
+    np.add.at(confusion, (np.full(spurious.sum(), len(types)), pred[spurious, 3]), 1)
+
+    # noise attribution on the flat word axis
+    lengths = np.array([len(r["gold"]) for r in records], dtype=np.int64)
+    sent_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    flat_ops = [o for r in records for o in r["noise_ops"]]
+    groups = {"all": (np.ones(len(gold), dtype=bool), np.ones(len(pred), dtype=bool))}
+    noised = np.concatenate([[0], np.cumsum([o != "" for o in flat_ops])])
+    g_touched, p_touched = _range_any(noised, sent_offsets, gold), _range_any(noised, sent_offsets, pred)
+    groups["untouched"] = (~g_touched, ~p_touched)
+    groups["touched"] = (g_touched, p_touched)
+    for op in sorted({x for o in flat_ops if o for x in o.split("+")}):
+        flag = np.concatenate([[0], np.cumsum([op in o.split("+") for o in flat_ops])])
+        groups[f"touched:{op}"] = (_range_any(flag, sent_offsets, gold), _range_any(flag, sent_offsets, pred))
+
+    report = {"types": types, "groups": {}}
+    for name, (g_mask, p_mask) in groups.items():
+        tp = int((category[g_mask] == 0).sum())
+        group = _prf(tp, int(p_mask.sum()), int(g_mask.sum()))
+        group["errors"] = {c: int((category[g_mask] == k).sum()) for k, c in enumerate(CATEGORIES)}
+        group["errors"]["spurious"] = int((spurious & p_mask).sum())
+        group["per_type"] = {
+            t: _prf(int(((category == 0) & g_mask & (gold[:, 3] == k)).sum()),
+                    int((p_mask & (pred[:, 3] == k)).sum()), int((g_mask & (gold[:, 3] == k)).sum()))
+            for k, t in enumerate(types)
+        }
+        report["groups"][name] = group
+    report["confusion"] = {"labels": types + ["O"], "matrix": confusion.tolist()}
+    report["noised_word_rate"] = float(noised[-1] / max(len(flat_ops), 1))
+    return report
+
+
+def print_analysis(report: dict):
+    for name, g in report["groups"].items():
+        errors = " ".join(f"{k}={v}" for k, v in g["errors"].items())
+        print(f"[error_analysis] {name:<32} f1={g['f1']:.4f} p={g['precision']:.4f} r={g['recall']:.4f} "
+              f"gold={g['n_gold']:<6} {errors}")
+    labels = report["confusion"]["labels"]
+    print("[error_analysis] confusion (rows gold, cols predicted; O = no span)")
+    print("[error_analysis] " + " " * 6 + "".join(f"{l:>8}" for l in labels))
+    for label, row in zip(labels, report["confusion"]["matrix"]):
+        print(f"[error_analysis] {label:<6}" + "".join(f"{v:>8}" for v in row))
+
+
+def write_records(path: str, records: List[dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def read_records(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--predictions", required=True, help="test_predictions.jsonl written by src.train --error_analysis")
+    ap.add_argument("--out", default=None, help="Default: error_analysis.json next to the predictions")
+    args = ap.parse_args()
+
+    report = analyze(read_records(args.predictions))
+    print_analysis(report)
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(args.predictions)), "error_analysis.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[error_analysis] Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
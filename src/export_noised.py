@@ -0,0 +1,170 @@
+"""
+Export of noised splits to a compact, memory-mappable layout for consumers outside Python/HF.
+
+    python -m src.export_noised --profile src/profiles/<PROFILE> --seed 42 --out_dir outputs/noised/<name>
+
+Layout (all arrays little-endian .npy, strings UTF-8):
+
+    metadata.json            profile, profile_hash, seed, label/POS names, noise-op vocabulary, splits
+    vocab_bytes.npy          uint8   concatenated token strings, shared by all splits
+    vocab_offsets.npy        int64   [V+1] byte offsets into vocab_bytes
+    <split>/offsets.npy      int64   [N+1] token offsets per sentence
+    <split>/token_ids.npy    int32   [T]   vocabulary ids
+    <split>/ner_tags.npy     int16   [T]
+    <split>/noise_ops.npy    int16   [T]   index into metadata["noise_ops"] (0 = clean)
+    <split>/pos_offsets.npy  int64   [N+1] POS tags keep their pre-noise positions (syntactic ops
+    <split>/pos_tags.npy     int16   [P]   change token counts), so they have their own offsets
+
+NoisedCorpus reads it back with np.load(mmap_mode="r"): nothing is copied until a slice is used.
+"""
+import argparse
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def profile_hash(profile: dict) -> str:
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _offsets(lengths: List[int]) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+
+def export_noised(ds, out_dir: str, profile: dict, seed: int, id2label: Dict[int, str], id2pos: Dict[int, str],
+                  splits: Optional[List[str]] = None) -> str:
+    """Writes the given splits of a (noised) DatasetDict; returns the metadata path."""
+    splits = splits or list(ds.keys())
+    os.makedirs(out_dir, exist_ok=True)
+    vocab: Dict[str, int] = {}
+    ops_vocab: Dict[str, int] = {"": 0}
+    split_meta = {}
+
+    for split in splits:
+        d = ds[split]
+        tokens = d["tokens"]
+        lengths = [len(t) for t in tokens]
+        token_ids = np.fromiter((vocab.setdefault(w, len(vocab)) for sent in tokens for w in sent),
+                                dtype=np.int32, count=sum(lengths))
+        ner = np.fromiter((t for tags in d["ner_tags"] for t in tags), dtype=np.int16, count=sum(lengths))
+        if "noise_ops" in d.column_names:
+            noise_ops = np.fromiter((ops_vocab.setdefault(o, len(ops_vocab)) for ops in d["noise_ops"] for o in ops),
+                                    dtype=np.int16, count=sum(lengths))
+        else:
+            noise_ops = np.zeros(sum(lengths), dtype=np.int16)
+        pos = d["pos_tags"] if "pos_tags" in d.column_names else [[] for _ in tokens]
+        pos_lengths = [len(p) for p in pos]
+
+        split_dir = os.path.join(out_dir, split)
+        os.makedirs(split_dir, exist_ok=True)
+        np.save(os.path.join(split_dir, "offsets.npy"), _offsets(lengths))
+        np.save(os.path.join(split_dir, "token_ids.npy"), token_ids)
+        np.save(os.path.join(split_dir, "ner_tags.npy"), ner)
+        np.save(os.path.join(split_dir, "noise_ops.npy"), noise_ops)
+        np.save(os.path.join(split_dir, "pos_offsets.npy"), _offsets(pos_lengths))
+        np.save(os.path.join(split_dir, "pos_tags.npy"), np.fromiter((t for p in pos for t in p), dtype=np.int16,
+                                                                     count=sum(pos_lengths)))
+        split_meta[split] = {"sentences": len(tokens), "tokens": int(sum(lengths)),
+                             "pos_aligned": pos_lengths == lengths}
+
+    encoded = [w.encode("utf-8") for w in vocab]
+    np.save(os.path.join(out_dir, "vocab_bytes.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(out_dir, "vocab_offsets.npy"), _offsets([len(b) for b in encoded]))
+
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "profile": profile,
+        "profile_hash": profile_hash(profile),
+        "seed": seed,
+        "ner_labels": [id2label[i] for i in range(len(id2label))],
+        "pos_labels": [id2pos[i] for i in range(len(id2pos))],
+        "noise_ops": list(ops_vocab),
+        "vocab_size": len(vocab),
+        "splits": split_meta,
+    }
+    path = os.path.join(out_dir, "metadata.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    return path
+
+
+class NoisedSplit:
+    def __init__(self, corpus: "NoisedCorpus", split_dir: str):
+        self.corpus = corpus
+        load = lambda name: np.load(os.path.join(split_dir, f"{name}.npy"), mmap_mode="r")
+        self.offsets = load("offsets")
+        self.token_ids = load("token_ids")
+        self.ner_tags = load("ner_tags")
+        self.noise_ops = load("noise_ops")
+        self.pos_offsets = load("pos_offsets")
+        self.pos_tags = load("pos_tags")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _slice(self, array, offsets, i: int):
+        return array[offsets[i]:offsets[i + 1]]
+
+    def sentence(self, i: int) -> Dict[str, np.ndarray]:
+        """Array views of sentence i: token_ids, ner_tags, noise_ops, pos_tags."""
+        return {
+            "token_ids": self._slice(self.token_ids, self.offsets, i),
+            "ner_tags": self._slice(self.ner_tags, self.offsets, i),
+            "noise_ops": self._slice(self.noise_ops, self.offsets, i),
+            "pos_tags": self._slice(self.pos_tags, self.pos_offsets, i),
+        }
+
+    def tokens(self, i: int) -> List[str]:
+        return [self.corpus.token(t) for t in self._slice(self.token_ids, self.offsets, i)]
+
+
+class NoisedCorpus:
+    """Zero-copy reader of an export_noised directory."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        if self.metadata["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"unsupported format version {self.metadata['format_version']}")
+        self.vocab_bytes = np.load(os.path.join(path, "vocab_bytes.npy"), mmap_mode="r")
+        self.vocab_offsets = np.load(os.path.join(path, "vocab_offsets.npy"), mmap_mode="r")
+        self.splits = {split: NoisedSplit(self, os.path.join(path, split)) for split in self.metadata["splits"]}
+
+    def __getitem__(self, split: str) -> NoisedSplit:
+        return self.splits[split]
+
+    def token(self, token_id: int) -> str:
+        start, end = self.vocab_offsets[token_id], self.vocab_offsets[token_id + 1]
+        return self.vocab_bytes[start:end].tobytes().decode("utf-8")
+
+
+def main():
+    from datasets import DatasetDict
+
+    from .data_preprocessing import load_conll2003, build_label_maps
+    from .train import apply_profile, load_profile, seed_all
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", required=True, help="YAML file with noise steps & scopes")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out_dir", required=True)
+    ap.add_argument("--splits", nargs="+", default=["train", "validation", "test"])
+    args = ap.parse_args()
+
+    ds = load_conll2003()
+    id2label, label2id = build_label_maps(ds["train"].features, "ner_tags")
+    id2pos, _ = build_label_maps(ds["train"].features, "pos_tags")
+    profile = load_profile(args.profile)
+    seed_all(args.seed)
+    ds = apply_profile(DatasetDict(ds), profile, id2label, label2id, id2pos, track_provenance=True)
+    path = export_noised(ds, args.out_dir, profile, args.seed, id2label, id2pos, args.splits)
+    print(f"[export_noised] Wrote {', '.join(args.splits)} to {args.out_dir} ({path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Export a trained token classifier to ONNX (+ dynamic int8) and evaluate it with ONNX Runtime.
+
+    python -m src.export_onnx --model_dir outputs/<run_name> --out_dir outputs/<run_name>/onnx \
+        --eval --profiles src/profiles/baseline.yaml src/profiles/orthographic/orthographic_p0.2_test_all.yaml
+
+Evaluation runs the test split (clean or noised with each profile's token noise) through the
+fp32 PyTorch model, the fp32 ONNX model and the int8 ONNX model on CPU, and reports F1 deltas
+against PyTorch plus the speedup. Requires `onnx` and `onnxruntime`.
+"""
+import argparse
+import inspect
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from datasets import DatasetDict
+
+from .data_preprocessing import load_conll2003, build_label_maps, tokenize_and_align, tokenize_and_align_chars
+from .metrics import compute_metrics_builder
+from .predict import is_char_model, load_ner_model
+from .train import apply_profile, load_profile, seed_all
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+        return onnxruntime
+    except ImportError as e:
+        raise ImportError("ONNX export/evaluation needs `pip install onnx onnxruntime`") from e
+
+
+def export_onnx(model, tokenizer, path: str, opset: int = 17) -> List[str]:
+    """Exports with dynamic batch and sequence axes; returns the graph input names."""
+    sample = tokenizer(["EU rejects German call"], return_tensors="pt")
+    forward_args = inspect.signature(model.forward).parameters
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample and k in forward_args]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"}
+    model.eval()
+    # no_grad, not inference_mode: the tracer cannot record inference tensors
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[k] for k in input_names),
+            path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    return input_names
+
+
+def quantize_int8(fp32_path: str, int8_path: str):
+    """Dynamic (weight-only int8, activations quantized at runtime) quantization."""
+    _require_onnxruntime()
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+
+def ort_session(path: str, threads: int = 0):
+    ort = _require_onnxruntime()
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def run_logits(backend, tokenized, batch_size: int, left_padded: bool = False) -> Tuple[np.ndarray, float]:
+    """
+    Logits for the whole tokenized split, padded back to its fixed length.
+    Each batch is trimmed to its longest sequence first, so dynamic axes save work
+    (from the left for left-padding tokenizers such as XLNet's).
+    """
+    columns = [c for c in ("input_ids", "attention_mask", "token_type_ids") if c in tokenized.column_names]
+    arrays = {c: np.asarray(tokenized[c], dtype=np.int64) for c in columns}
+    n, full_len = arrays["input_ids"].shape
+    out = None
+    elapsed = 0.0
+    for i in range(0, n, batch_size):
+        batch = {c: a[i:i + batch_size] for c, a in arrays.items()}
+        seq_len = int(batch["attention_mask"].sum(axis=1).max())
+        keep = slice(full_len - seq_len, full_len) if left_padded else slice(0, seq_len)
+        batch = {c: a[:, keep] for c, a in batch.items()}
+        start = time.perf_counter()
+        logits = backend(batch)
+        elapsed += time.perf_counter() - start
+        if out is None:
+            out = np.zeros((n, full_len, logits.shape[-1]), dtype=np.float32)
+        out[i:i + len(logits), keep] = logits
+    return out, elapsed
+
+
+def torch_backend(model):
+    def run(batch):
+        with torch.inference_mode():
+            return model(**{k: torch.from_numpy(v) for k, v in batch.items()}).logits.numpy()
+    return run
+
+
+def ort_backend(session):
+    names = {i.name for i in session.get_inputs()}
+    def run(batch):
+        return session.run(["logits"], {k: v for k, v in batch.items() if k in names})[0]
+    return run
+
+
+def tokenize_test(test_split, model, tokenizer, id2label, label2id, max_length: int):
+    if is_char_model(model):
+        fn = lambda b: tokenize_and_align_chars(b, tokenizer, id2label, label2id, max_length=max_length, eval_mode=True)
+    else:
+        fn = lambda b: tokenize_and_align(b, tokenizer, label_all_tokens=False, max_length=max_length)
+    return test_split.map(fn, batched=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model_dir", required=True, help="Directory written by src.train --save_model")
+    ap.add_argument("--out_dir", default=None, help="Default: <model_dir>/onnx")
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--eval", action="store_true", help="Evaluate PyTorch vs ONNX fp32 vs ONNX int8 on the test split")
+    ap.add_argument("--profiles", nargs="+", default=["src/profiles/baseline.yaml"],
+                    help="Token noise of each profile is applied to the test split before evaluation")
+    ap.add_argument("--batch_size", type=int, default=32)
+    ap.add_argument("--max_length", type=int, default=256)
+    ap.add_argument("--threads", type=int, default=0, help="Intra-op threads for torch and ORT (0 = default)")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    out_dir = args.out_dir or os.path.join(args.model_dir, "onnx")
+    os.makedirs(out_dir, exist_ok=True)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model, tokenizer = load_ner_model(args.model_dir)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    export_onnx(model, tokenizer, fp32_path, args.opset)
+    quantize_int8(fp32_path, int8_path)
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+    print(f"[export_onnx] Wrote {fp32_path} ({os.path.getsize(fp32_path) / 2**20:.1f} MB) and "
+          f"{int8_path} ({os.path.getsize(int8_path) / 2**20:.1f} MB)")
+    if not args.eval:
+        return
+
+    clean_ds = load_conll2003()
+    id2label, label2id = build_label_maps(clean_ds["train"].features, "ner_tags")
+    id2pos, _ = build_label_maps(clean_ds["train"].features, "pos_tags")
+    compute_metrics = compute_metrics_builder(id2label)
+    backends = {
+        "torch_fp32": torch_backend(model),
+        "onnx_fp32": ort_backend(ort_session(fp32_path, args.threads)),
+        "onnx_int8": ort_backend(ort_session(int8_path, args.threads)),
+    }
+
+    report: Dict[str, Dict] = {}
+    for path in args.profiles:
+        profile = load_profile(path)
+        profile = dict(profile, scope={"token_noise": ["test"], "label_noise": []}, label_noise=None)
+        seed_all(args.seed)
+        ds = apply_profile(DatasetDict(clean_ds), profile, id2label, label2id, id2pos)
+        tokenized = tokenize_test(ds["test"], model, tokenizer, id2label, label2id, args.max_length)
+        labels = np.asarray(tokenized["labels"])
+
+        name = os.path.basename(path).replace(".yaml", "")
+        report[name] = {}
+        for backend_name, backend in backends.items():
+            logits, seconds = run_logits(backend, tokenized, args.batch_size, tokenizer.padding_side == "left")
+            metrics = compute_metrics((logits, labels))
+            report[name][backend_name] = {"f1": metrics["f1"], "seconds": seconds, "metrics": metrics}
+        ref = report[name]["torch_fp32"]
+        for backend_name, r in report[name].items():
+            r["f1_delta"] = r["f1"] - ref["f1"]
+            r["speedup"] = ref["seconds"] / r["seconds"]
+            print(f"[export_onnx] {name:<40} {backend_name:<10} f1={r['f1']:.4f} "
+                  f"({r['f1_delta']:+.4f}) {r['seconds']:.1f}s x{r['speedup']:.2f}")
+
+    with open(os.path.join(out_dir, "onnx_eval.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,18 +7,83 @@ from seqeval.metrics.sequence_labeling import get_entities
 seqeval_metric = evaluate.load("seqeval", keep_in_memory=True)
 
 
-def compute_metrics_builder(id2label):
+def merge_word_predictions(predictions, labels, example_ids, word_ids, id2label):
+    """
+    Re-assembles word-level tag sequences from rows that cover parts of a sentence
+    (strided windows) or several sentences (packing).
+
+    word_ids marks the scored position of each word (-100 elsewhere); example_ids gives the
+    source sentence per row (shape [rows]) or per position (shape [rows, seq_len]).
+    Logits of the same (sentence, word) are summed across rows before the argmax; the label
+    is taken from its first occurrence. Returns (true_predictions, true_labels), one
+    sequence per sentence in sentence order.
+    """
+    word_ids = np.asarray(word_ids)
+    example_ids = np.asarray(example_ids)
+    if example_ids.ndim == 1:
+        example_ids = np.broadcast_to(example_ids[:, None], word_ids.shape)
+    mask = word_ids != -100
+    if not mask.any():
+        return [], []
+
+    ex, w = example_ids[mask], word_ids[mask]
+    logits, labs = predictions[mask], labels[mask]
+    order = np.lexsort((w, ex))
+    ex, w, logits, labs = ex[order], w[order], logits[order], labs[order]
+
+    first = np.ones(len(ex), dtype=bool)
+    first[1:] = (ex[1:] != ex[:-1]) | (w[1:] != w[:-1])
+    starts = np.flatnonzero(first)
+    pred_ids = np.add.reduceat(logits, starts, axis=0).argmax(-1)
+    label_ids = labs[starts]
+    sent_bounds = np.flatnonzero(ex[starts][1:] != ex[starts][:-1]) + 1
+
+    tags = np.array([id2label[i] for i in range(len(id2label))], dtype=object)
+    true_predictions = [tags[p].tolist() for p in np.split(pred_ids, sent_bounds)]
+    true_labels = [tags[l].tolist() for l in np.split(label_ids, sent_bounds)]
+    return true_predictions, true_labels
+
+
+def compact_labels(labels, width: int):
+    """Labels at the scored positions, left-aligned and padded with -100 to `width` (see char_compact.gather_label_logits)."""
+    mask = labels != -100
+    order = np.argsort(~mask, axis=1, kind="stable")[:, :width]
+    out = np.take_along_axis(labels, order, axis=1)
+    out[np.arange(out.shape[1])[None, :] >= mask.sum(1)[:, None]] = -100
+    return out
+
+
+def word_level_predictions(predictions, labels, id2label, word_index=None, compact: bool = False):
+    """
+    (true_predictions, true_labels): tag sequences of the scored positions, one per sentence.
+    predictions are logits; word_index and compact as in compute_metrics_builder.
+    """
+    if compact:
+        labels = compact_labels(labels, predictions.shape[1])
+    if word_index is not None:
+        return merge_word_predictions(predictions, labels, *word_index, id2label)
+    predictions = np.argmax(predictions, axis=2)
+    true_predictions = [
+        [id2label[p] for (p, l) in zip(prediction, label) if l != -100]
+        for prediction, label in zip(predictions, labels)
+    ]
+    true_labels = [
+        [id2label[l] for (p, l) in zip(prediction, label) if l != -100]
+        for prediction, label in zip(predictions, labels)
+    ]
+    return true_predictions, true_labels
+
+
+def compute_metrics_builder(id2label, word_index=None, compact: bool = False):
+    """
+    Builds the Trainer compute_metrics function.
+    word_index: optional (example_ids, word_ids) of the evaluated dataset when its rows are
+    windows or packed sentences; predictions are then merged per word first.
+    compact: predictions hold only the logits at labeled positions (char_compact.gather_label_logits).
+    """
     def _compute(p):
         predictions, labels = p
-        predictions = np.argmax(predictions, axis=2)
-        true_predictions = [
-            [id2label[p] for (p, l) in zip(prediction, label) if l != -100]
-            for prediction, label in zip(predictions, labels)
-        ]
-        true_labels = [
-            [id2label[l] for (p, l) in zip(prediction, label) if l != -100]
-            for prediction, label in zip(predictions, labels)
-        ]
+        true_predictions, true_labels = word_level_predictions(predictions, labels, id2label, word_index, compact)
         results = seqeval_metric.compute(predictions=true_predictions, references=true_labels)
         metrics = {
             "precision": results["overall_precision"],
@@ -66,4 +131,25 @@ def compute_metrics_builder(id2label):
             metrics[f"f1_{t}"]        = f1
 
         return metrics
-    return _compute
\ No newline at end of file
+    return _compute
+
+def summarize_realizations(runs, confidence: float = 0.95):
+    """
+    Mean, sample std and Student-t confidence interval half-width of each metric across
+    evaluations on independently noised realizations of a split (list of metric dicts).
+    A metric missing from some evaluations (e.g. an entity type absent from a realization) is
+    summarized over the evaluations that have it; `n` is that count.
+    """
+    from scipy.stats import t as student_t
+
+    keys = list(dict.fromkeys(key for r in runs for key in r))
+    summary = {}
+    for key in keys:
+        if key in ("runtime", "samples_per_second", "steps_per_second"):
+            continue
+        values = np.array([r[key] for r in runs if key in r], dtype=float)
+        n = len(values)
+        std = float(values.std(ddof=1)) if n > 1 else 0.0
+        half = float(student_t.ppf((1 + confidence) / 2, n - 1) * std / np.sqrt(n)) if n > 1 else 0.0
+        summary[key] = {"mean": float(values.mean()), "std": std, "ci": half, "n": n}
+    return summary
@@ -1 +1 @@
-from .registry import TOKEN_NOISE, LABEL_NOISE
\ No newline at end of file
+from .registry import TOKEN_NOISE, LABEL_NOISE, BATCHED_TOKEN_NOISE
\ No newline at end of file
@@ -0,0 +1,113 @@
+import difflib
+import json
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+# Active profiler; None means instrumentation is off. Noise functions read this once per
+# call, so the disabled path costs a single attribute lookup.
+PROFILER: Optional["NoiseOpProfiler"] = None
+
+perf_counter = time.perf_counter
+
+
+def _op_stats():
+    return {"chosen": 0, "noop": 0, "retries": 0, "fallbacks": 0, "seconds": 0.0}
+
+
+def _call_stats():
+    return {"calls": 0, "tokens": 0, "changed": 0, "seconds": 0.0, "events": defaultdict(int),
+            "ops": defaultdict(_op_stats)}
+
+
+class NoiseOpProfiler:
+    """
+    Aggregates, per noise function and per op:
+      - how often the op was chosen and how often it was a no-op,
+      - retries (label noise) and fallbacks (semantic noise),
+      - total time spent,
+    plus the realized token change rate per noise function.
+    Results are grouped by section (e.g. the split being mapped).
+    """
+
+    def __init__(self):
+        self.section = "all"
+        self.stats: Dict[str, Dict[str, dict]] = defaultdict(lambda: defaultdict(_call_stats))
+
+    def begin(self, section: str):
+        self.section = section
+
+    def record_op(self, family: str, op: str, noop: bool, seconds: float, retry: bool = False, fallback: bool = False):
+        s = self.stats[self.section][family]["ops"][op]
+        s["chosen"] += 1
+        s["noop"] += noop
+        s["retries"] += retry
+        s["fallbacks"] += fallback
+        s["seconds"] += seconds
+
+    def record_call(self, family: str, n_tokens: int, n_changed: int, seconds: float):
+        s = self.stats[self.section][family]
+        s["calls"] += 1
+        s["tokens"] += n_tokens
+        s["changed"] += n_changed
+        s["seconds"] += seconds
+
+    def record_event(self, family: str, name: str):
+        self.stats[self.section][family]["events"][name] += 1
+
+    def summary(self) -> Dict[str, Dict[str, dict]]:
+        out = {}
+        for section, families in self.stats.items():
+            out[section] = {}
+            for family, s in families.items():
+                ops = {}
+                for op, o in sorted(s["ops"].items(), key=lambda kv: -kv[1]["seconds"]):
+                    ops[op] = dict(o)
+                    ops[op]["noop_rate"] = o["noop"] / o["chosen"] if o["chosen"] else 0.0
+                    ops[op]["mean_us"] = 1e6 * o["seconds"] / o["chosen"] if o["chosen"] else 0.0
+                out[section][family] = {
+                    "calls": s["calls"],
+                    "tokens": s["tokens"],
+                    "changed": s["changed"],
+                    "change_rate": s["changed"] / s["tokens"] if s["tokens"] else 0.0,
+                    "seconds": s["seconds"],
+                    "events": dict(s["events"]),
+                    "ops": ops,
+                }
+        return out
+
+    def print_summary(self):
+        for section, families in self.summary().items():
+            for family, s in families.items():
+                print(f"[noise-ops] {section}/{family}: {s['calls']} calls, change rate {s['change_rate']:.4f}, "
+                      f"{s['seconds']:.2f}s {s['events'] or ''}")
+                for op, o in s["ops"].items():
+                    print(f"[noise-ops]   {op:<24} chosen={o['chosen']:<8} noop={o['noop_rate']:6.1%} "
+                          f"retries={o['retries']:<6} fallbacks={o['fallbacks']:<6} "
+                          f"total={o['seconds']:8.3f}s mean={o['mean_us']:9.1f}us")
+
+    def export(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def enable_profiling() -> NoiseOpProfiler:
+    """Installs a fresh profiler and returns it."""
+    global PROFILER
+    PROFILER = NoiseOpProfiler()
+    return PROFILER
+
+
+def disable_profiling() -> Optional[NoiseOpProfiler]:
+    """Removes the active profiler and returns it (with its collected stats)."""
+    global PROFILER
+    prof, PROFILER = PROFILER, None
+    return prof
+
+
+def count_changed(before, after) -> int:
+    """Number of positions that differ; aligned via edit operations when lengths differ."""
+    if len(before) == len(after):
+        return sum(a != b for a, b in zip(before, after))
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
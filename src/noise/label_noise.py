@@ -2,6 +2,7 @@ import random
 from dataclasses import dataclass
 from typing import List, Dict
 from .utils import protect_token
+from . import instrumentation
 
 @dataclass
 class Span:
@@ -59,29 +60,29 @@ def apply_label_noise_on_spans(
     # O-token indices (for potential new entities)
     O_idxs = [i for i, l in enumerate(labels) if l == "O" and not protect_token(tokens[i])]
 
+    prof = instrumentation.PROFILER
+
     for idx in change_idxs:
         s = spans[idx]
         success = False
 
-        for _ in range(max_retries):
+        for attempt in range(max_retries):
             op = random.choice(ops)
+            start = instrumentation.perf_counter() if prof is not None else 0.0
 
             if op == "shorten" and (s.end - s.start) >= 1:
                 labels[s.end] = "O"
                 success = True
-                break
 
             elif op == "extend" and s.end + 1 < len(labels) and labels[s.end + 1] == "O":
                 if not protect_token(tokens[s.end + 1]):
                     labels[s.end + 1] = f"I-{s.etype}"
                     success = True
-                    break
 
             elif op == "replace_O":
                 for k in range(s.start, s.end + 1):
                     labels[k] = "O"
                 success = True
-                break
 
             elif op == "other_class":
                 other_types = [t for t in etypes if t != s.etype]
@@ -91,24 +92,29 @@ def apply_label_noise_on_spans(
                     for k in range(s.start + 1, s.end + 1):
                         labels[k] = f"I-{new_type}"
                     success = True
-                    break
 
             elif op == "token_to_entity" and O_idxs:
                 valid_O_idxs = [i for i in O_idxs if not protect_token(tokens[i])]
-                if not valid_O_idxs:
-                    continue
-                i = random.choice(valid_O_idxs)
-                O_idxs.remove(i)
-                new_type = random.choice(etypes)
-                labels[i] = f"B-{new_type}"
-                # random extend
-                if i + 1 < len(labels) and labels[i + 1] == "O" and not protect_token(tokens[i + 1]) and random.random() < 0.5:
-                    labels[i + 1] = f"I-{new_type}"
-                success = True
+                if valid_O_idxs:
+                    i = random.choice(valid_O_idxs)
+                    O_idxs.remove(i)
+                    new_type = random.choice(etypes)
+                    labels[i] = f"B-{new_type}"
+                    # random extend
+                    if i + 1 < len(labels) and labels[i + 1] == "O" and not protect_token(tokens[i + 1]) and random.random() < 0.5:
+                        labels[i + 1] = f"I-{new_type}"
+                    success = True
+
+            if prof is not None:
+                prof.record_op("apply_label_noise_on_spans", op, not success,
+                               instrumentation.perf_counter() - start, retry=attempt > 0)
+            if success:
                 break
 
         if not success:
             # Couldn’t apply any op
+            if prof is not None:
+                prof.record_event("apply_label_noise_on_spans", "gave_up")
             continue
 
     return [label2id[l] for l in labels]
\ No newline at end of file
@@ -1,7 +1,10 @@
 import random
 import unicodedata
 from typing import List, Dict
-from .utils import neighbors, protect_token, DIACRITICS_CHAR_MAP, ASCII_HOMOGLYPHS
+import numpy as np
+from .utils import neighbors, DIACRITICS_CHAR_MAP, ASCII_HOMOGLYPHS
+from . import instrumentation
+from .vocab import VOCAB, entity_mask
 
 # Base typo ops
 def swap_adjacent(word: str) -> str:
@@ -89,29 +92,30 @@ def typo_tokens(tokens: List[str], ner_tags: List[int], id2label: Dict[int, str]
             random_case_flip,
             substitute_homoglyph
         ]
-    # Collect candidate indices for modification
-    idxs = []
-    for i, (tok, tag_id) in enumerate(zip(tokens, ner_tags)):
-        if protect_token(tok):
-            continue
-
-        lab = id2label[tag_id]
-        is_entity = lab.startswith("B-") or lab.startswith("I-")
-        if entity_strategy == "protect" and is_entity:
-            continue
-        if entity_strategy == "entities_only" and not is_entity:
-            continue
-        idxs.append(i)
+    # Collect candidate indices for modification (per-type attributes from the interned vocab)
+    allowed = ~VOCAB.protected[VOCAB.intern(tokens)]
+    if entity_strategy == "protect":
+        allowed &= ~entity_mask(ner_tags, id2label)
+    elif entity_strategy == "entities_only":
+        allowed &= entity_mask(ner_tags, id2label)
+    idxs = np.flatnonzero(allowed).tolist()
     k = max(0, int(round(len(idxs) * p)))
     if k == 0:
         return tokens
     change = set(random.sample(idxs, k))
+    prof = instrumentation.PROFILER
     out = []
     for i, tok in enumerate(tokens):
         # Apply a random typo operation to selected tokens
         if i in change:
             op = random.choice(ops)
-            out.append(op(tok))
+            if prof is None:
+                out.append(op(tok))
+            else:
+                start = instrumentation.perf_counter()
+                new_tok = op(tok)
+                prof.record_op("typo_tokens", op.__name__, new_tok == tok, instrumentation.perf_counter() - start)
+                out.append(new_tok)
         else:
             out.append(tok)
     return out
\ No newline at end of file
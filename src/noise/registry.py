@@ -1,6 +1,6 @@
 from typing import Callable, Dict, Any
 from .orthographic import typo_tokens, random_case_flip, strip_diacritics
-from .semantic import semantic_noise
+from .semantic import semantic_noise, semantic_noise_batch
 from .label_noise import apply_label_noise_on_spans
 from .syntactic import punct_insert, punct_delete, whitespace_merge, syntactic_noise
 
@@ -18,4 +18,9 @@ TOKEN_NOISE: Dict[str, Callable] = {
 
 LABEL_NOISE: Dict[str, Callable] = {
     "apply_label_noise_on_spans": apply_label_noise_on_spans, # args: tokens, ner_tags, id2label, label2id, p
-}
\ No newline at end of file
+}
+
+# Batch-level implementations (lists of sentences in, list out) used by batched noise mapping
+BATCHED_TOKEN_NOISE: Dict[str, Callable] = {
+    "semantic_noise": semantic_noise_batch,         # args: batch_tokens, batch_pos_tags, batch_ner_tags, id2label, p, ops, entity_strategy, model_path
+}
@@ -0,0 +1,38 @@
+"""
+Batched weighted sampling without replacement.
+
+Exponential keys (equivalently Gumbel-top-k): each item gets key E / w with E ~ Exp(1); the k
+smallest keys of a segment, in key order, are distributed exactly like k successive weighted
+draws without replacement, i.e. like np.random.choice(items, k, replace=False, p=w / w.sum()).
+All segments of a batch are handled with one RNG call and one sort.
+"""
+from typing import Sequence
+
+import numpy as np
+
+
+def segment_offsets(lengths: Sequence[int]) -> np.ndarray:
+    """[n_segments + 1] start offsets of consecutive segments in a flat array."""
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+
+def weighted_topk_segments(weights: np.ndarray, offsets: np.ndarray, k: np.ndarray, rng=None) -> np.ndarray:
+    """
+    Flat indices of k[s] items drawn without replacement from each segment s
+    (items offsets[s]:offsets[s+1], probability proportional to `weights`).
+    Returned grouped by segment, each group in draw order. k is clipped to the segment size.
+    Uses the global np.random state unless `rng` (a np.random.Generator) is given.
+    """
+    weights = np.asarray(weights, dtype=float)
+    n = len(weights)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    u = rng.random(n) if rng is not None else np.random.random_sample(n)
+    keys = -np.log1p(-u) / weights  # Exp(1) / w; zero weights get +inf and are never chosen before others
+
+    lengths = np.diff(offsets)
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    order = np.lexsort((keys, segment))
+    rank = np.arange(n) - offsets[segment[order]]
+    keep = rank < np.minimum(np.asarray(k), lengths)[segment[order]]
+    return order[keep]
@@ -6,42 +6,36 @@ from collections import defaultdict
 
 import nltk
 nltk.download('wordnet')
-from nltk.corpus import wordnet
-from nltk.stem import WordNetLemmatizer
 from .utils import (
     penn_to_wordnet,
-    protect_token,
     load_static_embedding_model,
-    load_contextual_embedding_model
+    load_contextual_embedding_model,
+    ensure_wordnet,
+)
+from . import instrumentation
+from .sampling import segment_offsets, weighted_topk_segments
+from .vocab import (
+    VOCAB,
+    antonym_candidates,
+    embedding_candidates,
+    entity_mask,
+    lemma,
+    pos_weight,
+    synonym_candidates,
 )
 
 def get_synonym_for_token(token: str, pos_tag: str, min_diff: float = 0.7) -> str:
     """Finds a synonym for a single token given its part-of-speech tag."""
-    lemmatizer = WordNetLemmatizer()
     wn_pos = penn_to_wordnet(pos_tag)
     if not wn_pos:
         return token
 
-    lemma = lemmatizer.lemmatize(token.lower(), pos=wn_pos)
-    synsets = wordnet.synsets(lemma, pos=wn_pos)
-    if not synsets:
-        return token
-
-    base_syn = synsets[0]  # use most frequent sense as reference
-    candidates = set()
-
-    for syn in synsets:
-        sim = base_syn.wup_similarity(syn) or 0.0
-        if sim < min_diff:  # keep only semantically distant synsets
-            for l in syn.lemmas():
-                cand = l.name().replace("_", " ")
-                if cand.lower() != lemma:
-                    candidates.add(cand)
-
+    # candidates depend only on (lemma, POS): computed once per type
+    candidates = synonym_candidates(lemma(token.lower(), wn_pos), wn_pos, min_diff)
     if not candidates:
         return token
 
-    replacement = random.choice(list(candidates))
+    replacement = random.choice(candidates)
     if token.istitle():
         replacement = replacement.title()
     elif token.isupper():
@@ -50,17 +44,9 @@ def get_synonym_for_token(token: str, pos_tag: str, min_diff: float = 0.7) -> st
 
 def get_word_embedding_for_token(token: str, model: Any) -> str:
     """Finds a replacement for a single token using static embeddings."""
-    try:
-        # Use`most_similar` from the loaded gensim model
-        similar_words = model.most_similar(token.lower(), topn=30)
-        candidates = [w for w, sim in similar_words if w.strip()]
-        if len(candidates) > 10:
-            # skip the top 10 most similar (too close)
-            candidates = candidates[10:]
-        if candidates:
-            return random.choice(candidates)
-    except KeyError: # Happens if the word is not in the vocabulary
-        return token
+    candidates = embedding_candidates(token.lower(), model)
+    if candidates:
+        return random.choice(candidates)
     return token
 
 
@@ -104,23 +90,15 @@ def get_contextual_substitutions(new_tokens: List[str], original_tokens: List[st
 
 def get_antonym_for_token(token: str, pos_tag: str) -> str:
     """Finds an antonym for a given token using WordNet."""
-    lemmatizer = WordNetLemmatizer()
     wn_pos = penn_to_wordnet(pos_tag)
     if not wn_pos:
         return token
 
-    lemma = lemmatizer.lemmatize(token.lower(), pos=wn_pos)
-    antonyms = set()
-
-    for syn in wordnet.synsets(lemma, pos=wn_pos):
-        for l in syn.lemmas():
-            for ant in l.antonyms():
-                antonyms.add(ant.name().replace("_", " "))
-
+    antonyms = antonym_candidates(lemma(token.lower(), wn_pos), wn_pos)
     if not antonyms:
         return token
 
-    replacement = random.choice(list(antonyms))
+    replacement = random.choice(antonyms)
     if token.istitle():
         replacement = replacement.title()
     elif token.isupper():
@@ -135,6 +113,34 @@ def preserve_case(original: str, replacement: str) -> str:
         return replacement.upper()
     return replacement
 
+def semantic_candidates(
+    tokens: List[str],
+    pos_tags: List[str],
+    ner_tags: List[int],
+    id2label: Dict[int, str],
+    entity_strategy: str = "protect",
+):
+    """Positions eligible for semantic noise and their POS-class sampling weights."""
+    # candidate filtering on interned ids: per-type attributes are looked up, not recomputed
+    ids = VOCAB.intern(tokens)
+    allowed = ~VOCAB.protected[ids]
+    if entity_strategy == "protect":
+        # Skip entities entirely
+        allowed &= ~entity_mask(ner_tags, id2label)
+    elif entity_strategy == "entities_only":
+        # Only allow entities to be candidates
+        allowed &= entity_mask(ner_tags, id2label)
+    candidates = np.flatnonzero(allowed)
+
+    # Weight content words higher
+    weights = np.fromiter((pos_weight(pos_tags[i]) for i in candidates), dtype=float, count=len(candidates))
+    return candidates, weights
+
+def semantic_k(n: int, n_candidates: int, p: float) -> int:
+    """Number of positions semantic_noise changes in a sentence of n tokens."""
+    k = max(1, int(round(n * p)))
+    return min(k, n_candidates)  # avoid selecting more than available candidates
+
 def semantic_noise(
     tokens: List[str], 
     pos_tags: List[str], 
@@ -143,10 +149,12 @@ def semantic_noise(
     p: float, 
     ops: List[str] = None,
     entity_strategy: str = "protect",
+    chosen: List[int] = None,
     **kwargs
 ) -> List[str]:
     """
     Applies a mix of semantic operations.
+    `chosen` skips position sampling (used by semantic_noise_batch).
     """
     if ops is None or len(ops) == 0:
         ops = ["synonym", "word_embs","antonym", "contextual"]
@@ -159,46 +167,20 @@ def semantic_noise(
     new_tokens = list(tokens)
     n = len(tokens)
 
-    candidates = []
-    weights = []
-
-    for i, tok in enumerate(tokens):
-        if protect_token(tok):
-            continue
-        
-        label = id2label[ner_tags[i]]
-        is_entity = label.startswith("B-") or label.startswith("I-")
-
-        # --- Entity strategy control ---
-        if entity_strategy == "protect" and is_entity:
-            # Skip entities entirely
-            continue
-        if entity_strategy == "entities_only" and not is_entity:
-            # Only allow entities to be candidates
-            continue
-
-        # Add to candidate list
-        candidates.append(i)
-
-        # Weight content words higher
-        if pos_tags[i].startswith(("N", "V", "J", "R")):
-            weights.append(3.0)
-        elif pos_tags[i].startswith(("P", "C", "I", "D")):
-            weights.append(1.5)
-        else:
-            weights.append(1.0)
-
-    if not candidates:
+    if chosen is not None:
+        chosen_candidates = chosen
+    else:
+        candidates, weights = semantic_candidates(tokens, pos_tags, ner_tags, id2label, entity_strategy)
+        if len(candidates) == 0:
+            return tokens
+        k = semantic_k(n, len(candidates), p)
+        probs = weights / weights.sum()
+        chosen_candidates = np.random.choice(candidates, size=k, replace=False, p=probs)
+    if len(chosen_candidates) == 0:
         return tokens
-    
-    k = max(1, int(round(n * p)))
-    k = min(k, len(candidates))  # avoid selecting more than available candidates
-
-    weights = np.array(weights)
-    probs = weights / weights.sum()
-
-    chosen_candidates = np.random.choice(candidates, size=k, replace=False, p=probs)
 
+    if any(op in ["synonym", "antonym"] for op in ops):
+        ensure_wordnet()  # waits if a prefetch thread is loading it
     need_static_model = any(op in ["word_embs", "synonym", "antonym"] for op in ops)
     static_model = None
     if need_static_model:
@@ -211,34 +193,90 @@ def semantic_noise(
         grouped_ops[op_name].append(idx)
 
     
+    prof = instrumentation.PROFILER
+
     if "synonym" in grouped_ops:
         for i in grouped_ops["synonym"]:
+            start = instrumentation.perf_counter() if prof is not None else 0.0
             replacement = get_synonym_for_token(new_tokens[i], pos_tags[i], min_diff=0.5)
-            if replacement == new_tokens[i]:
+            fallback = replacement == new_tokens[i]
+            if fallback:
                 #Fallback: try embedding-based replacement if synonym failed
                 replacement = get_word_embedding_for_token(new_tokens[i], static_model)
             new_tokens[i] = preserve_case(new_tokens[i], replacement)
+            if prof is not None:
+                prof.record_op("semantic_noise", "synonym", new_tokens[i] == tokens[i],
+                               instrumentation.perf_counter() - start, fallback=fallback)
 
     if "antonym" in grouped_ops:
         for i in grouped_ops["antonym"]:
+            start = instrumentation.perf_counter() if prof is not None else 0.0
             replacement = get_antonym_for_token(new_tokens[i], pos_tags[i])
+            fallback = replacement == new_tokens[i] and static_model is not None
             #Fallback: use embedding-based replacement if no antonym found
-            if replacement == new_tokens[i] and static_model is not None:
+            if fallback:
                 replacement = get_word_embedding_for_token(new_tokens[i], static_model)
             new_tokens[i] = preserve_case(new_tokens[i], replacement)
+            if prof is not None:
+                prof.record_op("semantic_noise", "antonym", new_tokens[i] == tokens[i],
+                               instrumentation.perf_counter() - start, fallback=fallback)
     
     if "word_embs" in grouped_ops:
         for i in grouped_ops["word_embs"]:
+            start = instrumentation.perf_counter() if prof is not None else 0.0
             replacement = get_word_embedding_for_token(new_tokens[i], static_model)
             new_tokens[i] = preserve_case(new_tokens[i], replacement)
+            if prof is not None:
+                prof.record_op("semantic_noise", "word_embs", new_tokens[i] == tokens[i],
+                               instrumentation.perf_counter() - start)
             
     # Process the expensive contextual operation in a single, efficient batch
     if "contextual" in grouped_ops:
+        start = instrumentation.perf_counter() if prof is not None else 0.0
         new_tokens = get_contextual_substitutions(
             new_tokens=new_tokens,
             original_tokens=tokens,
             indices=grouped_ops["contextual"],
             model_name=kwargs.get("model_name", "albert-base-v2")
         )
+        if prof is not None:
+            # one batched call; spread its cost over the substituted positions
+            per_index = (instrumentation.perf_counter() - start) / len(grouped_ops["contextual"])
+            for i in grouped_ops["contextual"]:
+                prof.record_op("semantic_noise", "contextual", new_tokens[i] == tokens[i], per_index)
     
-    return new_tokens
\ No newline at end of file
+    return new_tokens
+
+
+def semantic_noise_batch(
+    batch_tokens: List[List[str]],
+    batch_pos_tags: List[List[str]],
+    batch_ner_tags: List[List[int]],
+    id2label: Dict[int, str],
+    p: float,
+    ops: List[str] = None,
+    entity_strategy: str = "protect",
+    **kwargs
+) -> List[List[str]]:
+    """
+    semantic_noise for a batch of sentences: positions are drawn for all sentences at once with
+    exponential-key weighted sampling (same distribution as the per-sentence np.random.choice,
+    different RNG stream), then each sentence's replacements are applied as in semantic_noise.
+    """
+    per_sentence = [semantic_candidates(t, pos, ner, id2label, entity_strategy)
+                    for t, pos, ner in zip(batch_tokens, batch_pos_tags, batch_ner_tags)]
+    lengths = [len(c) for c, _ in per_sentence]
+    offsets = segment_offsets(lengths)
+    k = np.array([semantic_k(len(t), n_cand, p) for t, n_cand in zip(batch_tokens, lengths)], dtype=np.int64)
+    flat_candidates = np.concatenate([c for c, _ in per_sentence]) if per_sentence else np.zeros(0, dtype=np.int64)
+    flat_weights = np.concatenate([w for _, w in per_sentence]) if per_sentence else np.zeros(0)
+    picked = weighted_topk_segments(flat_weights, offsets, k)
+    sentence_of = np.searchsorted(offsets, picked, side="right") - 1
+    bounds = np.searchsorted(sentence_of, np.arange(len(batch_tokens) + 1))
+
+    out = []
+    for s, tokens in enumerate(batch_tokens):
+        chosen = flat_candidates[picked[bounds[s]:bounds[s + 1]]]
+        out.append(semantic_noise(tokens, batch_pos_tags[s], batch_ner_tags[s], id2label, p, ops=ops,
+                                  entity_strategy=entity_strategy, chosen=chosen, **kwargs))
+    return out
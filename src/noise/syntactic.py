@@ -1,5 +1,6 @@
 import random
 from typing import List, Tuple, Dict, Callable
+from . import instrumentation
 
 # Simple punctuation perturbations
 def punct_insert(tokens: List[str], labels: List[int], o_label: int = None, p: float = 0.05) -> List[str]:
@@ -96,6 +97,7 @@ def syntactic_noise(
     change = set(random.sample(range(n), k))
     additional_params = {"o_label": o_label, "id2label": id2label, "label2id": label2id}
     out_tokens, out_labels = tokens[:], labels[:]
+    prof = instrumentation.PROFILER
     i = 0
 
     while i < len(tokens):
@@ -103,7 +105,15 @@ def syntactic_noise(
 
         if apply_here:
             op = random.choice(ops)
-            out_tokens, out_labels, i = op(out_tokens, out_labels, i, **additional_params)
+            if prof is None:
+                out_tokens, out_labels, i = op(out_tokens, out_labels, i, **additional_params)
+            else:
+                # ops return their input lists unchanged when they are a no-op
+                start = instrumentation.perf_counter()
+                prev_tokens = out_tokens
+                out_tokens, out_labels, i = op(out_tokens, out_labels, i, **additional_params)
+                prof.record_op("syntactic_noise", op.__name__, out_tokens is prev_tokens,
+                               instrumentation.perf_counter() - start)
         else:
             i += 1
     return out_tokens, out_labels
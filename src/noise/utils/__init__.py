@@ -5,6 +5,7 @@ from .model_loader import (
     LOADED_MODELS,
     load_static_embedding_model,
     load_contextual_embedding_model,
+    ensure_wordnet,
 )
 
 __all__ = [
@@ -15,5 +16,6 @@ __all__ = [
     "LOADED_MODELS",
     "load_static_embedding_model",
     "load_contextual_embedding_model",
+    "ensure_wordnet",
     "protect_token",
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
-from typing import Dict, Any
+import threading
+from typing import Callable, Dict, Any
 from transformers import pipeline
 import torch
 import gensim.downloader as api
@@ -6,18 +7,40 @@ import gensim.downloader as api
 # model cache
 LOADED_MODELS: Dict[str, Any] = {}
 
+# one lock per cache key: a caller that needs a model another thread is loading waits for it
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+def _load_once(key: str, loader: Callable[[], Any]):
+    if key in LOADED_MODELS:
+        return LOADED_MODELS[key]
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        if key not in LOADED_MODELS:
+            LOADED_MODELS[key] = loader()
+    return LOADED_MODELS[key]
+
 def load_static_embedding_model(model_path: str):
     """Loads a static embedding model (e.g., GloVe) and caches it."""
-    if model_path not in LOADED_MODELS:
+    def load():
         print(f"Loading static embedding model: {model_path}")
-        LOADED_MODELS[model_path] = api.load(model_path)
-    return LOADED_MODELS[model_path]
+        return api.load(model_path)
+    return _load_once(model_path, load)
 
 def load_contextual_embedding_model(model_name: str):
     """Loads a Masked-Language-Model from Hugging Face and caches it."""
-    if model_name not in LOADED_MODELS:
+    def load():
         print(f"Loading contextual model: {model_name}")
         # Use GPU if available
         device = 0 if torch.cuda.is_available() else -1
-        LOADED_MODELS[model_name] = pipeline('fill-mask', model=model_name, device=device, top_k=30)
-    return LOADED_MODELS[model_name]
\ No newline at end of file
+        return pipeline('fill-mask', model=model_name, device=device, top_k=30)
+    return _load_once(model_name, load)
+
+def ensure_wordnet():
+    """Loads the WordNet corpus once (nltk loads it lazily and not thread-safely on first access)."""
+    def load():
+        from nltk.corpus import wordnet
+        wordnet.ensure_loaded()
+        return wordnet
+    return _load_once("wordnet", load)
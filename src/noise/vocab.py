@@ -0,0 +1,144 @@
+"""
+Interned token vocabulary for the noise layer.
+
+Sentences are mapped to integer id arrays; per-type attributes (protected, punctuation,
+title/upper case) are computed once when a type is first seen and looked up with array
+indexing afterwards. Lemmas and the WordNet / embedding candidate lists used by
+semantic_noise are cached per type as well, so repeated words cost a dict lookup.
+Candidate lists keep the order the uncached code produced, so sampling from them with the
+same RNG state gives the same replacements.
+
+Typo noise keeps creating new types, so all caches are bounded: the vocabulary starts over once
+it holds MAX_TYPES types (ids are only used within one call), the per-type lru caches keep the
+most recent CACHE_SIZE entries, and embedding candidates are cached per model object (dropped
+with the model) up to CACHE_SIZE words.
+"""
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from nltk.corpus import wordnet
+from nltk.stem import WordNetLemmatizer
+
+from .utils.text_utils import is_punct, protect_token
+
+_LEMMATIZER = WordNetLemmatizer()
+
+MAX_TYPES = 1_000_000
+CACHE_SIZE = 1 << 18
+
+
+class Vocab:
+    """Grows on demand; attribute arrays are indexed by token id. Ids are valid until the next intern()."""
+
+    def __init__(self, max_types: int = MAX_TYPES):
+        self.max_types = max_types
+        self.clear()
+
+    def clear(self):
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self._capacity = 1024
+        self.protected = np.zeros(self._capacity, dtype=bool)
+        self.punct = np.zeros(self._capacity, dtype=bool)
+        self.title = np.zeros(self._capacity, dtype=bool)
+        self.upper = np.zeros(self._capacity, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def _add(self, tok: str) -> int:
+        i = len(self.tokens)
+        if i == self._capacity:
+            self._capacity *= 2
+            for name in ("protected", "punct", "title", "upper"):
+                grown = np.zeros(self._capacity, dtype=bool)
+                grown[:i] = getattr(self, name)
+                setattr(self, name, grown)
+        self.ids[tok] = i
+        self.tokens.append(tok)
+        self.protected[i] = protect_token(tok)
+        self.punct[i] = is_punct(tok)
+        self.title[i] = tok.istitle()
+        self.upper[i] = tok.isupper()
+        return i
+
+    def intern(self, tokens: List[str]) -> np.ndarray:
+        if len(self.tokens) + len(tokens) > self.max_types:
+            self.clear()
+        ids = self.ids
+        return np.fromiter((ids[t] if t in ids else self._add(t) for t in tokens), dtype=np.int64, count=len(tokens))
+
+
+VOCAB = Vocab()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def lemma(lower: str, wn_pos: str) -> str:
+    return _LEMMATIZER.lemmatize(lower, pos=wn_pos)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def synonym_candidates(lemma_: str, wn_pos: str, min_diff: float) -> Tuple[str, ...]:
+    """Lemmas of synsets whose Wu-Palmer similarity to the most frequent sense is below min_diff."""
+    synsets = wordnet.synsets(lemma_, pos=wn_pos)
+    if not synsets:
+        return ()
+    base_syn = synsets[0]
+    candidates = set()
+    for syn in synsets:
+        sim = base_syn.wup_similarity(syn) or 0.0
+        if sim < min_diff:
+            for l in syn.lemmas():
+                cand = l.name().replace("_", " ")
+                if cand.lower() != lemma_:
+                    candidates.add(cand)
+    return tuple(candidates)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def antonym_candidates(lemma_: str, wn_pos: str) -> Tuple[str, ...]:
+    antonyms = set()
+    for syn in wordnet.synsets(lemma_, pos=wn_pos):
+        for l in syn.lemmas():
+            for ant in l.antonyms():
+                antonyms.add(ant.name().replace("_", " "))
+    return tuple(antonyms)
+
+
+# model -> {word: candidates}; entries go away with the model
+_EMBEDDING_CANDIDATES: "weakref.WeakKeyDictionary[object, Dict[str, Optional[Tuple[str, ...]]]]" = weakref.WeakKeyDictionary()
+
+
+def embedding_candidates(lower: str, model) -> Optional[Tuple[str, ...]]:
+    """Neighbours 11-30 of `lower` in a static embedding model (None if out of vocabulary)."""
+    cache = _EMBEDDING_CANDIDATES.setdefault(model, {})
+    if lower not in cache:
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        try:
+            similar_words = model.most_similar(lower, topn=30)
+        except KeyError:
+            cache[lower] = None
+        else:
+            candidates = [w for w, sim in similar_words if w.strip()]
+            if len(candidates) > 10:
+                candidates = candidates[10:]  # skip the top 10 most similar (too close)
+            cache[lower] = tuple(candidates)
+    return cache[lower]
+
+
+@lru_cache(maxsize=None)
+def pos_weight(pos_tag: str) -> float:
+    """Sampling weight of a POS class in semantic_noise (content words highest)."""
+    if pos_tag.startswith(("N", "V", "J", "R")):
+        return 3.0
+    if pos_tag.startswith(("P", "C", "I", "D")):
+        return 1.5
+    return 1.0
+
+
+def entity_mask(ner_tags: List[int], id2label: Dict[int, str]) -> np.ndarray:
+    is_entity = np.array([id2label[i].startswith(("B-", "I-")) for i in range(len(id2label))], dtype=bool)
+    return is_entity[np.asarray(ner_tags, dtype=np.int64)] if len(ner_tags) else np.zeros(0, dtype=bool)
@@ -0,0 +1,244 @@
+"""
+Resumable, coordinator-free noise application in fixed-size shards.
+
+Each noised split is cut into shards of `shard_size` rows under
+
+    <shard_dir>/<key>/<split>/shard-00000/         finished shard (Dataset.save_to_disk)
+    <shard_dir>/<key>/<split>/shard-00000.claim    owner (host, pid), mtime refreshed while working
+                                                   (removed once the shard is published)
+    <shard_dir>/<key>/<split>/manifest.json        shard_size and row count of the split
+
+where <key> hashes the profile, seed, shard size and mapping options; a split whose manifest does
+not match the dataset and shard size at hand is refused rather than mixed. A process claims a
+shard by creating its claim file with O_CREAT | O_EXCL and publishes the result by renaming a
+temporary directory to shard-NNNNN, so a shard directory is always complete. A claim is stale
+when its owner is a dead process on this host or its heartbeat is older than `claim_timeout`;
+stale claims are taken over by renaming them away first (only one process wins the rename).
+Restarting resumes from the finished shards, and any number of processes on one node or a shared
+filesystem can work on the same key (src.train --noise_shard_dir, or `python -m src.noise_shards`
+workers).
+
+Each shard is noised with the global RNGs seeded from (seed, split, shard index), so the result
+does not depend on which process produced it.
+
+    python -m src.noise_shards --profile src/profiles/<PROFILE> --seed 42 --shard_dir /shared/noise
+
+A grid profile is worked on variant by variant, like src.train does (--variant to pick some).
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import uuid
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+CLAIM_SUFFIX = ".claim"
+MANIFEST = "manifest.json"
+
+
+def shard_key(profile: dict, seed: int, **options) -> str:
+    payload = json.dumps({"profile": profile, "seed": seed, **options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def check_manifest(out_dir: str, manifest: dict):
+    """Writes the split's manifest, or raises ValueError if an existing one differs."""
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(tmp, path)  # concurrent first writers write the same content or are caught below
+    with open(path, "r", encoding="utf-8") as f:
+        found = json.load(f)
+    if found != manifest:
+        raise ValueError(f"{out_dir} holds shards for {found}, not {manifest}; use another --shard_dir")
+
+
+def shard_seed(seed: int, split: str, index: int) -> int:
+    return ((seed * 1_000_003 + zlib.crc32(split.encode("utf-8"))) * 1_000_003 + index) % (2 ** 32)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(claim: str, claim_timeout: float) -> bool:
+    try:
+        with open(claim, "r", encoding="utf-8") as f:
+            owner = json.load(f)
+        age = time.time() - os.path.getmtime(claim)
+    except (OSError, ValueError):
+        return False  # vanished or being written; look again next round
+    if owner.get("host") == socket.gethostname() and not _pid_alive(owner.get("pid", -1)):
+        return True
+    return age > claim_timeout
+
+
+def try_claim(claim: str, claim_timeout: float) -> bool:
+    """Atomically creates the claim file; takes over a stale claim. False if another process holds it."""
+    for _ in range(2):
+        try:
+            fd = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not _is_stale(claim, claim_timeout):
+                return False
+            try:
+                os.rename(claim, f"{claim}.stale-{uuid.uuid4().hex}")  # only one process wins
+            except FileNotFoundError:
+                return False
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, f)
+        return True
+    return False
+
+
+class _Heartbeat:
+    """Refreshes the claim's mtime while a shard is being noised."""
+
+    def __init__(self, claim: str, interval: float):
+        self.claim, self.interval = claim, interval
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                os.utime(self.claim)
+            except OSError:
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+def _noise_shard(dataset, start: int, end: int, mappers: List[Tuple[Callable, bool]], seed_value: int, final: str):
+    state = random.getstate(), np.random.get_state()
+    random.seed(seed_value)
+    np.random.seed(seed_value)
+    try:
+        part = dataset.select(range(start, end))
+        for fn, batched in mappers:
+            part = part.map(fn, batched=batched, load_from_cache_file=False,
+                            desc=f"Noising {os.path.basename(final)}")
+    finally:
+        random.setstate(state[0])
+        np.random.set_state(state[1])
+    tmp = f"{final}.tmp-{uuid.uuid4().hex}"
+    part.save_to_disk(tmp)
+    try:
+        os.rename(tmp, final)  # publishes the complete shard
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # finished meanwhile by a process that took over our claim
+        if not os.path.isdir(final):
+            raise
+
+
+def noise_split_sharded(dataset, split: str, mappers: List[Tuple[Callable, bool]], out_dir: str, seed: int,
+                        shard_size: int = 2000, claim_timeout: float = 600.0, poll: float = 10.0,
+                        wait: bool = True):
+    """
+    Applies `mappers` ((fn, batched) pairs, in order) to the split shard by shard. Returns the
+    concatenated noised split once every shard is finished (also those of other processes), or
+    None with wait=False when only shards held by other processes are left.
+    """
+    from datasets import concatenate_datasets, load_from_disk
+
+    os.makedirs(out_dir, exist_ok=True)
+    check_manifest(out_dir, {"shard_size": shard_size, "rows": len(dataset)})
+    n_shards = max(1, -(-len(dataset) // shard_size))
+    finals = [os.path.join(out_dir, f"shard-{i:05d}") for i in range(n_shards)]
+    done_before = sum(os.path.isdir(f) for f in finals)
+    if done_before:
+        print(f"[noise_shards] {split}: resuming, {done_before}/{n_shards} shards already done")
+    while True:
+        pending = [i for i, f in enumerate(finals) if not os.path.isdir(f)]
+        if not pending:
+            break
+        progressed = False
+        for i in pending:
+            claim = finals[i] + CLAIM_SUFFIX
+            if os.path.isdir(finals[i]) or not try_claim(claim, claim_timeout):
+                continue
+            if not os.path.isdir(finals[i]):  # else finished between the check and the claim
+                with _Heartbeat(claim, max(claim_timeout / 10, 1.0)):
+                    _noise_shard(dataset, i * shard_size, min((i + 1) * shard_size, len(dataset)), mappers,
+                                 shard_seed(seed, split, i), finals[i])
+                progressed = True
+                print(f"[noise_shards] {split}: shard {i + 1}/{n_shards} done")
+            try:
+                os.remove(claim)  # the published shard directory marks it done
+            except FileNotFoundError:
+                pass
+        if not progressed:
+            if not wait:
+                return None
+            time.sleep(poll)
+    noised = concatenate_datasets([load_from_disk(f) for f in finals])
+    if len(noised) != len(dataset):
+        raise ValueError(f"{out_dir}: shards hold {len(noised)} rows, the {split} split has {len(dataset)}")
+    return noised
+
+
+def main():
+    from datasets import DatasetDict
+
+    from .data_preprocessing import load_conll2003, build_label_maps
+    from .train import apply_profile_sharded, load_profile_variants
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", required=True, help="YAML file with noise steps & scopes (grids: every variant)")
+    ap.add_argument("--variant", nargs="+", default=None, help="Only these grid variants (names as in src.train)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--shard_dir", required=True, help="Shared directory of the shards (same as src.train --noise_shard_dir)")
+    ap.add_argument("--shard_size", type=int, default=2000, help="Must match the consuming src.train run (--noise_shard_size)")
+    ap.add_argument("--track_provenance", action="store_true", help="Must match the consuming src.train run")
+    ap.add_argument("--batched_noise", action="store_true", help="Must match the consuming src.train run")
+    ap.add_argument("--online_noise", action="store_true", help="Must match the consuming src.train run")
+    ap.add_argument("--claim_timeout", type=float, default=600.0, help="Seconds without heartbeat before a claim is stale")
+    args = ap.parse_args()
+
+    variants = load_profile_variants(args.profile)
+    if args.variant:
+        unknown = set(args.variant) - {name for name, _ in variants}
+        if unknown:
+            ap.error(f"Unknown variant(s) {sorted(unknown)}; {args.profile} has {[name for name, _ in variants]}")
+        variants = [(name, profile) for name, profile in variants if name in args.variant]
+
+    ds = load_conll2003()
+    id2label, label2id = build_label_maps(ds["train"].features, "ner_tags")
+    id2pos, _ = build_label_maps(ds["train"].features, "pos_tags")
+    for name, profile in variants:
+        if len(variants) > 1:
+            print(f"[noise_shards] Variant {name}")
+        if args.online_noise:
+            scope = profile.get("scope") or {}
+            profile = dict(profile, scope={k: [s for s in (v or []) if s != "train"] for k, v in scope.items()})
+        apply_profile_sharded(DatasetDict(ds), profile, id2label, label2id, id2pos, args.shard_dir, args.seed,
+                              shard_size=args.shard_size, claim_timeout=args.claim_timeout,
+                              track_provenance=args.track_provenance, batched_noise=args.batched_noise, wait=False)
+    print(f"[noise_shards] No unclaimed shards left in {args.shard_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Realized noise statistics: compares each noised split with its clean original.
+
+Per sentence (computed in batched Dataset.map passes):
+  - tokens changed, aligned via edit operations when the length differs (syntactic ops),
+  - length delta,
+  - gold entity spans altered (type, tokens and position of the span in the aligned sentence),
+  - tags changed on aligned tokens (label noise),
+  - OOV words (tokenized to the unknown token) and subwords per word under the model tokenizer.
+The split report sums these; optional diff records list the edit operations of changed sentences.
+"""
+import difflib
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from seqeval.metrics.sequence_labeling import get_entities
+
+STAT_COLUMNS = ("n_tokens", "n_noised_tokens", "n_changed", "n_tag_changed", "n_spans", "n_spans_altered",
+                "n_oov", "n_noised_oov", "n_subwords", "n_noised_subwords")
+
+
+def align_tokens(clean: List[str], noised: List[str]) -> Tuple[List[int], list]:
+    """
+    Source index in `clean` of each noised token (-1 for inserted or replaced tokens)
+    and the non-equal edit operations (tag, i1, i2, j1, j2).
+    """
+    if len(clean) == len(noised):
+        source = [i if a == b else -1 for i, (a, b) in enumerate(zip(clean, noised))]
+        ops = [("replace", i, i + 1, i, i + 1) for i, s in enumerate(source) if s < 0]
+        return source, ops
+    source = [-1] * len(noised)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, clean, noised, autojunk=False).get_opcodes():
+        if tag == "equal":
+            source[j1:j2] = range(i1, i2)
+        else:
+            ops.append((tag, i1, i2, j1, j2))
+    return source, ops
+
+
+def _spans(tags: List[str]):
+    return {(t, s, e) for t, s, e in get_entities(tags)}
+
+
+def _tokenizer_counts(tokenizer, sentences: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """(oov words, subwords) per sentence; OOV = words encoded as the unknown token."""
+    n = len(sentences)
+    if tokenizer is None:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    flat = [w for s in sentences for w in s]
+    if not flat:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    ids = tokenizer(flat, add_special_tokens=False)["input_ids"]
+    lengths = np.fromiter((len(x) for x in ids), dtype=np.int64, count=len(ids))
+    unk = tokenizer.unk_token_id
+    oov = np.fromiter((unk is not None and unk in x for x in ids), dtype=np.int64, count=len(ids))
+    bounds = np.cumsum([0] + [len(s) for s in sentences])[:-1]
+    nonempty = np.array([len(s) > 0 for s in sentences])
+    out_oov, out_sub = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    if nonempty.any():
+        out_oov[nonempty] = np.add.reduceat(oov, bounds[nonempty])
+        out_sub[nonempty] = np.add.reduceat(lengths, bounds[nonempty])
+    return out_oov, out_sub
+
+
+def diff_batch(clean: Dict[str, list], noised: Dict[str, list], id2label: Dict[int, str], tokenizer=None,
+               with_ops: bool = False) -> Dict[str, list]:
+    """Per-sentence statistics (STAT_COLUMNS) of a batch of aligned clean/noised rows."""
+    out = {c: [] for c in STAT_COLUMNS}
+    if with_ops:
+        out["ops"] = []
+    for c_tok, n_tok, c_tags, n_tags in zip(clean["tokens"], noised["tokens"], clean["ner_tags"], noised["ner_tags"]):
+        source, ops = align_tokens(c_tok, n_tok)
+        c_lab = [id2label[t] for t in c_tags]
+        n_lab = [id2label[t] for t in n_tags]
+        # spans compared on the clean index axis; a span survives if its tokens and tags are kept in place
+        gold = _spans(c_lab)
+        kept = {(t, source[s], source[e]) for t, s, e in _spans(n_lab)
+                if source[s] >= 0 and source[e] - source[s] == e - s and all(x >= 0 for x in source[s:e + 1])}
+        out["n_tokens"].append(len(c_tok))
+        out["n_noised_tokens"].append(len(n_tok))
+        out["n_changed"].append(sum(max(i2 - i1, j2 - j1) for _, i1, i2, j1, j2 in ops))
+        out["n_tag_changed"].append(sum(s >= 0 and c_tags[s] != t for s, t in zip(source, n_tags)))
+        out["n_spans"].append(len(gold))
+        out["n_spans_altered"].append(len(gold - kept))
+        if with_ops:
+            out["ops"].append(json.dumps([[tag, c_tok[i1:i2], n_tok[j1:j2]] for tag, i1, i2, j1, j2 in ops]))
+
+    for key, sentences in (("", clean["tokens"]), ("noised_", noised["tokens"])):
+        oov, sub = _tokenizer_counts(tokenizer, sentences)
+        out[f"n_{key}oov"] = oov.tolist()
+        out[f"n_{key}subwords"] = sub.tolist()
+    return out
+
+
+def split_report(stats: Dict[str, np.ndarray], has_tokenizer: bool) -> Dict[str, float]:
+    """Sums per-sentence statistics into the report of one split."""
+    s = {k: np.asarray(v) for k, v in stats.items() if k in STAT_COLUMNS}
+    tokens, noised_tokens = s["n_tokens"].sum(), s["n_noised_tokens"].sum()
+    length_delta = s["n_noised_tokens"] - s["n_tokens"]
+    report = {
+        "sentences": int(len(s["n_tokens"])),
+        "sentences_changed": float(np.mean((s["n_changed"] > 0) | (s["n_tag_changed"] > 0))),
+        "tokens": int(tokens),
+        "noised_tokens": int(noised_tokens),
+        "token_change_rate": float(s["n_changed"].sum() / max(tokens, 1)),
+        "tag_change_rate": float(s["n_tag_changed"].sum() / max(tokens, 1)),
+        "length_delta_mean": float(length_delta.mean()) if len(length_delta) else 0.0,
+        "sentences_length_changed": float(np.mean(length_delta != 0)) if len(length_delta) else 0.0,
+        "entity_spans": int(s["n_spans"].sum()),
+        "entity_spans_altered": int(s["n_spans_altered"].sum()),
+        "entity_span_alter_rate": float(s["n_spans_altered"].sum() / max(s["n_spans"].sum(), 1)),
+    }
+    if has_tokenizer:
+        report.update({
+            "oov_rate_clean": float(s["n_oov"].sum() / max(tokens, 1)),
+            "oov_rate_noised": float(s["n_noised_oov"].sum() / max(noised_tokens, 1)),
+            "subwords_per_word_clean": float(s["n_subwords"].sum() / max(tokens, 1)),
+            "subwords_per_word_noised": float(s["n_noised_subwords"].sum() / max(noised_tokens, 1)),
+        })
+        report["subword_inflation"] = report["subwords_per_word_noised"] / max(report["subwords_per_word_clean"], 1e-12)
+    return report
+
+
+def noise_report(clean_ds, noised_ds, splits: List[str], id2label: Dict[int, str], tokenizer=None,
+                 diffs_path: Optional[str] = None, max_diffs: int = 0, batch_size: int = 1000) -> Dict[str, dict]:
+    """
+    Report per split. With `diffs_path`, up to `max_diffs` changed sentences per split are
+    written there as JSONL records {split, idx, tokens, noised_tokens, ops}.
+    """
+    report = {}
+    diffs = open(diffs_path, "w", encoding="utf-8") if diffs_path and max_diffs > 0 else None
+    try:
+        for split in splits:
+            clean, noised = clean_ds[split], noised_ds[split]
+            if len(clean) != len(noised):
+                raise ValueError(f"{split}: {len(clean)} clean vs {len(noised)} noised rows")
+            stats = noised.map(
+                lambda b, idx: diff_batch(clean[idx[0]:idx[-1] + 1], b, id2label, tokenizer, with_ops=diffs is not None),
+                batched=True, batch_size=batch_size, with_indices=True, remove_columns=noised.column_names,
+                load_from_cache_file=False, desc=f"Noise statistics ({split})",
+            )
+            report[split] = split_report({c: stats[c] for c in STAT_COLUMNS}, tokenizer is not None)
+            if diffs is not None:
+                changed = np.flatnonzero((np.asarray(stats["n_changed"]) > 0) | (np.asarray(stats["n_tag_changed"]) > 0))
+                for i in changed[:max_diffs].tolist():
+                    diffs.write(json.dumps({"split": split, "idx": i, "tokens": clean[i]["tokens"],
+                                            "noised_tokens": noised[i]["tokens"], "ops": json.loads(stats[i]["ops"])},
+                                           ensure_ascii=False) + "\n")
+    finally:
+        if diffs is not None:
+            diffs.close()
+    return report
+
+
+def print_report(report: Dict[str, dict]):
+    for split, r in report.items():
+        line = (f"[noise-stats] {split}: token change {r['token_change_rate']:.4f}, tag change {r['tag_change_rate']:.4f}, "
+                f"length delta {r['length_delta_mean']:+.3f}, spans altered {r['entity_span_alter_rate']:.4f}")
+        if "oov_rate_noised" in r:
+            line += (f", OOV {r['oov_rate_clean']:.4f}->{r['oov_rate_noised']:.4f}, "
+                     f"subword inflation x{r['subword_inflation']:.3f}")
+        print(line)
@@ -0,0 +1,73 @@
+"""
+On-the-fly train noise: the profile's train-scoped noise is applied per batch inside a dataset
+transform, with a fresh realization every epoch, and only the served batch is tokenized.
+
+Each example is noised with an RNG seeded by (seed, epoch, example index), so a realization does
+not depend on batch composition, shuffling or which dataloader worker serves it. The epoch is
+set by NoiseEpochCallback before the epoch's dataloader iterator (and its workers) is created,
+which is why workers must not be persistent.
+"""
+import random
+from typing import Callable, Optional
+
+import numpy as np
+from transformers import TrainerCallback
+
+INDEX_COLUMN = "example_idx"
+
+
+def example_seed(seed: int, epoch: int, idx: int) -> int:
+    return ((seed * 1_000_003 + epoch) * 1_000_003 + idx) % (2 ** 32)
+
+
+class OnlineNoiseTransform:
+    """
+    Dataset.set_transform callable: raw rows (with INDEX_COLUMN) -> noised, tokenized features.
+    `tokenize` is a batched tokenize_and_align(_chars) closure.
+    """
+
+    def __init__(self, token_mapper: Optional[Callable], label_mapper: Optional[Callable], tokenize: Callable,
+                 seed: int):
+        self.token_mapper = token_mapper
+        self.label_mapper = label_mapper
+        self.tokenize = tokenize
+        self.seed = seed
+        self.epoch = 0
+
+    def __call__(self, batch):
+        tokens, ner_tags = [], []
+        saved = random.getstate(), np.random.get_state()
+        try:
+            for i, idx in enumerate(batch[INDEX_COLUMN]):
+                s = example_seed(self.seed, self.epoch, idx)
+                random.seed(s)
+                np.random.seed(s)
+                example = {"tokens": batch["tokens"][i], "ner_tags": batch["ner_tags"][i], "pos_tags": batch["pos_tags"][i]}
+                if self.token_mapper is not None:
+                    example.update(self.token_mapper(example))
+                if self.label_mapper is not None:
+                    example.update(self.label_mapper(example))
+                tokens.append(example["tokens"])
+                ner_tags.append(example["ner_tags"])
+        finally:
+            random.setstate(saved[0])
+            np.random.set_state(saved[1])
+        return dict(self.tokenize({"tokens": tokens, "ner_tags": ner_tags}))
+
+
+def online_train_dataset(train_split, transform: OnlineNoiseTransform):
+    """Raw train split served through `transform` (rows keep their index for per-example seeding)."""
+    train_split = train_split.add_column(INDEX_COLUMN, list(range(len(train_split))))
+    train_split.set_transform(transform)
+    return train_split
+
+
+class NoiseEpochCallback(TrainerCallback):
+    """Advances the transform's epoch so every epoch sees a new noise realization."""
+
+    def __init__(self, transform: OnlineNoiseTransform):
+        self.transform = transform
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.transform.epoch = int(round(state.epoch or 0))
+        return control
@@ -0,0 +1,263 @@
+"""
+Batch inference for trained token classifiers.
+
+Reads pre-tokenized sentences (CoNLL or JSONL), optionally noises them with a profile,
+runs length-bucketed batched inference and streams word-level BIO tags.
+
+Usage:
+    python -m src.predict --model_dir outputs/<run_name> --input test.conll --profile src/profiles/<PROFILE>
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import torch
+from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+PREFIX_SPACE_MODELS = ("roberta", "deberta", "xlnet")
+
+
+def is_char_model(model) -> bool:
+    return model.config.model_type == "canine"
+
+
+def load_ner_model(model_dir: str, device: str = "cpu"):
+    """Loads a model saved by src.train (--save_model) together with its tokenizer."""
+    model = AutoModelForTokenClassification.from_pretrained(model_dir)
+    model.to(device).eval()
+    if any(x in model.config.model_type for x in PREFIX_SPACE_MODELS):
+        tokenizer = AutoTokenizer.from_pretrained(model_dir, add_prefix_space=True)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    return model, tokenizer
+
+
+def read_conll(path: str) -> Iterator[Dict[str, List[str]]]:
+    """
+    Yields {"tokens", "pos_tags"?, "ner_tags"?} per sentence.
+    Columns: token [POS [chunk]] [NER]; a single column means unlabeled text.
+    """
+    tokens, pos, ner = [], [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("-DOCSTART-"):
+                if tokens:
+                    yield _sentence(tokens, pos, ner)
+                    tokens, pos, ner = [], [], []
+                continue
+            cols = line.split()
+            tokens.append(cols[0])
+            if len(cols) >= 3:
+                pos.append(cols[1])
+            if len(cols) >= 2:
+                ner.append(cols[-1])
+    if tokens:
+        yield _sentence(tokens, pos, ner)
+
+
+def _sentence(tokens, pos, ner):
+    sent = {"tokens": tokens}
+    if pos:
+        sent["pos_tags"] = pos
+    if ner:
+        sent["ner_tags"] = ner
+    return sent
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, List[str]]]:
+    """Yields {"tokens", "pos_tags"?, "ner_tags"?} per line (tags as strings)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_noiser(profile: dict, id2label: Dict[int, str], seed: int):
+    """
+    Returns a function applying the profile's token noise to one sentence dict.
+    Gold tags (if any) follow length-changing ops; missing tags default to 'O' / 'NN'.
+    Each noiser draws from its own RNG stream seeded with `seed` (swapped into the global RNGs the
+    noise ops use for the duration of a call), so noisers do not disturb each other or the caller.
+    """
+    from .train import build_mappers
+
+    label2id = {v: k for k, v in id2label.items()}
+    pos_vocab: Dict[str, int] = {}
+    id2pos: Dict[int, str] = {}
+    token_mapper, _ = build_mappers(profile, id2label, label2id, id2pos)
+    py_state = random.Random(seed).getstate()
+    np_state = np.random.RandomState(seed).get_state()
+
+    def noise(sent):
+        nonlocal py_state, np_state
+        n = len(sent["tokens"])
+        pos_ids = []
+        for tag in sent.get("pos_tags") or ["NN"] * n:
+            if tag not in pos_vocab:
+                pos_vocab[tag] = len(pos_vocab)
+                id2pos[pos_vocab[tag]] = tag
+            pos_ids.append(pos_vocab[tag])
+        ner = [label2id.get(t, label2id["O"]) for t in sent.get("ner_tags") or ["O"] * n]
+        saved = random.getstate(), np.random.get_state()
+        random.setstate(py_state)
+        np.random.set_state(np_state)
+        try:
+            out = token_mapper({"tokens": sent["tokens"], "ner_tags": ner, "pos_tags": pos_ids})
+        finally:
+            py_state, np_state = random.getstate(), np.random.get_state()
+            random.setstate(saved[0])
+            np.random.set_state(saved[1])
+        noised = dict(sent, tokens=out["tokens"])
+        noised.pop("pos_tags", None)  # no longer aligned after syntactic ops
+        if "ner_tags" in sent:
+            noised["ner_tags"] = [id2label[t] for t in out["ner_tags"]]
+        return noised
+
+    return noise
+
+
+def length_buckets(sentences: List[Dict], batch_size: int) -> List[List[int]]:
+    """Indices grouped into batches of similar length (sorted by character count)."""
+    order = sorted(range(len(sentences)), key=lambda i: sum(len(t) + 1 for t in sentences[i]["tokens"]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def encode_batch(batch_tokens: List[List[str]], tokenizer, max_length: int, char_level: bool):
+    """
+    Tokenizes a batch (dynamic padding) and returns (encoding, positions) where positions[b][w]
+    is the input position whose prediction is used for word w (None if truncated away).
+    """
+    if char_level:
+        texts = [" ".join(tokens) for tokens in batch_tokens]
+        enc = tokenizer(texts, truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+        positions = []
+        for tokens in batch_tokens:
+            # first char of each word, same indexing as tokenize_and_align_chars(eval_mode=True)
+            offset, pos = 0, []
+            for tok in tokens:
+                pos.append(offset if offset < max_length and tok else None)
+                offset += len(tok) + 1
+            positions.append(pos)
+        return enc, positions
+
+    enc = tokenizer(batch_tokens, is_split_into_words=True, truncation=True, padding=True,
+                    max_length=max_length, return_tensors="pt")
+    positions = []
+    for b, tokens in enumerate(batch_tokens):
+        pos = [None] * len(tokens)
+        previous = None
+        for j, word_idx in enumerate(enc.word_ids(batch_index=b)):
+            if word_idx is not None and word_idx != previous:
+                pos[word_idx] = j  # first subword
+            previous = word_idx
+        positions.append(pos)
+    return enc, positions
+
+
+def predict_batch(model, tokenizer, batch_tokens: List[List[str]], max_length: int = 256,
+                  return_logits: bool = False):
+    """Word-level BIO predictions for one batch; words cut off by truncation are tagged 'O'."""
+    char_level = is_char_model(model)
+    enc, positions = encode_batch(batch_tokens, tokenizer, max_length, char_level)
+    enc = {k: v.to(model.device) for k, v in enc.items()}
+    with torch.inference_mode():
+        logits = model(**enc).logits
+    pred_ids = logits.argmax(-1).cpu().numpy()
+    id2label = model.config.id2label
+    tags = [[id2label[int(pred_ids[b, p])] if p is not None else "O" for p in pos]
+            for b, pos in enumerate(positions)]
+    if return_logits:
+        return tags, logits, positions
+    return tags
+
+
+def predict_stream(model, tokenizer, sentences: Iterable[Dict], batch_size: int = 32, max_length: int = 256,
+                   chunk_size: int = 2048, stats: Optional[Dict[str, list]] = None) -> Iterator[Dict]:
+    """
+    Streams predictions in input order. Input is consumed in chunks of `chunk_size` sentences;
+    within a chunk, sentences are bucketed by length so batches carry little padding.
+    """
+    chunk = []
+    for sent in sentences:
+        chunk.append(sent)
+        if len(chunk) >= chunk_size:
+            yield from _predict_chunk(model, tokenizer, chunk, batch_size, max_length, stats)
+            chunk = []
+    if chunk:
+        yield from _predict_chunk(model, tokenizer, chunk, batch_size, max_length, stats)
+
+
+def _predict_chunk(model, tokenizer, chunk, batch_size, max_length, stats):
+    results = [None] * len(chunk)
+    for idxs in length_buckets(chunk, batch_size):
+        start = time.perf_counter()
+        tags = predict_batch(model, tokenizer, [chunk[i]["tokens"] for i in idxs], max_length)
+        if stats is not None:
+            stats["batch_latency"].append(time.perf_counter() - start)
+            stats["batch_words"].append(sum(len(chunk[i]["tokens"]) for i in idxs))
+        for i, t in zip(idxs, tags):
+            results[i] = dict(chunk[i], pred_tags=t)
+    yield from results
+
+
+def write_prediction(out, pred: Dict, fmt: str):
+    if fmt == "jsonl":
+        out.write(json.dumps(pred, ensure_ascii=False) + "\n")
+        return
+    gold = pred.get("ner_tags")
+    for j, (tok, tag) in enumerate(zip(pred["tokens"], pred["pred_tags"])):
+        out.write(f"{tok}\t{gold[j]}\t{tag}\n" if gold else f"{tok}\t{tag}\n")
+    out.write("\n")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model_dir", required=True, help="Directory written by src.train --save_model")
+    ap.add_argument("--input", required=True, help="CoNLL (token per line) or .jsonl with {'tokens': [...]}")
+    ap.add_argument("--output", default="-", help="Output file ('-' = stdout)")
+    ap.add_argument("--format", choices=["conll", "jsonl"], default="conll")
+    ap.add_argument("--profile", default=None, help="Optional noise profile applied to the input first")
+    ap.add_argument("--batch_size", type=int, default=32)
+    ap.add_argument("--max_length", type=int, default=256)
+    ap.add_argument("--chunk_size", type=int, default=2048, help="Sentences sorted/bucketed together")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = ap.parse_args()
+
+    model, tokenizer = load_ner_model(args.model_dir, args.device)
+    sentences = read_jsonl(args.input) if args.input.endswith(".jsonl") else read_conll(args.input)
+    if args.profile:
+        from .train import load_profile
+        noise = build_noiser(load_profile(args.profile), model.config.id2label, args.seed)
+        sentences = map(noise, sentences)
+
+    stats = {"batch_latency": [], "batch_words": []}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    n_sent = 0
+    start = time.perf_counter()
+    try:
+        for pred in predict_stream(model, tokenizer, sentences, args.batch_size, args.max_length,
+                                   args.chunk_size, stats):
+            write_prediction(out, pred, args.format)
+            n_sent += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    if stats["batch_latency"]:
+        lat = np.array(stats["batch_latency"]) * 1000
+        n_words = sum(stats["batch_words"])
+        print(f"[predict] {n_sent} sentences, {n_words} words in {elapsed:.2f}s "
+              f"({n_sent / elapsed:.1f} sent/s, {n_words / elapsed:.1f} words/s); "
+              f"batch latency p50={np.percentile(lat, 50):.1f}ms p95={np.percentile(lat, 95):.1f}ms",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
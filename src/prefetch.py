@@ -0,0 +1,103 @@
+"""
+Background loading of the heavy resources a run needs.
+
+The profile is inspected up front (required_resources) and the static embedding model, the
+fill-mask model and WordNet are loaded in worker threads while the dataset is read; the
+training tokenizer and model weights follow the same way. The noise functions go through the
+locked loaders in noise.utils.model_loader, so a mapper that needs a resource still in flight
+waits for it instead of loading it a second time.
+"""
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from .noise.utils.model_loader import (
+    ensure_wordnet, load_contextual_embedding_model, load_static_embedding_model,
+)
+
+SEMANTIC_OPS = ["synonym", "word_embs", "antonym", "contextual"]  # semantic_noise default when "ops" is empty
+DEFAULT_STATIC_MODEL = "glove-wiki-gigaword-100"
+DEFAULT_CONTEXTUAL_MODEL = "albert-base-v2"
+
+
+def required_resources(profile: dict) -> Dict[str, Callable]:
+    """Loaders of the resources the profile's token noise needs, keyed "static:<path>", "contextual:<name>", "wordnet"."""
+    scope = profile.get("scope") or {}
+    if not scope.get("token_noise"):
+        return {}
+    resources = {}
+    for step in profile.get("token_noise") or []:
+        if step.get("name") != "semantic_noise":
+            continue
+        params = step.get("params") or {}
+        ops = params.get("ops") or SEMANTIC_OPS
+        if any(op in ["synonym", "antonym"] for op in ops):
+            resources["wordnet"] = ensure_wordnet
+        if any(op in ["word_embs", "synonym", "antonym"] for op in ops):
+            path = params.get("model_path", DEFAULT_STATIC_MODEL)
+            resources[f"static:{path}"] = partial(load_static_embedding_model, path)
+        if "contextual" in ops:
+            name = params.get("model_name", DEFAULT_CONTEXTUAL_MODEL)
+            resources[f"contextual:{name}"] = partial(load_contextual_embedding_model, name)
+    return resources
+
+
+class Prefetcher:
+    """Named futures over a thread pool; with max_workers=0 every task runs inline when submitted."""
+
+    def __init__(self, max_workers: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="prefetch") if max_workers > 0 else None
+        self.futures: Dict[str, Future] = {}
+        self.start = time.perf_counter()
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> Future:
+        if self.executor is not None:
+            future = self.executor.submit(self._timed, name, fn, *args, **kwargs)
+        else:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        self.futures[name] = future
+        return future
+
+    def _timed(self, name: str, fn: Callable, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        print(f"[prefetch] {name} ready after {time.perf_counter() - self.start:.1f}s")
+        return result
+
+    def get(self, name: str):
+        """Result of a task, waiting for it if needed (re-raises its exception)."""
+        future = self.futures[name]
+        if not future.done():
+            t0 = time.perf_counter()
+            result = future.result()
+            print(f"[prefetch] Waited {time.perf_counter() - t0:.1f}s for {name}")
+            return result
+        return future.result()
+
+    def take(self, name: str):
+        """get() and forget the task, so the prefetcher holds no reference to the result."""
+        result = self.get(name)
+        del self.futures[name]
+        return result
+
+    def wait(self, names: Optional[List[str]] = None):
+        for name in names if names is not None else list(self.futures):
+            self.futures[name].result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+def prefetch_resources(profiles: List[dict], max_workers: int = 4) -> Prefetcher:
+    """Starts loading everything required_resources lists for any of the profiles."""
+    prefetcher = Prefetcher(max_workers)
+    for profile in profiles:
+        for name, loader in required_resources(profile).items():
+            if name not in prefetcher.futures:
+                prefetcher.submit(name, loader)
+    return prefetcher
@@ -0,0 +1,137 @@
+"""
+Noise profile composition and parameter grids.
+
+A profile YAML may name a base profile (path relative to its own file) and override parts of it:
+
+    base: ../orthographic/orthographic_p0.1_test_all.yaml
+    scope:
+      token_noise: [train, validation, test]
+
+Mappings are merged recursively; noise step lists (token_noise, label_noise) are merged by step
+name (params of a step with the same name are merged, new steps are appended); any other value
+replaces the base value.
+
+A `grid` maps parameter paths to lists of values; the profile expands to their cross product:
+
+    grid:
+      p: [0.1, 0.2, 0.3]                  # bare name: that param of every step that has it
+      entity_strategy: [all, protect]
+      token_noise.typo_tokens.p: [0.1]    # <steps>.<step name>.<param>
+      scope.token_noise: [[test], [train, validation, test]]
+
+Variants are named <profile>_<param>-<value>_... by default; a `name` template, with each grid
+path's last segment as a field, names them instead (e.g. the standalone profile names):
+
+    name: orthographic_p{p}_test_{entity_strategy}
+"""
+import copy
+import itertools
+import os
+from typing import List, Tuple
+
+import yaml
+
+STEP_LISTS = ("token_noise", "label_noise")
+
+
+def _merge(base, override, key=None):
+    if isinstance(base, dict) and isinstance(override, dict):
+        out = dict(base)
+        for k, v in override.items():
+            out[k] = _merge(base[k], v, k) if k in base else copy.deepcopy(v)
+        return out
+    if (key in STEP_LISTS and isinstance(base, list) and isinstance(override, list)
+            and all(isinstance(step, dict) for step in base + override)):  # not scope.<kind> split lists
+        out = [copy.deepcopy(step) for step in base]
+        names = [step.get("name") for step in out]
+        for step in override:
+            if step.get("name") in names:
+                i = names.index(step["name"])
+                out[i] = _merge(out[i], step)
+            else:
+                out.append(copy.deepcopy(step))
+        return out
+    return copy.deepcopy(override)
+
+
+def compose_profile(path: str, _seen: Tuple[str, ...] = ()) -> dict:
+    """The profile at `path` with its `base` chain merged in (grid left unexpanded)."""
+    path = os.path.abspath(path)
+    if path in _seen:
+        raise ValueError(f"Profile base cycle: {' -> '.join(_seen + (path,))}")
+    with open(path, "r", encoding="utf-8") as f:
+        profile = yaml.safe_load(f) or {}
+    base = profile.pop("base", None)
+    if base is None:
+        return profile
+    base_profile = compose_profile(os.path.join(os.path.dirname(path), base), _seen + (path,))
+    return _merge(base_profile, profile)
+
+
+def _step_params(profile: dict, name: str) -> List[dict]:
+    return [step.setdefault("params", {}) for kind in STEP_LISTS for step in (profile.get(kind) or [])
+            if name in (step.get("params") or {})]
+
+
+def set_param(profile: dict, path: str, value):
+    """Sets a grid path (see module docstring) in place."""
+    keys = path.split(".")
+    if len(keys) == 1:
+        targets = _step_params(profile, path)
+        if not targets:
+            raise KeyError(f"No noise step has a param {path!r}")
+        for params in targets:
+            params[path] = copy.deepcopy(value)
+        return
+    node = profile
+    for key in keys[:-1]:
+        if isinstance(node, list):
+            steps = [step for step in node if step.get("name") == key]
+            if not steps:
+                raise KeyError(f"No step {key!r} in {path!r}")
+            node = steps[0]
+        else:
+            node = node.setdefault(key, {})
+    if isinstance(node, dict) and "name" in node and keys[-1] not in node:
+        node = node.setdefault("params", {})  # <steps>.<step>.<param>
+    node[keys[-1]] = copy.deepcopy(value)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return "+".join(_format_value(v) for v in value) or "none"
+    return str(value)
+
+
+def _variant_name(template: str, fields: dict) -> str:
+    try:
+        return template.format_map(fields)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Bad grid name template {template!r} (fields: {', '.join(fields) or 'none'}): {e}") from None
+
+
+def expand_grid(profile: dict, name: str) -> List[Tuple[str, dict]]:
+    """(variant name, profile) per grid point; [(name, profile)] without a grid."""
+    grid = profile.get("grid")
+    template = profile.get("name")
+    base = {k: v for k, v in profile.items() if k not in ("grid", "name")}
+    if not grid:
+        return [(_variant_name(template, {}) if template else name, base)]
+    paths = list(grid)
+    leaves = [path.split(".")[-1] for path in paths]
+    if template and len(set(leaves)) < len(leaves):
+        raise ValueError(f"Grid paths {paths} share a last segment; the name template cannot tell them apart")
+    variants, names = [], set()
+    for values in itertools.product(*(grid[p] for p in paths)):
+        variant = copy.deepcopy(base)
+        for path, value in zip(paths, values):
+            set_param(variant, path, value)
+        if template:
+            variant_name = _variant_name(template, {leaf: _format_value(v) for leaf, v in zip(leaves, values)})
+        else:
+            variant_name = f"{name}_" + "_".join(f"{leaf}-{_format_value(v)}" for leaf, v in zip(leaves, values))
+        if variant_name in names:
+            raise ValueError(f"Grid name {variant_name!r} is not unique; use every grid field in the name template")
+        names.add(variant_name)
+        variants.append((variant_name, variant))
+    return variants
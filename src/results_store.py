@@ -0,0 +1,102 @@
+"""
+Local columnar store of run results (Parquet, hive-partitioned by model and profile).
+
+Every training run appends one row:
+
+    <store>/model=<model>/profile=<profile>/<run_name>-<timestamp>.parquet
+
+with the run config, timing, the test metrics of compute_metrics_builder (overall and per type)
+and the noise statistics of --profile_noise_ops / --noise_report when collected. Files are written
+atomically, so concurrent runs can share one store. Read it back with `load_runs` or
+`python -m src.aggregate`.
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+
+PARTITIONS = ("model", "profile")
+
+
+def _partition_value(value: str) -> str:
+    return str(value).replace("/", "_")
+
+
+def noise_columns(op_stats: Dict[str, Dict[str, dict]]) -> Dict[str, float]:
+    """Flattens a NoiseOpProfiler summary into per-split and per-(split, noise function) change rates."""
+    row = {}
+    for split, families in op_stats.items():
+        tokens = changed = 0
+        for family, s in families.items():
+            row[f"noise_{split}_{family}_change_rate"] = s["change_rate"]
+            tokens += s["tokens"]
+            changed += s["changed"]
+        row[f"noise_{split}_change_rate"] = changed / tokens if tokens else 0.0
+    return row
+
+
+def build_run_record(run_name: str, model: str, profile: str, seed: int, config: dict,
+                     test_metrics: Dict[str, float], train_metrics: Optional[Dict[str, float]] = None,
+                     op_stats: Optional[Dict[str, Dict[str, dict]]] = None,
+                     noise_stats: Optional[Dict[str, Dict[str, float]]] = None,
+                     realization_stats: Optional[Dict[str, Dict[str, float]]] = None) -> dict:
+    """
+    One flat row: identifiers, config (as JSON), timing, test_* metrics, noise_* op statistics,
+    realized_<split>_* values of the noise_stats report and test_<metric>_noise_{mean,std,ci,n}
+    over noised test realizations.
+    """
+    row = {
+        "run_name": run_name,
+        "model": _partition_value(model),
+        "profile": _partition_value(profile),
+        "seed": int(seed),
+        "timestamp": time.time(),
+        "config": json.dumps(config, sort_keys=True, default=str),
+    }
+    for k, v in (train_metrics or {}).items():
+        if k.startswith("train_") and isinstance(v, (int, float)):
+            row[k] = float(v)
+    for k, v in test_metrics.items():
+        if isinstance(v, (int, float)):
+            row["test_" + k[len("eval_"):] if k.startswith("eval_") else "test_" + k] = float(v)
+    if op_stats:
+        row.update(noise_columns(op_stats))
+        row["noise_op_stats"] = json.dumps(op_stats)
+    for split, report in (noise_stats or {}).items():
+        row.update({f"realized_{split}_{k}": float(v) for k, v in report.items()})
+    for k, st in (realization_stats or {}).items():
+        row.update({f"test_{k}_noise_{stat}": float(st[stat]) for stat in ("mean", "std", "ci")})
+        row[f"test_{k}_noise_n"] = int(st["n"])
+    return row
+
+
+def append_run(store_dir: str, record: dict) -> str:
+    """Writes the record as a one-row Parquet file in its partition; returns the file path."""
+    part_dir = os.path.join(store_dir, *(f"{k}={record[k]}" for k in PARTITIONS))
+    os.makedirs(part_dir, exist_ok=True)
+    # partition values live in the directory names, not in the file
+    table = pa.Table.from_pylist([{k: v for k, v in record.items() if k not in PARTITIONS}])
+    name = f"{_partition_value(record['run_name'])}-{int(record['timestamp'] * 1000)}.parquet"
+    path = os.path.join(part_dir, name)
+    tmp = os.path.join(part_dir, f".{name}.tmp{os.getpid()}")  # dot files are skipped by readers
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def load_runs(store_dir: str, columns: Optional[List[str]] = None, filter=None) -> pa.Table:
+    """
+    Reads the whole store as one table. Rows written with different metric sets are unified
+    (missing columns become null). `columns` and `filter` (a pyarrow.dataset expression, e.g.
+    pads.field("model") == "bert-base-cased") are pushed down, so partitions are pruned.
+    """
+    dataset = pads.dataset(store_dir, format="parquet", partitioning="hive")
+    schemas = {f.physical_schema for f in dataset.get_fragments()}
+    if len(schemas) > 1:
+        schema = pa.unify_schemas(list(schemas) + [dataset.partitioning.schema])
+        dataset = pads.dataset(store_dir, format="parquet", partitioning="hive", schema=schema)
+    return dataset.to_table(columns=columns, filter=filter)
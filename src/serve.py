@@ -0,0 +1,220 @@
+"""
+Local HTTP NER service with dynamic micro-batching (stdlib asyncio, no web framework).
+
+    python -m src.serve --model_dir outputs/<run_name> --port 8080 --max_batch_size 32 --max_wait_ms 10
+
+Endpoints:
+    POST /predict  {"tokens": [...]} or {"text": "..."}, optional "noise_profile": "<path under --profiles_dir>"
+                   -> {"tokens": [...], "tags": [...]}
+    GET  /health   -> {"status": "ok"}
+    GET  /stats    -> request/batch counters
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from .predict import build_noiser, load_ner_model, predict_batch
+from .train import load_profile
+
+WORD_RE = re.compile(r"\w+(?:[-'.]\w+)*|[^\w\s]", re.UNICODE)
+MAX_BODY_BYTES = 1 << 20
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches: a batch is dispatched when it reaches
+    `max_batch_size` or `max_wait_ms` after its first request arrived. Model calls run on a
+    single worker thread so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, model, tokenizer, max_length: int, max_batch_size: int, max_wait_ms: float):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ner-model")
+        self.stats = {"requests": 0, "batches": 0, "batch_size_hist": {}, "model_seconds": 0.0}
+
+    async def predict(self, tokens: List[str]) -> List[str]:
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((tokens, fut))
+        return await fut
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch: List[Tuple[List[str], asyncio.Future]]):
+        start = time.perf_counter()
+        try:
+            tags = await asyncio.get_running_loop().run_in_executor(
+                self.executor, predict_batch, self.model, self.tokenizer, [t for t, _ in batch], self.max_length
+            )
+        except Exception as e:  # fail the requests, keep serving
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats["model_seconds"] += time.perf_counter() - start
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+        hist = self.stats["batch_size_hist"]
+        hist[len(batch)] = hist.get(len(batch), 0) + 1
+        for (_, fut), t in zip(batch, tags):
+            if not fut.done():
+                fut.set_result(t)
+
+
+class NERService:
+    def __init__(self, batcher: MicroBatcher, profiles_dir: str, seed: int):
+        self.batcher = batcher
+        self.profiles_dir = os.path.realpath(profiles_dir)
+        self.seed = seed
+        self.noisers: Dict[str, Callable] = {}
+        # noise ops use the global RNGs (each noiser swaps in its own stream); keep them on one thread
+        self.noise_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="noise")
+
+    def _build_noiser(self, path: str):
+        return build_noiser(load_profile(path), self.batcher.model.config.id2label, self.seed)
+
+    async def _noiser(self, profile_path: str):
+        path = os.path.realpath(os.path.join(self.profiles_dir, profile_path))
+        if not path.startswith(self.profiles_dir + os.sep) or not os.path.isfile(path):
+            raise ValueError(f"unknown noise_profile: {profile_path}")
+        if path not in self.noisers:
+            # built on the noise thread: keeps the event loop free while the profile loads
+            noiser = await asyncio.get_running_loop().run_in_executor(self.noise_executor, self._build_noiser, path)
+            self.noisers.setdefault(path, noiser)
+        return self.noisers[path]
+
+    async def handle_predict(self, payload: dict) -> dict:
+        if "tokens" in payload:
+            tokens = payload["tokens"]
+            if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+                raise ValueError("'tokens' must be a list of strings")
+        elif isinstance(payload.get("text"), str):
+            tokens = WORD_RE.findall(payload["text"])
+        else:
+            raise ValueError("expected 'tokens' or 'text'")
+
+        response = {}
+        if payload.get("noise_profile"):
+            noise = await self._noiser(payload["noise_profile"])
+            noised = await asyncio.get_running_loop().run_in_executor(
+                self.noise_executor, noise, {"tokens": tokens})
+            response["original_tokens"] = tokens
+            tokens = noised["tokens"]
+        response["tokens"] = tokens
+        response["tags"] = await self.batcher.predict(tokens) if tokens else []
+        return response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, result = await self._route(method, path, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, result, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        path = path.split("?", 1)[0]
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.batcher.stats
+        if method == "POST" and path == "/predict":
+            try:
+                return 200, await self.handle_predict(json.loads(body or b"{}"))
+            except (ValueError, json.JSONDecodeError) as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+        return 404, {"error": "not found"}
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: dict, close: bool):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                  500: "Internal Server Error"}[status]
+        head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(args):
+    model, tokenizer = load_ner_model(args.model_dir, args.device)
+    batcher = MicroBatcher(model, tokenizer, args.max_length, args.max_batch_size, args.max_wait_ms)
+    service = NERService(batcher, args.profiles_dir, args.seed)
+    batch_loop = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.handle_connection, args.host, args.port)
+    print(f"[serve] {args.model_dir} on http://{args.host}:{args.port} "
+          f"(max_batch_size={args.max_batch_size}, max_wait_ms={args.max_wait_ms})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_loop.cancel()
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model_dir", required=True, help="Directory written by src.train --save_model")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--max_batch_size", type=int, default=32)
+    ap.add_argument("--max_wait_ms", type=float, default=10.0, help="Max time a request waits for batch-mates")
+    ap.add_argument("--max_length", type=int, default=256)
+    ap.add_argument("--profiles_dir", default="src/profiles", help="noise_profile paths are resolved inside this dir")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,37 @@
 import argparse
+import json
 import os
 import random
+import sys
+from typing import Dict, List, Optional
 import numpy as np
 import torch
-import yaml
 from transformers import (
     AutoTokenizer, AutoModelForTokenClassification,
-    DataCollatorForTokenClassification, Trainer, TrainingArguments, set_seed
+    DataCollatorForTokenClassification, Trainer, TrainingArguments, set_seed,
+    EarlyStoppingCallback,
 )
-from datasets import DatasetDict
+from datasets import Dataset, DatasetDict
 
-from .data_preprocessing import load_conll2003, build_label_maps, tokenize_and_align, tokenize_and_align_chars
-from .metrics import compute_metrics_builder
-from .noise import TOKEN_NOISE, LABEL_NOISE
+from .data_preprocessing import (
+    load_conll2003, build_label_maps, tokenize_and_align, tokenize_and_align_chars, stratified_subsample_indices,
+    sentence_lengths, document_ids, conll_document_ids, pack_sentences, nested_subset_rows,
+)
+from .metrics import compute_metrics_builder, summarize_realizations, word_level_predictions
+from .results_store import append_run, build_run_record
+from .noise_stats import align_tokens, noise_report, print_report
+from .noise_shards import noise_split_sharded, shard_key
+from .export_noised import export_noised, profile_hash
+from .error_analysis import (
+    analyze, build_records, indexed_word_ids, print_analysis, scored_word_ids, write_records
+)
+from .cpu_perf import available_cores, configure_cpu_perf
+from .callbacks import TimeBudgetCallback, stop_reason
+from .char_compact import CharLabelCollator, gather_label_logits, tokenize_chars_compact
+from .online_noise import NoiseEpochCallback, OnlineNoiseTransform, online_train_dataset
+from .prefetch import prefetch_resources
+from .profile_config import compose_profile, expand_grid
+from .noise import TOKEN_NOISE, LABEL_NOISE, BATCHED_TOKEN_NOISE, instrumentation
 
 def seed_all(seed: int):
     set_seed(seed)
@@ -22,10 +41,46 @@ def seed_all(seed: int):
     torch.cuda.manual_seed_all(seed)
 
 def load_profile(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    """A single profile with its `base` chain merged in (see profile_config)."""
+    profile = compose_profile(path)
+    if profile.get("grid"):
+        raise ValueError(f"{path} defines a parameter grid; only src.train expands grids")
+    return profile
+
+def load_profile_variants(path: str):
+    """(profile name, profile) per grid point of the profile at `path`."""
+    return expand_grid(compose_profile(path), os.path.basename(path).replace(".yaml", ""))
+
+def load_tokenizer(model_name: str):
+    # Special case for some models
+    if any(x in model_name.lower() for x in ["roberta", "deberta", "xlnet"]):
+        return AutoTokenizer.from_pretrained(model_name, add_prefix_space=True)
+    return AutoTokenizer.from_pretrained(model_name)
+
+def load_model(model_name: str, id2label, label2id, seed: int):
+    # reseeded here so the classifier head init does not depend on when (or in which thread) this runs
+    torch.manual_seed(seed)
+    return AutoModelForTokenClassification.from_pretrained(
+        model_name,
+        num_labels=len(id2label),
+        id2label=id2label,
+        label2id=label2id,
+    )
     
-def build_mappers(profile, id2label, label2id, id2pos):
+def word_index(dataset):
+    """(example_ids, word_ids) of a windowed/packed tokenized dataset, None for one row per sentence."""
+    if "word_ids" not in dataset.column_names:
+        return None
+    return np.asarray(dataset["example_id"]), np.asarray(dataset["word_ids"])
+
+def _mark(ops, name):
+    return f"{ops}+{name}" if ops else name
+
+def build_mappers(profile, id2label, label2id, id2pos, track_provenance: bool = False):
+    """
+    Token and label mappers for Dataset.map. With `track_provenance`, a "noise_ops" column lists
+    per token the noise functions that changed it ("" = clean, "typo_tokens+apply_label_noise_on_spans", ...).
+    """
     token_steps = profile.get("token_noise", [])
     label_steps = profile.get("label_noise", [])
 
@@ -33,11 +88,17 @@ def build_mappers(profile, id2label, label2id, id2pos):
         tokens = example["tokens"]
         ner_tags = example["ner_tags"]
         pos_tags = [id2pos[tag_id] for tag_id in example["pos_tags"]]
+        prof = instrumentation.PROFILER
+        if track_provenance:
+            noise_ops = example.get("noise_ops") or [""] * len(tokens)
 
         for step in token_steps:
             name = step["name"]
             fn = TOKEN_NOISE[name]
             params = step.get("params", {})
+            before = tokens
+            if prof is not None:
+                start = instrumentation.perf_counter()
             # adapt signatures per function
             if name == "typo_tokens":
                 tokens = fn(tokens, ner_tags, id2label, **params)
@@ -52,75 +113,471 @@ def build_mappers(profile, id2label, label2id, id2pos):
             else:
                 # word-level ops not used directly; keep for extensibility
                 pass
+            if prof is not None:
+                prof.record_call(name, len(before), instrumentation.count_changed(before, tokens),
+                                 instrumentation.perf_counter() - start)
+            if track_provenance and tokens is not before:
+                source, _ = align_tokens(before, tokens)
+                if len(before) == len(tokens):
+                    noise_ops = [o if s >= 0 else _mark(o, name) for o, s in zip(noise_ops, source)]
+                else:
+                    noise_ops = [noise_ops[s] if s >= 0 else name for s in source]
 
+        if track_provenance:
+            return {"tokens": tokens, "ner_tags": ner_tags, "noise_ops": noise_ops}
         return {"tokens": tokens, "ner_tags": ner_tags}
 
     def label_mapper(example):
         tokens = example["tokens"]
         ner_tags = example["ner_tags"]
+        prof = instrumentation.PROFILER
+
+        if track_provenance:
+            noise_ops = example.get("noise_ops") or [""] * len(tokens)
 
         for step in label_steps:
             name = step["name"]
             fn = LABEL_NOISE[name]
             params = step.get("params", {})
+            before = ner_tags
+            if prof is not None:
+                start = instrumentation.perf_counter()
             ner_tags = fn(tokens, ner_tags, id2label, label2id, **params)
+            if prof is not None:
+                prof.record_call(name, len(before), instrumentation.count_changed(before, ner_tags),
+                                 instrumentation.perf_counter() - start)
+            if track_provenance:
+                noise_ops = [_mark(o, name) if a != b else o for o, a, b in zip(noise_ops, before, ner_tags)]
+        if track_provenance:
+            return {"ner_tags": ner_tags, "noise_ops": noise_ops}
         return {"ner_tags": ner_tags}
 
     return token_mapper, label_mapper
 
-def apply_profile(ds: DatasetDict, profile, id2label, label2id, id2pos):
+def build_batched_token_mapper(profile, id2label, label2id, id2pos, track_provenance: bool = False):
+    """
+    Batched variant of the token mapper: each step runs over the whole batch before the next one,
+    using the BATCHED_TOKEN_NOISE implementation where one exists (e.g. semantic_noise samples the
+    positions of all sentences at once). Same per-sentence distributions, different RNG stream.
+    """
+    steps = [(step, build_mappers({"token_noise": [step]}, id2label, label2id, id2pos, track_provenance)[0])
+             for step in profile.get("token_noise", [])]
+
+    def batch_mapper(batch):
+        rows = [{"tokens": t, "ner_tags": n, "pos_tags": p} for t, n, p in
+                zip(batch["tokens"], batch["ner_tags"], batch["pos_tags"])]
+        if track_provenance and "noise_ops" in batch:
+            for row, ops in zip(rows, batch["noise_ops"]):
+                row["noise_ops"] = ops
+        prof = instrumentation.PROFILER
+
+        for step, mapper in steps:
+            name = step["name"]
+            if name not in BATCHED_TOKEN_NOISE:
+                for row in rows:
+                    row.update(mapper(row))
+                continue
+            start = instrumentation.perf_counter() if prof is not None else 0.0
+            noised = BATCHED_TOKEN_NOISE[name](
+                [r["tokens"] for r in rows], [[id2pos[t] for t in r["pos_tags"]] for r in rows],
+                [r["ner_tags"] for r in rows], id2label, **step.get("params", {}))
+            per_row = (instrumentation.perf_counter() - start) / max(len(rows), 1) if prof is not None else 0.0
+            for row, tokens in zip(rows, noised):
+                if prof is not None:
+                    prof.record_call(name, len(row["tokens"]), instrumentation.count_changed(row["tokens"], tokens),
+                                     per_row)
+                if track_provenance:
+                    ops = row.get("noise_ops") or [""] * len(tokens)
+                    row["noise_ops"] = [_mark(o, name) if a != b else o for o, a, b in zip(ops, row["tokens"], tokens)]
+                row["tokens"] = tokens
+
+        out = {"tokens": [r["tokens"] for r in rows], "ner_tags": [r["ner_tags"] for r in rows]}
+        if track_provenance:
+            out["noise_ops"] = [r.get("noise_ops") or [""] * len(r["tokens"]) for r in rows]
+        return out
+
+    return batch_mapper
+
+def apply_profile(ds: DatasetDict, profile, id2label, label2id, id2pos, op_stats_path: str = None,
+                  track_provenance: bool = False, batched_noise: bool = False):
+    """
+    Applies the profile's token and label noise to the splits listed in its scope.
+    If `op_stats_path` is given, per-op noise statistics are collected and exported there as JSON.
+    With `track_provenance`, noised splits get a per-token "noise_ops" column (see build_mappers).
+    With `batched_noise`, token noise is mapped in batches (see build_batched_token_mapper).
+    """
     scope = profile.get("scope", {})
-    token_scopes = scope.get("token_noise", []) # e.g., ["test"] or ["train","test"]
-    label_scopes = scope.get("label_noise", [])
+    stages = [
+        ("token", scope.get("token_noise") or [], profile.get("token_noise")), # e.g., ["test"] or ["train","test"]
+        ("label", scope.get("label_noise") or [], profile.get("label_noise")),
+    ]
 
-    token_mapper, label_mapper = build_mappers(profile, id2label, label2id, id2pos)
+    token_mapper, label_mapper = build_mappers(profile, id2label, label2id, id2pos, track_provenance)
+    mappers = {"token": token_mapper, "label": label_mapper}
     use_cache = False
-    if token_scopes:
-        if "train" in token_scopes and profile.get("token_noise"):
-            print("[apply_profile] Mapping token noise on TRAIN...")
-            ds["train"] = ds["train"].map(
-                token_mapper,
-                load_from_cache_file=use_cache,
-                desc="Applying token noise (train)"
-            )
-        if "validation" in token_scopes and profile.get("token_noise"):
-            print("[apply_profile] Mapping token noise on VALIDATION...")
-            ds["validation"] = ds["validation"].map(
-                token_mapper,
-                load_from_cache_file=use_cache,
-                desc="Applying token noise (validation)"
-            )
-        if "test" in token_scopes and profile.get("token_noise"):
-            print("[apply_profile] Mapping token noise on TEST...")
-            ds["test"] = ds["test"].map(
-                token_mapper,
-                load_from_cache_file=use_cache,
-                desc="Applying token noise (test)"
-            )
-    if label_scopes:
-        if "train" in label_scopes and profile.get("label_noise"):
-            print("[apply_profile] Mapping label noise on TRAIN...")
-            ds["train"] = ds["train"].map(
-                label_mapper,
-                load_from_cache_file=use_cache,
-                desc="Applying label noise (train)"
-            )
-        if "validation" in label_scopes and profile.get("label_noise"):
-            print("[apply_profile] Mapping label noise on VALIDATION...")
-            ds["validation"] = ds["validation"].map(
-                label_mapper,
-                load_from_cache_file=use_cache,
-                desc="Applying label noise (validation)"
-            )
-        if "test" in label_scopes and profile.get("label_noise"):
-            print("[apply_profile] Mapping label noise on TEST...")
-            ds["test"] = ds["test"].map(
-                label_mapper,
+    prof = instrumentation.enable_profiling() if op_stats_path else None
+
+    for kind, scopes, steps in stages:
+        if not steps:
+            continue
+        for split in ("train", "validation", "test"):
+            if split not in scopes:
+                continue
+            print(f"[apply_profile] Mapping {kind} noise on {split.upper()}...")
+            if prof is not None:
+                prof.begin(split)
+            batched = batched_noise and kind == "token"
+            ds[split] = ds[split].map(
+                build_batched_token_mapper(profile, id2label, label2id, id2pos, track_provenance) if batched
+                else mappers[kind],
+                batched=batched,
                 load_from_cache_file=use_cache,
-                desc="Applying label noise (test)"
+                desc=f"Applying {kind} noise ({split})"
             )
+
+    if prof is not None:
+        instrumentation.disable_profiling()
+        prof.print_summary()
+        prof.export(op_stats_path)
+        print(f"[apply_profile] Noise op statistics written to {op_stats_path}")
+    return ds
+
+def apply_profile_sharded(ds: DatasetDict, profile, id2label, label2id, id2pos, shard_dir: str, seed: int,
+                          shard_size: int = 2000, claim_timeout: float = 600.0, track_provenance: bool = False,
+                          batched_noise: bool = False, wait: bool = True):
+    """
+    apply_profile in resumable shards shared with other processes (see noise_shards). The token
+    and label noise of a split are applied shard by shard, each shard seeded on its own.
+    """
+    scope = profile.get("scope", {})
+    token_mapper, label_mapper = build_mappers(profile, id2label, label2id, id2pos, track_provenance)
+    if batched_noise:
+        token_stage = (build_batched_token_mapper(profile, id2label, label2id, id2pos, track_provenance), True)
+    else:
+        token_stage = (token_mapper, False)
+    key = shard_key(profile, seed, shard_size=shard_size, track_provenance=track_provenance, batched_noise=batched_noise)
+    for split in ("train", "validation", "test"):
+        mappers = []
+        if profile.get("token_noise") and split in (scope.get("token_noise") or []):
+            mappers.append(token_stage)
+        if profile.get("label_noise") and split in (scope.get("label_noise") or []):
+            mappers.append((label_mapper, False))
+        if not mappers:
+            continue
+        print(f"[apply_profile] Mapping noise on {split.upper()} in shards of {shard_size} ({shard_dir}/{key})...")
+        noised = noise_split_sharded(ds[split], split, mappers, os.path.join(shard_dir, key, split), seed,
+                                     shard_size=shard_size, claim_timeout=claim_timeout, wait=wait)
+        if noised is not None:
+            ds[split] = noised
     return ds
 
+REALIZATION_SEED = 10_000  # noise seed of test realization k is REALIZATION_SEED + k, the same for every training seed
+
+def noised_realization(clean, profile, k: int, id2label, label2id, id2pos, batched_noise: bool = False):
+    """Test split noised with the profile's test noise under seed REALIZATION_SEED + k (global RNG state is restored)."""
+    scope = profile.get("scope") or {}
+    test_profile = dict(profile, scope={kind: ["test"] if "test" in (splits or []) else [] for kind, splits in scope.items()})
+    state = random.getstate(), np.random.get_state()
+    random.seed(REALIZATION_SEED + k)
+    np.random.seed(REALIZATION_SEED + k)
+    try:
+        return apply_profile(DatasetDict({"test": clean}), test_profile, id2label, label2id, id2pos,
+                             batched_noise=batched_noise)["test"]
+    finally:
+        random.setstate(state[0])
+        np.random.set_state(state[1])
+
+def train_run(args, profile_name: str, profile, ds: DatasetDict, id2label, label2id, id2pos, prefetcher, perf_kwargs,
+              tokenized_cache: Dict[str, Dataset], doc_ids: Optional[Dict[str, List[int]]] = None):
+    """
+    Noises, tokenizes, trains and evaluates one seed (args.seed) of one profile and writes its outputs
+    like a separate run. `tokenized_cache` holds tokenized clean splits and test noise realizations;
+    it is shared by all runs of the process. `doc_ids` (document index per sentence and split) keeps
+    --pack rows within a document.
+    """
+    # Create metadata for W&B
+    run_name = f"{args.model}-{profile_name}-seed{args.seed}".replace("/", "_")
+    args.out = os.path.join(args.out, run_name)
+    os.makedirs(args.out, exist_ok=True)
+
+    op_stats_path = os.path.join(args.out, "noise_op_stats.json") if args.profile_noise_ops else None
+    offline_profile = profile
+    if args.online_noise:
+        # train noise moves into the dataloader
+        scope = profile.get("scope") or {}
+        offline_profile = dict(profile, scope={k: [s for s in (v or []) if s != "train"] for k, v in scope.items()})
+    clean_ds = DatasetDict(ds)  # apply_profile replaces the noised splits
+    track_provenance = args.error_analysis or args.export_noised
+    if args.noise_shard_dir:
+        ds = apply_profile_sharded(ds, offline_profile, id2label, label2id, id2pos, args.noise_shard_dir, args.seed,
+                                   shard_size=args.noise_shard_size, track_provenance=track_provenance,
+                                   batched_noise=args.batched_noise)
+    else:
+        ds = apply_profile(ds, offline_profile, id2label, label2id, id2pos, op_stats_path=op_stats_path,
+                           track_provenance=track_provenance, batched_noise=args.batched_noise)
+    if args.export_noised:
+        export_noised(ds, os.path.join(args.out, "noised"), profile, args.seed, id2label, id2pos)
+        print(f"[train] Noised splits exported to {os.path.join(args.out, 'noised')}")
+
+    tokenizer = prefetcher.get("tokenizer")
+
+    # Different tokenization functions for different models and train/eval modes
+    def tok_map_train_normal(b, idx=None):
+        return tokenize_and_align(b, tokenizer, label_all_tokens=args.dense_train, max_length=args.max_length,
+                                  stride=args.stride, example_ids=idx)
+    def tok_map_eval_normal(b, idx=None):
+        return tokenize_and_align(b, tokenizer, label_all_tokens=False, max_length=args.max_length,
+                                  stride=args.stride, example_ids=idx)
+    def tok_map_train_char_level(b, idx=None):
+        return tokenize_and_align_chars(b, tokenizer, id2label, label2id, max_length=args.max_length,
+                                     eval_mode=not args.dense_train,  # False => dense; True => first-char
+                                     stride=args.stride, example_ids=idx)
+    def tok_map_eval_char_level(b, idx=None):
+        return tokenize_and_align_chars(b, tokenizer, id2label, label2id, max_length=args.max_length,
+                                     eval_mode=True,  # always first-char for fair eval
+                                     stride=args.stride, example_ids=idx)
+    def tok_map_train_char_compact(b, idx=None):
+        return tokenize_chars_compact(b, tokenizer, max_length=args.max_length, dense=args.dense_train)
+    def tok_map_eval_char_compact(b, idx=None):
+        return tokenize_chars_compact(b, tokenizer, max_length=args.max_length)
+
+    char_level = "canine" in args.model.lower()
+    scope = offline_profile.get("scope", {})
+    in_scope = set(scope.get("token_noise") or []) | set(scope.get("label_noise") or [])
+    noised_splits = [split for split in ds if split in in_scope]
+    noise_stats = None
+    if args.noise_report:
+        noise_stats = noise_report(clean_ds, ds, noised_splits, id2label, tokenizer,
+                                   diffs_path=os.path.join(args.out, "noise_diffs.jsonl"), max_diffs=args.noise_diffs)
+        print_report(noise_stats)
+        with open(os.path.join(args.out, "noise_report.json"), "w", encoding="utf-8") as f:
+            json.dump(noise_stats, f, indent=2)
+    clean_test = clean_ds["test"]
+    del clean_ds
+    test_sentences = ds["test"]  # per-sentence view for error analysis, also when packed
+
+    if args.pack:
+        budget = args.max_length - tokenizer.num_special_tokens_to_add()
+        for split in ds:
+            n_sentences = len(ds[split])
+            split_docs = (doc_ids or {}).get(split) or document_ids(ds[split])
+            if split_docs is None:
+                raise ValueError(f"--pack: no document boundaries for {split}; pass --conll_dir")
+            ds[split] = pack_sentences(ds[split], sentence_lengths(ds[split], tokenizer, char_level), budget,
+                                       sep_length=1 if char_level else 0, doc_ids=split_docs)
+            print(f"[train] Packed {split}: {n_sentences} sentences -> {len(ds[split])} rows")
+
+    if args.char_compact:
+        tok_maps = {"train": tok_map_train_char_compact, "validation": tok_map_eval_char_compact, "test": tok_map_eval_char_compact}
+    elif char_level:
+        tok_maps = {"train": tok_map_train_char_level, "validation": tok_map_eval_char_level, "test": tok_map_eval_char_level}
+    else:
+        tok_maps = {"train": tok_map_train_normal, "validation": tok_map_eval_normal, "test": tok_map_eval_normal}
+
+    # Windows/packing change the number of rows: keep the sentence index and drop the word-level columns
+    windowed = args.stride > 0
+    drop_columns = windowed or args.pack or args.online_noise or args.char_compact
+    tokenized = DatasetDict()
+    for split, fn in tok_maps.items():
+        if args.online_noise and split == "train":
+            continue
+        if split in tokenized_cache and split not in noised_splits:
+            tokenized[split] = tokenized_cache[split]
+            continue
+        tokenized[split] = ds[split].map(fn, batched=True, with_indices=windowed,
+                                         remove_columns=ds[split].column_names if drop_columns else None)
+        if split not in noised_splits:
+            tokenized_cache[split] = tokenized[split]  # clean: the same for every seed
+    noise_transform = None
+    if args.online_noise:
+        scope = profile.get("scope") or {}
+        token_mapper, label_mapper = build_mappers(profile, id2label, label2id, id2pos)
+        noise_transform = OnlineNoiseTransform(
+            token_mapper if "train" in (scope.get("token_noise") or []) and profile.get("token_noise") else None,
+            label_mapper if "train" in (scope.get("label_noise") or []) and profile.get("label_noise") else None,
+            tok_maps["train"], args.seed,
+        )
+        tokenized["train"] = online_train_dataset(ds["train"], noise_transform)
+
+    eval_dataset = tokenized["validation"]
+    if args.val_subsample > 0:
+        if args.pack:
+            # sample sentences, then monitor on the packed rows containing them
+            sentence_tags = [[] for _ in range(max(max(r) for r in ds["validation"]["sentence_ids"]) + 1)]
+            for tags, sids in zip(ds["validation"]["ner_tags"], ds["validation"]["sentence_ids"]):
+                for tag, sid in zip(tags, sids):
+                    sentence_tags[sid].append(tag)
+            keep = set(stratified_subsample_indices(sentence_tags, id2label, args.val_subsample, args.seed))
+            val_idxs = [i for i, sids in enumerate(ds["validation"]["sentence_ids"]) if keep.intersection(sids)]
+        else:
+            val_idxs = stratified_subsample_indices(ds["validation"]["ner_tags"], id2label, args.val_subsample, args.seed)
+        if windowed:
+            keep = set(val_idxs)
+            val_idxs = [i for i, e in enumerate(tokenized["validation"]["example_id"]) if e in keep]
+        eval_dataset = tokenized["validation"].select(val_idxs)
+        print(f"[train] Monitoring on {len(val_idxs)}/{len(tokenized['validation'])} validation rows")
+
+    # Learning curve: nested train subsets of the one tokenized split, trained and evaluated one after another
+    fractions = args.train_fractions or [None]
+    full_train = tokenized["train"]
+    base_out, base_profile_name = args.out, profile_name
+    curve = []
+    for fraction in fractions:
+        if fraction is not None:
+            profile_name = f"{base_profile_name}_frac-{fraction:g}"
+            run_name = f"{args.model}-{profile_name}-seed{args.seed}".replace("/", "_")
+            args.out = os.path.join(base_out, f"frac-{fraction:g}")
+            os.makedirs(args.out, exist_ok=True)
+            example_ids = full_train["example_id"] if windowed else None
+            rows = nested_subset_rows(len(full_train), fraction, args.seed, example_ids)
+            tokenized["train"] = full_train.select(rows)  # indices mapping, no copy
+            print(f"[train] Train fraction {fraction:g}: {len(rows)}/{len(full_train)} rows")
+
+        model_task = f"model:{args.seed}"
+        if model_task in prefetcher.futures:
+            model = prefetcher.take(model_task)
+        else:
+            model = load_model(args.model, id2label, label2id, args.seed)
+        if args.char_compact:
+            data_collator = CharLabelCollator(tokenizer, id2label, label2id)
+        else:
+            data_collator = DataCollatorForTokenClassification(tokenizer)
+
+        # Budgeted runs keep the best epoch checkpoint so the test evaluation uses it
+        budgeted = args.early_stopping_patience > 0 or args.max_minutes is not None or args.max_steps > 0
+        callbacks = []
+        early_stopping = time_budget = None
+        if args.early_stopping_patience > 0:
+            early_stopping = EarlyStoppingCallback(args.early_stopping_patience, args.early_stopping_threshold)
+            callbacks.append(early_stopping)
+        if args.max_minutes is not None:
+            time_budget = TimeBudgetCallback(args.max_minutes)
+            callbacks.append(time_budget)
+        if noise_transform is not None:
+            callbacks.append(NoiseEpochCallback(noise_transform))
+
+        training_args = TrainingArguments(
+            output_dir=args.out,
+            overwrite_output_dir=True,
+            eval_strategy="epoch",
+            save_strategy="epoch" if budgeted else "no",
+            save_total_limit=1,
+            save_only_model=True,
+            learning_rate=args.lr,
+            per_device_train_batch_size=args.batch_size,
+            per_device_eval_batch_size=args.batch_size,
+            num_train_epochs=args.epochs,
+            max_steps=args.max_steps,
+            weight_decay=0.01,
+            logging_steps=50,
+            seed=args.seed,
+            load_best_model_at_end=budgeted,
+            metric_for_best_model="f1",
+            greater_is_better=True,
+            report_to=["wandb"],
+            run_name=run_name,
+            # the online train transform and the compact char collator need their raw columns
+            remove_unused_columns=not (args.online_noise or args.char_compact),
+            **perf_kwargs,
+        )
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=tokenized["train"],
+            eval_dataset=eval_dataset,
+            processing_class=tokenizer,
+            data_collator=data_collator,
+            compute_metrics=compute_metrics_builder(id2label, word_index(eval_dataset), args.char_compact),
+            preprocess_logits_for_metrics=gather_label_logits if args.char_compact else None,
+            callbacks=callbacks,
+        )
+
+        train_result = trainer.train()
+        print(f"[train] {train_result.metrics['train_samples_per_second']:.2f} samples/sec "
+              f"({train_result.metrics['train_runtime']:.1f}s)")
+        if budgeted:
+            reason = stop_reason(trainer.state, args.max_steps, early_stopping, time_budget)
+            print(f"[train] Stop reason: {reason} at epoch {trainer.state.epoch:.2f} (step {trainer.state.global_step}); "
+                  f"best f1={trainer.state.best_metric} from {trainer.state.best_model_checkpoint}")
+        if args.save_model:
+            trainer.save_model(args.out)
+            print(f"[train] Model saved to {args.out}")
+        if args.val_subsample > 0:
+            trainer.compute_metrics = compute_metrics_builder(id2label, word_index(tokenized["validation"]), args.char_compact)
+            val_metrics = trainer.evaluate(tokenized["validation"], metric_key_prefix="full_eval")
+            print("===== VALIDATION METRICS =====")
+            for k, v in val_metrics.items():
+                if k.startswith("full_eval_"):
+                    print(f"{k.replace('full_eval_', '')}: {v:.4f}")
+        test_index = word_index(tokenized["test"])
+        trainer.compute_metrics = compute_metrics_builder(id2label, test_index, args.char_compact)
+        if args.error_analysis:
+            test_output = trainer.predict(tokenized["test"], metric_key_prefix="eval")
+            test_metrics = test_output.metrics
+            if test_index is not None:
+                scored = indexed_word_ids(*test_index)
+            else:
+                scored = dict(enumerate(scored_word_ids(test_sentences["tokens"], tokenizer, args.max_length, char_level)))
+            records = build_records(test_sentences, scored, *word_level_predictions(
+                test_output.predictions, test_output.label_ids, id2label, test_index, args.char_compact))
+            write_records(os.path.join(args.out, "test_predictions.jsonl"), records)
+            analysis = analyze(records)
+            print_analysis(analysis)
+            with open(os.path.join(args.out, "error_analysis.json"), "w", encoding="utf-8") as f:
+                json.dump(analysis, f, indent=2)
+        else:
+            test_metrics = trainer.evaluate(tokenized["test"])
+        print("===== TEST METRICS =====")
+        for k, v in test_metrics.items():
+            if k.startswith("eval_"):
+                print(f"{k.replace('eval_', '')}: {v:.4f}")
+        with open(os.path.join(args.out, "test_metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(test_metrics, f, indent=2)
+        realization_stats = None
+        if args.noise_realizations > 0 and "test" not in noised_splits:
+            print("[train] --noise_realizations: the profile does not noise the test split, skipping")
+        elif args.noise_realizations > 0:
+            runs = []
+            for k in range(args.noise_realizations):
+                key = f"test@{profile_hash(offline_profile)}@noise{k}"
+                if key not in tokenized_cache:  # shared by the seeds of this process
+                    noised = noised_realization(clean_test, offline_profile, k, id2label, label2id, id2pos, args.batched_noise)
+                    tokenized_cache[key] = noised.map(tok_maps["test"], batched=True, with_indices=windowed,
+                                                      remove_columns=noised.column_names if drop_columns else None)
+                trainer.compute_metrics = compute_metrics_builder(id2label, word_index(tokenized_cache[key]), args.char_compact)
+                metrics = trainer.evaluate(tokenized_cache[key], metric_key_prefix=f"noise{k}")
+                runs.append({m[len(f"noise{k}_"):]: v for m, v in metrics.items() if m.startswith(f"noise{k}_")})
+            realization_stats = summarize_realizations(runs)
+            print(f"===== TEST METRICS OVER {args.noise_realizations} NOISE REALIZATIONS (mean ± 95% CI) =====")
+            for m, st in realization_stats.items():
+                print(f"{m}: {st['mean']:.4f} ± {st['ci']:.4f} (std {st['std']:.4f}, n={st['n']})")
+            with open(os.path.join(args.out, "noise_realizations.json"), "w", encoding="utf-8") as f:
+                json.dump({"seeds": [REALIZATION_SEED + k for k in range(args.noise_realizations)],
+                           "runs": runs, "summary": realization_stats}, f, indent=2)
+        if args.results_store.lower() != "none":
+            op_stats = None
+            if op_stats_path:
+                with open(op_stats_path, "r", encoding="utf-8") as f:
+                    op_stats = json.load(f)
+            record = build_run_record(run_name, args.model, profile_name, args.seed, vars(args), test_metrics,
+                                      train_result.metrics, op_stats, noise_stats, realization_stats)
+            print(f"[train] Results appended to {append_run(args.results_store, record)}")
+
+        if fraction is not None:
+            curve.append({"fraction": fraction, "train_rows": len(tokenized["train"]), "run_name": run_name,
+                          **{k: v for k, v in train_result.metrics.items() if k.startswith("train_")},
+                          **{k: v for k, v in test_metrics.items() if isinstance(v, (int, float))}})
+            if sys.modules.get("wandb") is not None:
+                sys.modules["wandb"].finish()  # one W&B run per fraction
+    if curve:
+        path = os.path.join(base_out, "learning_curve.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(curve, f, indent=2)
+        print("===== LEARNING CURVE =====")
+        for point in curve:
+            print(f"{point['fraction']:g}: f1={point.get('eval_f1', float('nan')):.4f} ({point['train_rows']} rows)")
+        print(f"[train] Learning curve written to {path}")
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--model", default="bert-base-cased")
@@ -130,101 +587,200 @@ def main():
     ap.add_argument("--lr", type=float, default=3e-5)
     ap.add_argument("--max_length", type=int, default=256)
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--train_fractions", type=float, nargs="+", default=None,
+                    help="Learning curve: train and evaluate on these fractions of the (noised) train split, as nested "
+                         "seeded subsets of one tokenized dataset (not with --pack); writes <out>/learning_curve.json")
+    ap.add_argument("--seeds", type=int, nargs="+", default=None,
+                    help="Train these seeds one after another in this process (overrides --seed); each seed writes "
+                         "its own run directory and results-store row")
+    ap.add_argument("--seed_replicas", type=int, default=1,
+                    help="Split --seeds over this many concurrent processes on this node, each with an equal share "
+                         "of the cores and dataloader workers and its own W&B runs")
     ap.add_argument("--out", default="./outputs")
     ap.add_argument("--dense_train", action="store_true", help="Use dense labels during training")
+    ap.add_argument("--stride", type=int, default=0,
+                    help="Split sequences longer than --max_length into windows overlapping by this many "
+                         "subwords/chars instead of truncating (0 = truncate; must be below --max_length minus "
+                         "special tokens)")
+    ap.add_argument("--pack", action="store_true",
+                    help="Concatenate consecutive sentences of a document into rows of up to --max_length; "
+                         "evaluation is still scored per original sentence. Needs --conll_dir: the HF "
+                         "conll2003 loader drops the document boundaries")
+    ap.add_argument("--conll_dir", default=None,
+                    help="Raw CoNLL-2003 files (train.txt/valid.txt/test.txt or eng.train/eng.testa/eng.testb) "
+                         "to read the -DOCSTART- document boundaries from, for --pack")
+    ap.add_argument("--char_compact", action="store_true",
+                    help="CANINE: store only word first-char offsets and tags, pad per batch and build the char labels "
+                         "in the collator; evaluation keeps only the logits at word starts")
+    ap.add_argument("--online_noise", action="store_true",
+                    help="Apply the profile's train noise per batch in the dataloader, with a new realization "
+                         "every epoch, instead of once before training")
+    ap.add_argument("--batched_noise", action="store_true",
+                    help="Map token noise in batches (semantic_noise samples positions for the whole batch at once); "
+                         "same noise distributions as the default per-sentence mapping, different realizations")
+    ap.add_argument("--noise_shard_dir", default=None,
+                    help="Noise in resumable shards under this directory, shared with other src.train / "
+                         "src.noise_shards processes working on the same profile and seed (see src.noise_shards)")
+    ap.add_argument("--noise_shard_size", type=int, default=2000, help="Sentences per noise shard")
+    ap.add_argument("--profile_noise_ops", action="store_true",
+                    help="Collect per-op noise statistics and write them to <out>/noise_op_stats.json")
+    ap.add_argument("--noise_report", action="store_true",
+                    help="Compare noised splits with the clean data and write <out>/noise_report.json")
+    ap.add_argument("--noise_diffs", type=int, default=0,
+                    help="With --noise_report: write up to N changed sentences per split to <out>/noise_diffs.jsonl")
+    ap.add_argument("--error_analysis", action="store_true",
+                    help="Track which noise functions changed each token, keep the word-level test predictions "
+                         "(<out>/test_predictions.jsonl) and write span-level error analysis (<out>/error_analysis.json)")
+    ap.add_argument("--export_noised", action="store_true",
+                    help="Export the noised splits with per-token noise provenance to <out>/noised (see src.export_noised)")
+    ap.add_argument("--noise_realizations", type=int, default=0,
+                    help="After training, also evaluate on K independently noised test realizations (seeded "
+                         "independently of --seed) and report mean/CI per metric in <out>/noise_realizations.json")
+    ap.add_argument("--cpu_perf", action="store_true",
+                    help="CPU training profile: tuned thread counts, dataloader workers, bf16 autocast where supported")
+    ap.add_argument("--concurrent_jobs", type=int, default=1, help="Runs sharing this node (for --cpu_perf)")
+    ap.add_argument("--dataloader_workers", type=int, default=None,
+                    help="Override worker count (for --cpu_perf and --online_noise)")
+    ap.add_argument("--torch_compile", action="store_true", help="torch.compile the model")
+    ap.add_argument("--early_stopping_patience", type=int, default=0,
+                    help="Stop after this many evaluations without validation f1 improvement (0 = off)")
+    ap.add_argument("--early_stopping_threshold", type=float, default=0.0, help="Minimum f1 improvement")
+    ap.add_argument("--max_minutes", type=float, default=None, help="Wall-clock training budget per run")
+    ap.add_argument("--max_steps", type=int, default=-1, help="Optimizer step budget per run (overrides --epochs)")
+    ap.add_argument("--save_model", action="store_true",
+                    help="Save the final (or best) model and tokenizer to <out> for src.predict")
+    ap.add_argument("--val_subsample", type=int, default=0,
+                    help="Monitor training on this many validation sentences (stratified by entity type); "
+                         "the full validation set is evaluated once at the end (0 = off)")
+    ap.add_argument("--results_store", default=None,
+                    help="Parquet run-results store the test metrics are appended to "
+                         "(default: <out>/results; 'none' to disable)")
+    ap.add_argument("--prefetch_workers", type=int, default=4,
+                    help="Threads loading the noise resources, tokenizer and model while the data is read and noised "
+                         "(0 = load them inline)")
     args = ap.parse_args()
+    if args.pack and args.stride > 0:
+        ap.error("--pack and --stride are mutually exclusive")
+    if args.pack and not args.conll_dir:
+        ap.error("--pack must not cross documents, and the HF conll2003 loader drops the -DOCSTART- "
+                 "boundaries; pass --conll_dir with the raw CoNLL-2003 files")
+    if args.stride < 0:
+        ap.error("--stride must be >= 0")
+    if args.stride > 0:
+        # windows hold max_length minus the special tokens (subwords, or chars for CANINE)
+        window = args.max_length - load_tokenizer(args.model).num_special_tokens_to_add(pair=False)
+        if args.stride >= window:
+            ap.error(f"--stride must be smaller than the window of {window} (--max_length {args.max_length} "
+                     f"minus special tokens)")
+    if args.noise_shard_dir and args.profile_noise_ops:
+        ap.error("--profile_noise_ops needs all noise in this process; drop --noise_shard_dir")
+    if args.train_fractions and not all(0 < f <= 1 for f in args.train_fractions):
+        ap.error("--train_fractions must be in (0, 1]")
+    if args.train_fractions and args.pack:
+        ap.error("--train_fractions samples sentences, but --pack trains on multi-sentence rows; drop --pack")
+    if args.char_compact and ("canine" not in args.model.lower() or args.pack or args.stride > 0):
+        ap.error("--char_compact is for char-level (CANINE) models without --pack/--stride")
+    if args.noise_realizations > 0 and args.pack:
+        ap.error("--noise_realizations evaluates single sentences; drop --pack")
+    if args.online_noise and (args.pack or args.stride > 0):
+        ap.error("--online_noise works on single sentences; drop --pack/--stride")
+    if args.seed_replicas < 1:
+        ap.error("--seed_replicas must be >= 1")
 
-    seed_all(args.seed)
+    seeds = args.seeds or [args.seed]
+    replicas = min(args.seed_replicas, len(seeds))
+    if replicas > 1:
+        run_seed_replicas(args, seeds, replicas)
+    else:
+        run(args)
 
-    ds = load_conll2003()
-    id2label, label2id = build_label_maps(ds["train"].features, "ner_tags")
 
-    id2pos, pos2id = build_label_maps(ds["train"].features, "pos_tags")
+def _run_replica(args: argparse.Namespace):
+    run(args)
+    if sys.modules.get("wandb") is not None:
+        sys.modules["wandb"].finish()
 
-    profile = load_profile(args.profile)
-    ds = apply_profile(ds, profile, id2label, label2id, id2pos)
 
-    tokenizer = AutoTokenizer.from_pretrained(args.model)
+def run_seed_replicas(args: argparse.Namespace, seeds, replicas: int):
+    """
+    Trains the seeds in `replicas` spawned processes (seeds dealt round-robin). Each replica budgets
+    its threads and dataloader workers for concurrent_jobs * replicas runs on this node and logs its
+    own W&B runs; run directories and results-store rows are per seed as with one process.
+    """
+    import multiprocessing as mp
 
-    # Special case for some models
-    if any(x in args.model.lower() for x in ["roberta", "deberta", "xlnet"]):
-        tokenizer = AutoTokenizer.from_pretrained(args.model, add_prefix_space=True)
+    ctx = mp.get_context("spawn")  # no forked torch/OpenMP or prefetch thread state
+    procs = []
+    for r in range(replicas):
+        replica_args = argparse.Namespace(**vars(args))
+        replica_args.seeds = seeds[r::replicas]
+        replica_args.seed_replicas = 1
+        replica_args.concurrent_jobs = args.concurrent_jobs * replicas
+        print(f"[train] Replica {r + 1}/{replicas}: seeds {replica_args.seeds}")
+        proc = ctx.Process(target=_run_replica, args=(replica_args,), name=f"seed-replica-{r}")
+        proc.start()
+        procs.append(proc)
+    failed = []
+    for proc in procs:
+        proc.join()
+        if proc.exitcode != 0:
+            failed.append(f"{proc.name} (exit code {proc.exitcode})")
+    if failed:
+        raise SystemExit(f"[train] Seed replicas failed: {', '.join(failed)}")
 
-    # Different tokenization functions for different models and train/eval modes
-    def tok_map_train_normal(b): 
-        return tokenize_and_align(b, tokenizer, label_all_tokens=args.dense_train, max_length=args.max_length)
-    def tok_map_eval_normal(b): 
-        return tokenize_and_align(b, tokenizer, label_all_tokens=False, max_length=args.max_length)
-    def tok_map_train_char_level(b):
-        return tokenize_and_align_chars(b, tokenizer, id2label, label2id, max_length=args.max_length,
-                                     eval_mode=not args.dense_train)  # False => dense; True => first-char
-    def tok_map_eval_char_level(b):
-        return tokenize_and_align_chars(b, tokenizer, id2label, label2id, max_length=args.max_length,
-                                     eval_mode=True)  # always first-char for fair eval
-
-    if "canine" in args.model.lower():
-        tokenized = DatasetDict({
-            "train": ds["train"].map(tok_map_train_char_level, batched=True),
-            "validation": ds["validation"].map(tok_map_eval_char_level, batched=True),
-            "test": ds["test"].map(tok_map_eval_char_level, batched=True),
-        })
-    else:
-        tokenized = DatasetDict({
-            "train": ds["train"].map(tok_map_train_normal, batched=True),
-            "validation": ds["validation"].map(tok_map_eval_normal, batched=True),
-            "test": ds["test"].map(tok_map_eval_normal, batched=True),
-        })
-
-    model = AutoModelForTokenClassification.from_pretrained(
-        args.model,
-        num_labels=len(id2label),
-        id2label=id2label,
-        label2id=label2id,
-    )
-    data_collator = DataCollatorForTokenClassification(tokenizer)
 
-    # Create metadata for W&B
-    profile_name = os.path.basename(args.profile).replace(".yaml", "")
-    run_name = f"{args.model}-{profile_name}-seed{args.seed}".replace("/", "_")
+def run(args: argparse.Namespace):
+    perf_kwargs = {"torch_compile": args.torch_compile}
+    if args.cpu_perf:
+        perf_kwargs = configure_cpu_perf(args.concurrent_jobs, args.dataloader_workers, args.torch_compile)
+    elif args.concurrent_jobs > 1:
+        # without the full CPU profile, still keep concurrent runs off each other's cores
+        torch.set_num_threads(max(1, available_cores() // args.concurrent_jobs))
+    if args.online_noise:
+        if args.dataloader_workers is not None:
+            perf_kwargs["dataloader_num_workers"] = args.dataloader_workers
+        # workers must be re-created each epoch to pick up the new noise epoch
+        perf_kwargs["dataloader_persistent_workers"] = False
 
-    args.out = os.path.join(args.out, run_name)
-    os.makedirs(args.out, exist_ok=True)
+    seeds = args.seeds or [args.seed]
+    if args.results_store is None:
+        args.results_store = os.path.join(args.out, "results")
+    # seeded before the background model load starts; later seeds reseed between runs
+    seed_all(seeds[0])
 
-    training_args = TrainingArguments(
-        output_dir=args.out,
-        overwrite_output_dir=True,
-        eval_strategy="epoch",
-        save_strategy="no",
-        save_total_limit=1,
-        learning_rate=args.lr,
-        per_device_train_batch_size=args.batch_size,
-        per_device_eval_batch_size=args.batch_size,
-        num_train_epochs=args.epochs,
-        weight_decay=0.01,
-        logging_steps=50,
-        seed=args.seed,
-        load_best_model_at_end=False,
-        metric_for_best_model="f1",
-        greater_is_better=True,
-        report_to=["wandb"],
-        run_name=run_name,
-    )
-    trainer = Trainer(
-        model=model,
-        args=training_args,
-        train_dataset=tokenized["train"],
-        eval_dataset=tokenized["validation"],
-        processing_class=tokenizer,
-        data_collator=data_collator,
-        compute_metrics=compute_metrics_builder(id2label),
-    )
+    # Resources the profiles need load in the background while the dataset is read
+    variants = load_profile_variants(args.profile)
+    if len(variants) > 1:
+        print(f"[train] {args.profile}: {len(variants)} grid variants x {len(seeds)} seed(s)")
+    prefetcher = prefetch_resources([profile for _, profile in variants], args.prefetch_workers)
+    prefetcher.submit("tokenizer", load_tokenizer, args.model)
+
+    ds = load_conll2003()
+    id2label, label2id = build_label_maps(ds["train"].features, "ner_tags")
+
+    id2pos, pos2id = build_label_maps(ds["train"].features, "pos_tags")
+    doc_ids = conll_document_ids(ds, args.conll_dir) if args.pack else None
+
+    def load_model_after_contextual():
+        # the fill-mask model is loaded first: model loading may draw from the torch RNG
+        prefetcher.wait([name for name in prefetcher.futures if name.startswith("contextual:")])
+        return load_model(args.model, id2label, label2id, seeds[0])
+    prefetcher.submit(f"model:{seeds[0]}", load_model_after_contextual)
 
-    trainer.train()
-    test_metrics = trainer.evaluate(tokenized["test"])
-    print("===== TEST METRICS =====")
-    for k, v in test_metrics.items():
-        if k.startswith("eval_"):
-            print(f"{k.replace('eval_', '')}: {v:.4f}")
+    # Runs of one process share the data load, tokenizer, noise resources and the tokenization of clean splits
+    tokenized_cache = {}
+    runs = [(name, profile, seed) for name, profile in variants for seed in seeds]
+    for i, (profile_name, profile, seed) in enumerate(runs):
+        run_args = argparse.Namespace(**vars(args))
+        run_args.seed = seed
+        if i > 0:
+            seed_all(seed)
+            print(f"[train] {profile_name} seed {seed} ({i + 1}/{len(runs)})")
+        train_run(run_args, profile_name, profile, DatasetDict(ds), id2label, label2id, id2pos, prefetcher, perf_kwargs,
+                  tokenized_cache, doc_ids)
+        if len(runs) > 1 and sys.modules.get("wandb") is not None:
+            sys.modules["wandb"].finish()  # one W&B run per seed and variant
+    prefetcher.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import functools
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+from datasets import Dataset
+
+from src.noise_shards import CLAIM_SUFFIX, noise_split_sharded, shard_key
+
+ROWS, SHARD_SIZE = 10, 3  # 4 shards, the last one short
+
+
+def _noise(example, log=None):
+    if log:
+        with open(log, "a", encoding="utf-8") as f:
+            f.write(f"{example['idx']}\n")
+    example["noise"] = random.random()
+    return example
+
+
+def _dataset():
+    return Dataset.from_dict({"idx": list(range(ROWS))})
+
+
+def _run(out_dir, log=None, **kwargs):
+    kwargs.setdefault("shard_size", SHARD_SIZE)
+    kwargs.setdefault("poll", 0.1)
+    return noise_split_sharded(_dataset(), "train", [(functools.partial(_noise, log=log), False)], str(out_dir),
+                               seed=42, **kwargs)
+
+
+def _logged(log):
+    with open(log, "r", encoding="utf-8") as f:
+        return sorted(int(line) for line in f)
+
+
+def _worker(out_dir, log, results):
+    noised = _run(out_dir, log)
+    results.put(noised["noise"])
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _write_claim(out_dir, index, host, pid):
+    os.makedirs(out_dir, exist_ok=True)
+    claim = os.path.join(out_dir, f"shard-{index:05d}{CLAIM_SUFFIX}")
+    with open(claim, "w", encoding="utf-8") as f:
+        json.dump({"host": host, "pid": pid, "time": time.time()}, f)
+    return claim
+
+
+def test_result_independent_of_process(tmp_path):
+    alone = _run(tmp_path / "a")
+    assert alone["idx"] == list(range(ROWS))
+    # shards are seeded by (seed, split, index) only, so a fresh directory reproduces the split
+    assert _run(tmp_path / "b")["noise"] == alone["noise"]
+
+
+def test_racing_workers_noise_each_row_once(tmp_path):
+    ctx = mp.get_context("fork")  # workers run this test module's functions
+    results = ctx.Queue()
+    log = str(tmp_path / "log")
+    workers = [ctx.Process(target=_worker, args=(str(tmp_path / "shards"), log, results)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    outputs = [results.get(timeout=60) for _ in workers]
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+    assert _logged(log) == list(range(ROWS))
+    assert all(out == outputs[0] for out in outputs)
+    assert outputs[0] == _run(tmp_path / "alone")["noise"]
+
+
+def test_resume_noises_only_missing_shards(tmp_path):
+    first = _run(tmp_path)
+    shutil.rmtree(tmp_path / "shard-00001")
+    log = str(tmp_path / "log")
+    resumed = _run(tmp_path, log)
+    assert _logged(log) == [3, 4, 5]
+    assert resumed["noise"] == first["noise"]
+
+
+def test_claim_of_dead_process_is_taken_over(tmp_path):
+    claim = _write_claim(tmp_path, 0, socket.gethostname(), _dead_pid())
+    noised = _run(tmp_path, wait=False)
+    assert noised is not None and len(noised) == ROWS
+    assert not os.path.exists(claim)
+
+
+def test_claim_without_heartbeat_is_taken_over(tmp_path):
+    claim = _write_claim(tmp_path, 0, "some-other-host", 1)
+    old = time.time() - 120
+    os.utime(claim, (old, old))
+    assert _run(tmp_path, wait=False, claim_timeout=60) is not None
+
+
+def test_live_claim_is_left_alone(tmp_path):
+    claim = _write_claim(tmp_path, 2, socket.gethostname(), os.getpid())
+    assert _run(tmp_path, wait=False) is None
+    assert os.path.exists(claim) and not os.path.isdir(tmp_path / "shard-00002")
+    assert all(os.path.isdir(tmp_path / f"shard-{i:05d}") for i in (0, 1, 3))
+
+
+def test_other_shard_size_or_split_size_is_refused(tmp_path):
+    _run(tmp_path)
+    with pytest.raises(ValueError, match="shard_size"):
+        _run(tmp_path, shard_size=SHARD_SIZE + 1)
+    with pytest.raises(ValueError, match="rows"):
+        noise_split_sharded(Dataset.from_dict({"idx": list(range(ROWS + 1))}), "train", [(_noise, False)],
+                            str(tmp_path), seed=42, shard_size=SHARD_SIZE)
+
+
+def test_shard_key_covers_shard_size():
+    profile = {"token_noise": [{"name": "typo_tokens", "params": {"p": 0.1}}]}
+    assert shard_key(profile, 42, shard_size=2000) != shard_key(profile, 42, shard_size=1000)
+    assert shard_key(profile, 42, shard_size=2000) == shard_key(profile, 42, shard_size=2000)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from src.noise.sampling import segment_offsets, weighted_topk_segments
+
+TRIALS = 20000
+
+
+def _inclusion(draw, n):
+    counts = np.zeros(n)
+    for _ in range(TRIALS):
+        counts[draw()] += 1
+    return counts / TRIALS
+
+
+@pytest.mark.parametrize("weights,k", [
+    ([1.0, 2.0, 3.0, 4.0], 2),
+    ([5.0, 1.0, 1.0, 0.5, 0.5, 2.0], 3),
+    ([1.0, 1.0, 8.0], 1),
+])
+def test_inclusion_matches_choice_without_replacement(weights, k):
+    weights = np.asarray(weights)
+    n = len(weights)
+    offsets = segment_offsets([n])
+    rng = np.random.default_rng(0)
+    ref_rng = np.random.RandomState(1)
+    ours = _inclusion(lambda: weighted_topk_segments(weights, offsets, np.array([k]), rng=rng), n)
+    ref = _inclusion(lambda: ref_rng.choice(n, k, replace=False, p=weights / weights.sum()), n)
+    np.testing.assert_allclose(ours, ref, atol=0.02)
+
+
+def test_first_draw_matches_weights():
+    weights = np.array([1.0, 2.0, 3.0, 4.0])
+    rng = np.random.default_rng(0)
+    offsets = segment_offsets([4])
+    first = np.bincount([weighted_topk_segments(weights, offsets, np.array([2]), rng=rng)[0]
+                         for _ in range(TRIALS)], minlength=4) / TRIALS
+    np.testing.assert_allclose(first, weights / weights.sum(), atol=0.02)
+
+
+def test_segments_are_independent_and_grouped():
+    lengths = [3, 0, 4, 2]
+    offsets = segment_offsets(lengths)
+    picked = weighted_topk_segments(np.ones(9), offsets, np.array([2, 1, 3, 2]), rng=np.random.default_rng(3))
+    segment = np.repeat(np.arange(len(lengths)), lengths)[picked]
+    assert list(segment) == [0, 0, 2, 2, 2, 3, 3]
+    assert len(set(picked.tolist())) == len(picked)
+
+
+def test_empty_segments_and_empty_input():
+    assert segment_offsets([]).tolist() == [0]
+    assert weighted_topk_segments(np.zeros(0), segment_offsets([0, 0]), np.array([1, 2])).size == 0
+    offsets = segment_offsets([0, 2, 0])
+    picked = weighted_topk_segments(np.ones(2), offsets, np.array([1, 1, 1]), rng=np.random.default_rng(0))
+    assert len(picked) == 1 and picked[0] in (0, 1)
+
+
+def test_k_is_clipped_to_segment_length():
+    offsets = segment_offsets([2, 3])
+    picked = weighted_topk_segments(np.ones(5), offsets, np.array([5, 10]), rng=np.random.default_rng(0))
+    assert sorted(picked[:2].tolist()) == [0, 1]
+    assert sorted(picked[2:].tolist()) == [2, 3, 4]
+
+
+def test_zero_weights_are_drawn_last():
+    offsets = segment_offsets([4])
+    picked = weighted_topk_segments(np.array([0.0, 1.0, 0.0, 2.0]), offsets, np.array([2]),
+                                    rng=np.random.default_rng(0))
+    assert sorted(picked.tolist()) == [1, 3]
+
+
+def test_deterministic_under_seed():
+    weights = np.random.default_rng(7).random(50) + 0.1
+    offsets = segment_offsets([10, 15, 25])
+    k = np.array([3, 5, 7])
+    a = weighted_topk_segments(weights, offsets, k, rng=np.random.default_rng(42))
+    b = weighted_topk_segments(weights, offsets, k, rng=np.random.default_rng(42))
+    np.testing.assert_array_equal(a, b)
+
+    np.random.seed(42)
+    c = weighted_topk_segments(weights, offsets, k)
+    np.random.seed(42)
+    d = weighted_topk_segments(weights, offsets, k)
+    np.testing.assert_array_equal(c, d)